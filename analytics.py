@@ -0,0 +1,247 @@
+"""
+Turn statistics of the members and a repair of the cycle history, computed in the database.
+
+Usage:
+    python -m analytics [--duty coffee] [--office nyc] [--idle-days 180] [--test-mode]
+    python -m analytics --backfill-cycles [--dry-run] [--test-mode]
+
+The statistics list the number of turns, the last turn and the average and longest gap between turns of every
+active member, longest idle first, from a window function over duty_assignments. The backfill recomputes the
+cycle of every assignment from the order of the history, with the rule of the random strategy: a new cycle starts
+when a member gets a second turn in the current one. The history doesn't record who was eligible, so a cycle in
+which the stride strategy gave a member a second turn before everyone had one is split at that turn.
+"""
+
+import argparse
+import datetime
+import logging
+from typing import Any
+
+from sqlalchemy import ColumnElement, case, exists, func, or_, select, true, tuple_, update
+from sqlalchemy.orm import aliased
+
+from database import DutyAssignmentTable, DutyCycleTable, MemberTable, get_db_session, get_repository, utcnow
+from duties import get_duty_registry
+from models import CycleBackfillResult, MemberStats
+
+logger = logging.getLogger(__name__)
+
+
+def _days_between(dialect: str, later: Any, earlier: Any) -> ColumnElement[Any]:
+    """
+    Days between two timestamps, as a fraction.
+    """
+    if dialect == "postgresql":
+        return func.extract("epoch", later - earlier) / 86400
+    return func.julianday(later) - func.julianday(earlier)
+
+
+def get_member_stats(
+    duty_type: str | None = None, office: str | None = None, idle_days: float | None = None, test_mode: bool = False
+) -> list[MemberStats]:
+    """
+    Turns of every active member (of a duty type, in an office), longest idle first. With `idle_days` only the
+    members without a turn in that many days are listed.
+    """
+    with get_db_session(test_mode) as session:
+        dialect = session.get_bind().dialect.name
+        previous = func.lag(DutyAssignmentTable.assigned_at).over(
+            partition_by=DutyAssignmentTable.member_id,
+            order_by=(DutyAssignmentTable.assigned_at, DutyAssignmentTable.id),
+        )
+        turns = select(
+            DutyAssignmentTable.member_id,
+            DutyAssignmentTable.assigned_at,
+            _days_between(dialect, DutyAssignmentTable.assigned_at, previous).label("gap_days"),
+        ).where(DutyAssignmentTable.assigned_at.is_not(None))
+        if duty_type is not None:
+            turns = turns.where(DutyAssignmentTable.duty_type == duty_type)
+        gaps = turns.subquery("turns")
+
+        last_assigned_at = func.max(gaps.c.assigned_at)
+        query = (
+            select(
+                MemberTable.id,
+                MemberTable.username,
+                MemberTable.office,
+                func.count(gaps.c.assigned_at),
+                last_assigned_at,
+                func.avg(gaps.c.gap_days),
+                func.max(gaps.c.gap_days),
+            )
+            .outerjoin(gaps, gaps.c.member_id == MemberTable.id)
+            .where(MemberTable.active == true())
+            .group_by(MemberTable.id, MemberTable.username, MemberTable.office)
+            .order_by(last_assigned_at.asc().nulls_first(), MemberTable.id)
+        )
+        if office is not None:
+            query = query.where(MemberTable.office == office)
+        if idle_days is not None:
+            idle_since = utcnow() - datetime.timedelta(days=idle_days)
+            query = query.having(or_(last_assigned_at.is_(None), last_assigned_at < idle_since))
+
+        return [
+            MemberStats(
+                member_id=member_id,
+                username=username,
+                office=member_office,
+                turns=turns_count,
+                last_assigned_at=last,
+                # Postgres averages numerics as Decimal
+                average_gap_days=float(average) if average is not None else None,
+                longest_gap_days=float(longest) if longest is not None else None,
+            )
+            for member_id, username, member_office, turns_count, last, average, longest in session.execute(query)
+        ]
+
+
+def _cycle_update() -> Any:
+    """
+    A single UPDATE that sets the recomputed cycle of every assignment whose cycle differs.
+
+    The cycle starts are found with a recursive query that jumps from one start to the next: the first assignment
+    after it whose member already had a turn since that start, which the indexes find within about one cycle of
+    rows. Every assignment then gets the number of starts up to it, as a running sum over the history.
+    """
+    # The queries are nested in the UPDATE, so it starts with UPDATE: the SQLite driver only opens a transaction and
+    # reports the rowcount for statements that do
+    ordered = (
+        select(
+            DutyAssignmentTable.id,
+            DutyAssignmentTable.office,
+            DutyAssignmentTable.duty_type,
+            DutyAssignmentTable.assigned_at,
+            func.row_number()
+            .over(
+                partition_by=(DutyAssignmentTable.office, DutyAssignmentTable.duty_type),
+                order_by=(DutyAssignmentTable.assigned_at, DutyAssignmentTable.id),
+            )
+            .label("position"),
+        )
+        .where(DutyAssignmentTable.assigned_at.is_not(None))
+        .cte("ordered", nesting=True)
+    )
+
+    starts = (
+        select(ordered.c.office, ordered.c.duty_type, ordered.c.id, ordered.c.assigned_at)
+        .where(ordered.c.position == 1)
+        .cte("cycle_starts", recursive=True, nesting=True)
+    )
+    candidate = aliased(DutyAssignmentTable)
+    repeat = aliased(DutyAssignmentTable)
+    start_position = tuple_(starts.c.assigned_at, starts.c.id)
+    candidate_position = tuple_(candidate.assigned_at, candidate.id)
+    next_start = (
+        select(candidate.id)
+        .where(
+            candidate.office == starts.c.office,
+            candidate.duty_type == starts.c.duty_type,
+            candidate_position > start_position,
+            exists()
+            .where(
+                repeat.office == candidate.office,
+                repeat.duty_type == candidate.duty_type,
+                repeat.member_id == candidate.member_id,
+                tuple_(repeat.assigned_at, repeat.id) >= start_position,
+                tuple_(repeat.assigned_at, repeat.id) < candidate_position,
+            )
+            .correlate_except(repeat),
+        )
+        .order_by(candidate.assigned_at, candidate.id)
+        .limit(1)
+        .scalar_subquery()
+    )
+    following = aliased(DutyAssignmentTable)
+    starts = starts.union_all(
+        select(following.office, following.duty_type, following.id, following.assigned_at)
+        .select_from(starts)
+        .join(following, following.id == next_start)
+    )
+
+    cycles = (
+        select(
+            ordered.c.id,
+            # Cycles are numbered from 0, like the pointer that cycle_query falls back to
+            (
+                func.sum(case((starts.c.id.is_not(None), 1), else_=0)).over(
+                    partition_by=(ordered.c.office, ordered.c.duty_type), order_by=ordered.c.position
+                )
+                - 1
+            ).label("cycle_id"),
+        )
+        .select_from(ordered.outerjoin(starts, starts.c.id == ordered.c.id))
+        .subquery("cycles")
+    )
+    return (
+        update(DutyAssignmentTable)
+        .where(DutyAssignmentTable.id == cycles.c.id, DutyAssignmentTable.cycle_id != cycles.c.cycle_id)
+        .values(cycle_id=cycles.c.cycle_id)
+        .execution_options(synchronize_session=False)
+    )
+
+
+def backfill_cycles(test_mode: bool = False, dry_run: bool = False) -> CycleBackfillResult:
+    """
+    Recompute the cycle of every assignment (with assigned_at) in one statement, and point the current cycle of
+    every office and duty type at its last one. Assignments are blocked in the meantime. A dry run reports the
+    changes and rolls them back.
+    """
+    repository = get_repository(test_mode)
+    result = CycleBackfillResult(dry_run=dry_run)
+
+    with repository.session() as session:
+        for duty_type in get_duty_registry():
+            repository.lock_duty_type(session, duty_type)
+
+        result.changed = session.execute(_cycle_update()).rowcount
+        result.assignments = session.execute(
+            select(func.count()).where(DutyAssignmentTable.assigned_at.is_not(None))
+        ).scalar_one()
+
+        last_cycles = session.execute(
+            select(
+                DutyAssignmentTable.office, DutyAssignmentTable.duty_type, func.max(DutyAssignmentTable.cycle_id)
+            ).group_by(DutyAssignmentTable.office, DutyAssignmentTable.duty_type)
+        ).all()
+        for office, duty_type, cycle_id in last_cycles:
+            pointer = (DutyCycleTable.office == office, DutyCycleTable.duty_type == duty_type)
+            # The new row version tells the history caches of all instances that the cycles changed
+            values = {"cycle_id": cycle_id, "row_version": DutyCycleTable.row_version + 1}
+            if session.execute(update(DutyCycleTable).where(*pointer).values(values)).rowcount == 0:
+                session.add(DutyCycleTable(office=office, duty_type=duty_type, cycle_id=cycle_id, row_version=1))
+            result.cycles += cycle_id + 1
+
+        if dry_run:
+            session.rollback()
+
+    logger.info(f"Backfilled the assignment cycles: {result}")
+    return result
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--duty", help="only the turns of this duty type")
+    parser.add_argument("--office", help="only the members of this office")
+    parser.add_argument("--idle-days", type=float, help="only members without a turn in this many days")
+    parser.add_argument("--backfill-cycles", action="store_true", help="recompute the cycle of every assignment")
+    parser.add_argument("--dry-run", action="store_true", help="report the backfill without applying it")
+    parser.add_argument("--test-mode", action="store_true", help="use the dev database")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    if args.backfill_cycles:
+        backfill = backfill_cycles(test_mode=args.test_mode, dry_run=args.dry_run)
+        prefix = "Would have changed" if backfill.dry_run else "Changed"
+        print(f"{prefix} the cycle of {backfill.changed} of {backfill.assignments} assignments")
+        return
+
+    print(f"{'member':<30} {'office':<12} {'turns':>6}  {'last turn':<10}  {'avg gap':>8}  {'max gap':>8}")
+    for stats in get_member_stats(args.duty, args.office, args.idle_days, test_mode=args.test_mode):
+        last = stats.last_assigned_at.date().isoformat() if stats.last_assigned_at is not None else "never"
+        average = f"{stats.average_gap_days:.1f}" if stats.average_gap_days is not None else "-"
+        longest = f"{stats.longest_gap_days:.1f}" if stats.longest_gap_days is not None else "-"
+        print(f"{stats.username:<30} {stats.office:<12} {stats.turns:>6}  {last:<10}  {average:>8}  {longest:>8}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,554 @@
+import asyncio
+import concurrent.futures
+import contextvars
+import dataclasses
+import datetime
+import logging
+import os
+import threading
+from collections.abc import Callable, Coroutine
+from typing import Any, NamedTuple
+
+import httpx
+from sqlalchemy import insert, select, update
+from sqlalchemy.engine import URL
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.sql import func
+
+from database import (
+    DB_MAX_OVERFLOW,
+    DB_POOL_PRE_PING,
+    DB_POOL_RECYCLE,
+    DB_POOL_SIZE,
+    DB_POOL_TIMEOUT,
+    MEMBER_COLUMNS,
+    DutyAssignmentTable,
+    DutyCycleTable,
+    MemberTable,
+    NotificationOutboxTable,
+    already_assigned_result,
+    cycle_query,
+    get_repository,
+    is_auth_error,
+    member_from_row,
+    refresh_database_credentials,
+    roster_version_query,
+    select_in_cycle,
+    utcnow,
+)
+from duties import DEFAULT_OFFICE
+from mattermost import (
+    MATTERMOST_BURST_PER_DESTINATION,
+    MATTERMOST_MAX_WORKERS,
+    MATTERMOST_RATE_PER_DESTINATION,
+    MATTERMOST_WEBHOOK_URL,
+    RateLimiter,
+    parse_retry_after,
+)
+from models import AssignmentResult, DrainResult, OfficeMember, WebhookDelivery
+from outbox import get_delivery_update, start_background_delivery
+from roster import RosterCache, RosterVersion
+from scheduling import charged_credit
+from timing import span
+
+logger = logging.getLogger(__name__)
+
+# Drains leave a notification that the pipeline is delivering alone for this long, in case the instance dies first
+ASYNC_DELIVERY_LEASE_SECONDS = float(os.environ.get("ASYNC_DELIVERY_LEASE_SECONDS", "60"))
+
+_loop: asyncio.AbstractEventLoop | None = None
+_loop_lock = threading.Lock()
+
+# One repository per database (prod/dev) and one Mattermost client, only used on the event loop
+_repositories: dict[bool, "AsyncRepository"] = {}
+_client: "AsyncMattermostClient | None" = None
+
+
+def get_event_loop() -> asyncio.AbstractEventLoop:
+    """
+    Gets the event loop of this instance, running in a background thread and creating it on first use.
+    Pooled connections are bound to the loop they were opened on, so all requests share this one.
+    """
+    global _loop
+
+    if _loop is None:
+        with _loop_lock:
+            if _loop is None:
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, name="async-pipeline", daemon=True).start()
+                _loop = loop
+
+    return _loop
+
+
+def run(coroutine: Coroutine[Any, Any, Any]) -> Any:
+    """
+    Run a coroutine on the event loop of this instance and wait for its result. The coroutine runs in the context
+    of the caller, so its spans are part of the request's trace.
+    """
+    context = contextvars.copy_context()
+    result: concurrent.futures.Future[Any] = concurrent.futures.Future()
+
+    def done(task: "asyncio.Task[Any]") -> None:
+        if task.cancelled():
+            result.cancel()
+        elif task.exception() is not None:
+            result.set_exception(task.exception())  # type: ignore[arg-type]
+        else:
+            result.set_result(task.result())
+
+    def start() -> None:
+        get_event_loop().create_task(coroutine, context=context).add_done_callback(done)
+
+    get_event_loop().call_soon_threadsafe(start)
+    return result.result()
+
+
+def get_async_database_url(test_mode: bool = False) -> URL:
+    """
+    URL of the database of the synchronous repository, for the async driver of its dialect.
+    """
+    url = get_repository(test_mode).engine.url
+    if url.get_backend_name() == "sqlite":
+        if url.database in (None, "", ":memory:"):
+            raise ValueError("The async pipeline can't share an in-memory database, use a SQLite file")
+        return url.set(drivername="sqlite+aiosqlite")
+
+    # asyncpg takes ssl instead of libpq's sslmode, and doesn't support channel_binding
+    sslmode = url.query.get("sslmode")
+    url = url.set(drivername="postgresql+asyncpg").difference_update_query(["sslmode", "channel_binding"])
+    if isinstance(sslmode, str):
+        url = url.update_query_dict({"ssl": sslmode})
+    return url
+
+
+class PendingDelivery(NamedTuple):
+    """
+    The outbox row of a notification that the pipeline delivers itself, with the payload stored in it.
+    """
+
+    outbox_id: int
+    payload: dict[str, str]
+
+
+class AsyncRepository:
+    """
+    The assignment flow on an async engine (asyncpg or aiosqlite), on the same database as the synchronous
+    repository of its mode. Every session is a separate connection, so independent reads can run concurrently.
+    """
+
+    def __init__(self, engine: AsyncEngine, test_mode: bool) -> None:
+        self.engine = engine
+        self.test_mode = test_mode
+        self.session_factory = async_sessionmaker(engine, expire_on_commit=False)
+        self.roster_cache = RosterCache()
+
+    async def dispose(self) -> None:
+        await self.engine.dispose()
+
+    async def lock_duty_type(self, session: AsyncSession, duty_type: str) -> None:
+        """
+        Serialise assignments of the same duty type until the end of the transaction, like the synchronous
+        repositories do, so both can assign the same duties.
+        """
+        if self.engine.dialect.name == "postgresql":
+            await session.execute(select(func.pg_advisory_xact_lock(func.hashtext(f"duty:{duty_type}"))))
+        else:
+            await session.execute(
+                update(DutyCycleTable)
+                .where(DutyCycleTable.duty_type == duty_type)
+                .values(cycle_id=DutyCycleTable.cycle_id)
+            )
+
+    async def get_roster(self, coffee_drinkers_only: bool, office: str) -> tuple[RosterVersion, list[OfficeMember]]:
+        """
+        The roster version and the active members of an office, on a connection of its own and from the cache if
+        this instance already read that version.
+        """
+        async with self.session_factory() as session:
+            version = RosterVersion(*(await session.execute(roster_version_query())).one())
+            members = self.roster_cache.get(version, coffee_drinkers_only)
+            if members is None:
+                with span("database.roster_query"):
+                    rows = await session.execute(select(*MEMBER_COLUMNS).where(MemberTable.active == True))
+                    roster = [member_from_row(row) for row in rows]
+                self.roster_cache.store(version, roster)
+                members = [member for member in roster if member.coffee_drinker or not coffee_drinkers_only]
+
+        return version, [member for member in members if member.office == office]
+
+    async def get_member(self, session: AsyncSession, member_id: int, members: list[OfficeMember]) -> OfficeMember:
+        for member in members:
+            if member.id == member_id:
+                return member
+
+        row = (await session.execute(select(*MEMBER_COLUMNS).where(MemberTable.id == member_id))).one()
+        return member_from_row(row)
+
+    async def get_period_assignment(self, duty_type: str, period_key: str, office: str) -> AssignmentResult | None:
+        """
+        The assignment recorded for a duty period, or None if the duty wasn't assigned for it yet.
+        """
+        async with self.session_factory() as session:
+            row = (
+                await session.execute(
+                    select(DutyAssignmentTable.member_id, DutyAssignmentTable.cycle_id).where(
+                        DutyAssignmentTable.office == office,
+                        DutyAssignmentTable.duty_type == duty_type,
+                        DutyAssignmentTable.period_key == period_key,
+                    )
+                )
+            ).one_or_none()
+            if row is None:
+                return None
+            member = await self.get_member(session, row.member_id, [])
+            return already_assigned_result(duty_type, period_key, member, row.cycle_id)
+
+    async def _lock_and_read_cycle(
+        self, session: AsyncSession, duty_type: str, office: str, period_key: str | None
+    ) -> list[Any]:
+        with span("database.lock"):
+            await self.lock_duty_type(session, duty_type)
+        with span("database.cycle_query"):
+            return list((await session.execute(cycle_query(duty_type, office, period_key))).all())
+
+    async def assign_next_member(
+        self,
+        duty_type: str,
+        select_member: Callable[[list[OfficeMember], set[int]], OfficeMember | None],
+        coffee_drinkers_only: bool = False,
+        notification: Callable[[OfficeMember], dict[str, str]] | None = None,
+        period_key: str | None = None,
+        office: str = DEFAULT_OFFICE,
+    ) -> tuple[AssignmentResult, PendingDelivery | None]:
+        """
+        Select and record the next member of an office for a duty in a single transaction, like
+        SqlRepository.assign_next_member, while the roster is read on a second connection. Returns the result and
+        the outbox row of the notification with its stored payload, which drains leave alone for
+        ASYNC_DELIVERY_LEASE_SECONDS.
+        """
+        async with self.session_factory() as session:
+            rows, (version, members) = await asyncio.gather(
+                self._lock_and_read_cycle(session, duty_type, office, period_key),
+                self.get_roster(coffee_drinkers_only, office),
+            )
+
+            cycle_id = rows[0].cycle_id
+            if rows[0].existing_member_id is not None:
+                member = await self.get_member(session, rows[0].existing_member_id, members)
+                return already_assigned_result(duty_type, period_key, member, rows[0].existing_cycle_id), None
+
+            if not members:
+                return AssignmentResult(success=False, message=f"No members eligible for {duty_type} duty"), None
+
+            assigned_member_ids = {row.member_id for row in rows if row.member_id is not None}
+            with span("database.select_member"):
+                selected_member, cycle_id = select_in_cycle(
+                    duty_type, select_member, members, assigned_member_ids, cycle_id
+                )
+
+            if selected_member is None:
+                return AssignmentResult(
+                    success=False, message=f"No users available for {duty_type} duty after cycle reset"
+                ), None
+
+            with span("database.insert"):
+                if rows[0].is_first:
+                    await session.execute(
+                        insert(DutyCycleTable).values(office=office, duty_type=duty_type, cycle_id=cycle_id)
+                    )
+                elif cycle_id != rows[0].cycle_id:
+                    await session.execute(
+                        update(DutyCycleTable)
+                        .where(DutyCycleTable.office == office, DutyCycleTable.duty_type == duty_type)
+                        .values(cycle_id=cycle_id)
+                    )
+
+                assignment_id = (
+                    await session.execute(
+                        insert(DutyAssignmentTable)
+                        .values(
+                            member_id=selected_member.id,
+                            duty_type=duty_type,
+                            cycle_id=cycle_id,
+                            period_key=period_key,
+                            office=office,
+                        )
+                        .returning(DutyAssignmentTable.id)
+                    )
+                ).scalar_one()
+                duty_credit = charged_credit(selected_member, members)
+                await session.execute(
+                    update(MemberTable)
+                    .where(MemberTable.id == selected_member.id)
+                    .values(duty_credit=duty_credit, row_version=MemberTable.row_version + 1)
+                )
+
+                pending = None
+                if notification is not None:
+                    payload = notification(selected_member)
+                    lease = datetime.timedelta(seconds=ASYNC_DELIVERY_LEASE_SECONDS)
+                    outbox_id = (
+                        await session.execute(
+                            insert(NotificationOutboxTable)
+                            .values(
+                                dedupe_key=f"assignment:{assignment_id}",
+                                payload=payload,
+                                next_attempt_at=utcnow() + lease,
+                            )
+                            .returning(NotificationOutboxTable.id)
+                        )
+                    ).scalar_one()
+                    pending = PendingDelivery(outbox_id, payload)
+
+            with span("database.commit"):
+                await session.commit()
+
+        # If the transaction had failed, the cached version wouldn't match and the roster would be read again
+        self.roster_cache.update_member(version, dataclasses.replace(selected_member, duty_credit=duty_credit))
+        logger.info(
+            f"Recorded {duty_type} assignment for {selected_member.username} (ID: {selected_member.id}) "
+            f"in cycle {cycle_id}"
+        )
+        return AssignmentResult(
+            success=True,
+            message=f"Successfully assigned {duty_type} duty to {selected_member.username}",
+            member=selected_member,
+            cycle_id=cycle_id,
+            period_key=period_key,
+        ), pending
+
+    async def record_delivery(self, outbox_id: int, delivery: WebhookDelivery) -> None:
+        """
+        Mark a notification of the pipeline as sent, or hand it to the drains with a backoff if it failed.
+        """
+        async with self.session_factory.begin() as session:
+            dedupe_key = (
+                await session.execute(
+                    select(NotificationOutboxTable.dedupe_key).where(NotificationOutboxTable.id == outbox_id)
+                )
+            ).scalar_one()
+            await session.execute(
+                update(NotificationOutboxTable)
+                .where(NotificationOutboxTable.id == outbox_id)
+                .values(**get_delivery_update(dedupe_key, 1, delivery, DrainResult()))
+            )
+
+
+async def get_async_repository(test_mode: bool = False) -> AsyncRepository:
+    """
+    Get the async repository of the prod or dev database, creating it on first use. The connection string is
+    read (from Secret Manager, on a cold start) in a worker thread, so the loop keeps serving other requests.
+    """
+    repository = _repositories.get(test_mode)
+    if repository is None:
+        url = await asyncio.to_thread(get_async_database_url, test_mode)
+        with span("database.create_engine"):
+            if url.get_backend_name() == "sqlite":
+                engine = create_async_engine(url)
+            else:
+                engine = create_async_engine(
+                    url,
+                    pool_size=DB_POOL_SIZE,
+                    max_overflow=DB_MAX_OVERFLOW,
+                    pool_timeout=DB_POOL_TIMEOUT,
+                    pool_recycle=DB_POOL_RECYCLE,
+                    pool_pre_ping=DB_POOL_PRE_PING,
+                )
+        if test_mode in _repositories:
+            # Another request created the repository while the URL was being read
+            await engine.dispose()
+        else:
+            _repositories[test_mode] = AsyncRepository(engine, test_mode)
+            logger.info(f"Created async {url.get_backend_name()} repository ({'dev' if test_mode else 'prod'})")
+        repository = _repositories[test_mode]
+
+    return repository
+
+
+class AsyncMattermostClient:
+    """
+    Async counterpart of MattermostClient on httpx, which keeps connections alive between messages and rate
+    limits every destination in the same way.
+    """
+
+    def __init__(
+        self,
+        webhook_url: str | None = None,
+        max_connections: int = MATTERMOST_MAX_WORKERS,
+        rate_per_destination: float = MATTERMOST_RATE_PER_DESTINATION,
+        burst_per_destination: int = MATTERMOST_BURST_PER_DESTINATION,
+        timeout: float = 10,
+    ) -> None:
+        self._webhook_url = webhook_url
+        self._rate_limiter = RateLimiter(rate_per_destination, burst_per_destination)
+        self.client = httpx.AsyncClient(
+            timeout=timeout,
+            limits=httpx.Limits(max_connections=max_connections),
+            headers={"Content-Type": "application/json"},
+        )
+
+    @property
+    def webhook_url(self) -> str | None:
+        return self._webhook_url or MATTERMOST_WEBHOOK_URL
+
+    async def post(self, payload: dict[str, str]) -> WebhookDelivery:
+        """
+        Posts a single payload, waiting for a rate limit slot of its destination first.
+        """
+        destination = payload.get("channel", "")
+        webhook_url = self.webhook_url
+        if not webhook_url:
+            return WebhookDelivery(
+                success=False, destination=destination, error="Mattermost Webhook URL is not configured."
+            )
+
+        with span("mattermost.rate_limit"):
+            wait = self._rate_limiter.reserve(destination)
+            if wait:
+                await asyncio.sleep(wait)
+
+        try:
+            with span("mattermost.post"):
+                response = await self.client.post(webhook_url, json=payload)
+        except httpx.HTTPError as e:
+            return WebhookDelivery(success=False, destination=destination, error=str(e))
+
+        if response.status_code == 429:
+            return WebhookDelivery(
+                success=False,
+                destination=destination,
+                status_code=response.status_code,
+                retry_after=parse_retry_after(response.headers.get("Retry-After")),
+                error="Rate limited by Mattermost",
+            )
+
+        if response.is_error:
+            return WebhookDelivery(
+                success=False,
+                destination=destination,
+                status_code=response.status_code,
+                error=f"{response.status_code} error from Mattermost: {response.text}",
+            )
+
+        return WebhookDelivery(success=True, destination=destination, status_code=response.status_code)
+
+    async def close(self) -> None:
+        await self.client.aclose()
+
+
+def get_async_mattermost_client() -> AsyncMattermostClient:
+    """
+    Gets the async Mattermost client shared by this instance, creating it on first use.
+    """
+    global _client
+
+    if _client is None:
+        _client = AsyncMattermostClient()
+
+    return _client
+
+
+# Bookkeeping that outlives the request that started it, referenced so the tasks aren't garbage collected
+_background_tasks: set["asyncio.Task[None]"] = set()
+
+
+async def _record_delivery(repository: AsyncRepository, outbox_id: int, delivery: WebhookDelivery) -> None:
+    try:
+        await repository.record_delivery(outbox_id, delivery)
+    except Exception as e:
+        # The lease runs out and a drain delivers the notification again
+        logger.error(f"Failed to record delivery of notification {outbox_id}: {e}")
+        return
+
+    if not delivery.success:
+        start_background_delivery(repository.test_mode)
+
+
+async def assign_next_member_async(
+    duty_type: str,
+    select_member: Callable[[list[OfficeMember], set[int]], OfficeMember | None],
+    coffee_drinkers_only: bool = False,
+    notification: Callable[[OfficeMember], dict[str, str]] | None = None,
+    period_key: str | None = None,
+    office: str = DEFAULT_OFFICE,
+    test_mode: bool = False,
+) -> AssignmentResult:
+    """
+    Assign the next member like database.assign_next_member, and deliver the notification right away.
+    Independent steps overlap: the roster is read while the transaction takes the duty lock and reads the cycle,
+    and the outbox row is updated with the outcome of the delivery after the result is returned. A notification
+    that couldn't be delivered is retried by the outbox, and `delivery` of the result tells how it went.
+    """
+    try:
+        repository = await get_async_repository(test_mode)
+        result, pending = await repository.assign_next_member(
+            duty_type, select_member, coffee_drinkers_only, notification, period_key, office
+        )
+    except Exception as e:
+        if isinstance(e, IntegrityError) and period_key is not None:
+            # Another instance recorded an assignment for the period first
+            existing = await repository.get_period_assignment(duty_type, period_key, office)
+            if existing is not None:
+                return existing
+        if is_auth_error(e):
+            # The connection string was probably rotated, make sure the next attempt picks up the new one
+            await asyncio.to_thread(refresh_database_credentials, test_mode)
+            stale = _repositories.pop(test_mode, None)
+            if stale is not None:
+                await stale.dispose()
+        logger.error(f"Failed to assign {duty_type} duty: {e}")
+        return AssignmentResult(success=False, message=f"Failed to assign {duty_type} duty: {str(e)}")
+
+    if pending is None:
+        return result
+
+    # The exact payload of the outbox row, so a retry by a drain posts the same message
+    delivery = await get_async_mattermost_client().post(pending.payload)
+    task = asyncio.create_task(_record_delivery(repository, pending.outbox_id, delivery))
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+
+    return result.model_copy(update={"delivery": delivery})
+
+
+def assign_next_member(
+    duty_type: str,
+    select_member: Callable[[list[OfficeMember], set[int]], OfficeMember | None],
+    coffee_drinkers_only: bool = False,
+    notification: Callable[[OfficeMember], dict[str, str]] | None = None,
+    period_key: str | None = None,
+    office: str = DEFAULT_OFFICE,
+    test_mode: bool = False,
+) -> AssignmentResult:
+    """
+    Synchronous entry point of the pipeline for the Flask handlers, see assign_next_member_async.
+    """
+    result: AssignmentResult = run(
+        assign_next_member_async(
+            duty_type, select_member, coffee_drinkers_only, notification, period_key, office, test_mode
+        )
+    )
+    return result
+
+
+async def _dispose() -> None:
+    global _client
+
+    await asyncio.gather(*_background_tasks)
+    for repository in _repositories.values():
+        await repository.dispose()
+    _repositories.clear()
+    if _client is not None:
+        await _client.close()
+        _client = None
+
+
+def dispose() -> None:
+    """
+    Wait for pending bookkeeping, then close the pooled connections and the Mattermost client, e.g. after the
+    connection string changed.
+    """
+    if _loop is not None:
+        run(_dispose())
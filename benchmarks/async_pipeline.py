@@ -0,0 +1,150 @@
+"""
+Compare the wall-clock time of an assignment until its notification is delivered, synchronously and with the
+async pipeline.
+
+Usage:
+    python -m benchmarks.async_pipeline [--database-url URL] [--rounds N] [--db-latency SECONDS]
+                                        [--webhook-latency SECONDS] [--history N]
+
+The synchronous flow is database.assign_next_member followed by the outbox drain that start_background_delivery
+runs. The async pipeline reads the roster while it locks the duty and reads the cycle, and posts the webhook
+right after the commit without claiming the outbox row first. Both run against a stub Mattermost server and a
+fake Secret Manager. Without a database URL a temporary SQLite database is used, and every SQL statement waits
+`--db-latency` like a round trip to a remote database would. A Postgres URL must point at a scratch database,
+because the tables are dropped and recreated.
+"""
+
+import argparse
+import functools
+import itertools
+import logging
+import statistics
+import tempfile
+import time
+from collections.abc import Callable
+from pathlib import Path
+from typing import Any
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import Engine
+
+import async_pipeline
+import database
+import google_utils
+import mattermost
+import outbox
+from benchmarks.cycle_lookup import seed_history
+from duties import DutyType
+from main import select_next_member
+from models import AssignmentResult, OfficeMember
+from scheduling import SelectionStrategy
+from tests.stubs import FakeSecretManagerClient, StubMattermostServer
+
+select_member = functools.partial(select_next_member, strategy=SelectionStrategy.STRIDE)
+
+
+def add_statement_latency(engine: Engine, latency: float) -> None:
+    """
+    Delay every statement on new SQLite connections of the engine, in the thread that executes it. Connections
+    of aiosqlite run in a thread each, so concurrent statements on different connections overlap.
+    """
+
+    @event.listens_for(engine, "connect")
+    def on_connect(dbapi_connection: Any, connection_record: Any) -> None:
+        def wait(statement: str) -> None:
+            time.sleep(latency)
+
+        if hasattr(dbapi_connection, "await_"):
+            dbapi_connection.await_(dbapi_connection.driver_connection.set_trace_callback(wait))
+        else:
+            dbapi_connection.set_trace_callback(wait)
+
+
+def notify(member: OfficeMember) -> dict[str, str]:
+    return mattermost.build_mattermost_payload(member.username, DutyType.COFFEE, test_mode=True)
+
+
+def measure(label: str, rounds: int, flow: Callable[[str], AssignmentResult]) -> float:
+    periods = itertools.count()
+    durations = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        result = flow(f"{label}-{next(periods)}")
+        durations.append(time.perf_counter() - start)
+        assert result.success, result.message
+
+    median = statistics.median(durations)
+    p90 = statistics.quantiles(durations, n=10)[-1] if rounds > 1 else median
+    print(f"  {label:<40} p50 {median * 1000:8.1f} ms   p90 {p90 * 1000:8.1f} ms")
+    return median
+
+
+def run(database_url: str, rounds: int, db_latency: float, webhook_latency: float, history: int) -> None:
+    engine = create_engine(database_url)
+    database.Base.metadata.drop_all(engine)
+    database.Base.metadata.create_all(engine)
+    with engine.begin() as connection:
+        seed_history(connection, history)
+    engine.dispose()
+
+    google_utils._client = FakeSecretManagerClient(  # type: ignore[assignment]
+        secrets={database._get_database_secret_name(True): database_url}
+    )
+    with StubMattermostServer(latency=webhook_latency) as stub:
+        # The test channel is the same for every message, so the rate limits are lifted
+        mattermost._client = mattermost.MattermostClient(webhook_url=stub.url, rate_per_destination=0)
+        async_pipeline._client = async_pipeline.AsyncMattermostClient(webhook_url=stub.url, rate_per_destination=0)
+        repository = async_pipeline.run(async_pipeline.get_async_repository(test_mode=True))
+        if db_latency:
+            add_statement_latency(database.get_engine(test_mode=True), db_latency)
+            add_statement_latency(repository.engine.sync_engine, db_latency)
+
+        def synchronous(period_key: str) -> AssignmentResult:
+            result = database.assign_next_member(
+                DutyType.COFFEE, select_member, True, notify, period_key, test_mode=True
+            )
+            outbox.drain_outbox(test_mode=True, time_budget=0)
+            return result
+
+        def pipeline(period_key: str) -> AssignmentResult:
+            return async_pipeline.assign_next_member(
+                DutyType.COFFEE, select_member, True, notify, period_key, test_mode=True
+            )
+
+        print(
+            f"{rounds} assignments on a warm instance ({engine.dialect.name}, {db_latency * 1000:.0f} ms per "
+            f"statement, {webhook_latency * 1000:.0f} ms webhook latency), until the notification is delivered:\n"
+        )
+        # One round each to open the pooled connections and read the roster
+        synchronous("warmup")
+        pipeline("warmup")
+        baseline = measure("assign_next_member + drain_outbox", rounds, synchronous)
+        duration = measure("async_pipeline.assign_next_member", rounds, pipeline)
+        print(f"\n  {(1 - duration / baseline) * 100:.0f}% less wall-clock time with the async pipeline")
+
+        async_pipeline.dispose()
+        database.dispose_engines()
+        google_utils.invalidate_secret()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--database-url", help="SQLAlchemy URL of a scratch database")
+    parser.add_argument("--rounds", type=int, default=50, help="number of assignments per flow")
+    parser.add_argument("--db-latency", type=float, default=0.005, help="delay per SQL statement on SQLite")
+    parser.add_argument("--webhook-latency", type=float, default=0.02, help="latency of the stub server in seconds")
+    parser.add_argument("--history", type=int, default=1000, help="number of assignments in the history")
+    args = parser.parse_args()
+    logging.disable(logging.INFO)
+
+    if args.database_url:
+        run(args.database_url, args.rounds, 0.0, args.webhook_latency, args.history)
+        return
+
+    with tempfile.TemporaryDirectory() as directory:
+        url = f"sqlite:///{Path(directory) / 'async_pipeline.db'}"
+        run(url, args.rounds, args.db_latency, args.webhook_latency, args.history)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+import itertools
+import os
+import statistics
+from collections.abc import Generator
+from pathlib import Path
+
+import pytest
+from _pytest.terminal import TerminalReporter
+from pytest_benchmark.fixture import BenchmarkFixture
+from pytest_mock import MockerFixture
+from sqlalchemy import create_engine
+
+import database
+import google_utils
+import mattermost
+import outbox
+from benchmarks.cycle_lookup import seed_history
+from tests.stubs import FakeSecretManagerClient, StubMattermostServer
+
+# Number of assignments in the history, overridable to keep local runs short, e.g. BENCHMARK_HISTORY_SIZES=100,10000
+HISTORY_SIZES = [
+    int(size) for size in os.environ.get("BENCHMARK_HISTORY_SIZES", "100,10000,100000,1000000").split(",") if size
+]
+# SQLAlchemy URL of a scratch Postgres database, tables are dropped and recreated. SQLite files are used without it.
+BENCHMARK_DATABASE_URL = os.environ.get("BENCHMARK_DATABASE_URL")
+
+# (benchmark name, p50 ms, p99 ms) of every benchmark that ran, reported at the end of the session
+_percentiles: list[tuple[str, float, float]] = []
+_periods = itertools.count()
+
+
+def record_percentiles(benchmark: BenchmarkFixture) -> None:
+    """
+    Add the p50 and p99 latency to the benchmark results. pytest-benchmark only reports the median and extremes,
+    and the JSON output (--benchmark-json, --benchmark-autosave) keeps extra_info for run-to-run comparisons.
+    Nothing is measured with --benchmark-disable, which runs every benchmark once as a test.
+    """
+    if benchmark.stats is None:
+        return
+    data = benchmark.stats.stats.data
+    if len(data) < 2:
+        return
+    cut_points = statistics.quantiles(data, n=100, method="inclusive")
+    p50, p99 = cut_points[49] * 1000, cut_points[98] * 1000
+    benchmark.extra_info.update({"p50_ms": round(p50, 3), "p99_ms": round(p99, 3), "rounds": len(data)})
+    _percentiles.append((benchmark.name, p50, p99))
+
+
+def pytest_terminal_summary(terminalreporter: TerminalReporter) -> None:
+    if not _percentiles:
+        return
+    terminalreporter.section("latency percentiles")
+    width = max(len(name) for name, _, _ in _percentiles)
+    terminalreporter.write_line(f"{'benchmark':<{width}}  {'p50 ms':>10}  {'p99 ms':>10}")
+    for name, p50, p99 in _percentiles:
+        terminalreporter.write_line(f"{name:<{width}}  {p50:>10.3f}  {p99:>10.3f}")
+
+
+@pytest.fixture(scope="session")
+def mattermost_stub() -> Generator[StubMattermostServer, None, None]:
+    with StubMattermostServer() as server:
+        yield server
+
+
+@pytest.fixture(scope="module", params=HISTORY_SIZES, ids=lambda size: f"{size}_rows")
+def history_database(request: pytest.FixtureRequest, tmp_path_factory: pytest.TempPathFactory) -> str:
+    """
+    Database URL of a schema seeded with members and a history of the given number of assignments.
+    """
+    url = BENCHMARK_DATABASE_URL or f"sqlite:///{Path(tmp_path_factory.mktemp('history')) / 'duties.db'}"
+    engine = create_engine(url)
+    database.Base.metadata.drop_all(engine)
+    database.Base.metadata.create_all(engine)
+    with engine.begin() as connection:
+        seed_history(connection, request.param)
+    engine.dispose()
+
+    return url
+
+
+class Instance:
+    """
+    The process-wide state of a function instance, which a cold start has to build up again.
+    """
+
+    def __init__(self, webhook_url: str) -> None:
+        self.webhook_url = webhook_url
+
+    def reset(self) -> None:
+        """
+        Drop the engines, cached secrets and Mattermost connections, like a new instance. Modules stay imported,
+        their cost is measured by benchmarks.import_time.
+        """
+        database.dispose_engines()
+        google_utils.invalidate_secret()
+        # Without a rate limit, every round would otherwise wait for the limit of the test channel
+        mattermost._client = mattermost.MattermostClient(
+            webhook_url=self.webhook_url, rate_per_destination=1e9, burst_per_destination=10**9
+        )
+
+
+@pytest.fixture
+def instance(
+    history_database: str, mattermost_stub: StubMattermostServer, mocker: MockerFixture
+) -> Generator[Instance, None, None]:
+    """
+    A function instance wired to the seeded database, the stub Mattermost server and a fake Secret Manager.
+    """
+    mocker.patch(
+        "google_utils._client",
+        FakeSecretManagerClient(
+            secrets={
+                database._get_database_secret_name(test_mode=True): history_database,
+                database._get_database_secret_name(test_mode=False): history_database,
+            }
+        ),
+    )
+    mocker.patch("mattermost._client")
+    # Every round is a new duty period, a repeated period would only return the assignment already made
+    mocker.patch("duty_calendar.DutyCalendar.period_key", side_effect=lambda date: f"benchmark-{next(_periods)}")
+    # Deliver within the request, so the webhook is part of the latency and no thread outlives a round
+    mocker.patch(
+        "outbox.start_background_delivery",
+        side_effect=lambda test_mode: outbox.drain_outbox(test_mode, time_budget=5),
+    )
+
+    current = Instance(mattermost_stub.url)
+    current.reset()
+    yield current
+    database.dispose_engines()
+    google_utils.invalidate_secret()
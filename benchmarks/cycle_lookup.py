@@ -0,0 +1,142 @@
+"""
+Compare the current-cycle lookup before and after migrations/001_duty_cycles.sql on a large synthetic history.
+
+Usage:
+    python -m benchmarks.cycle_lookup [--database-url URL] [--rows N]
+
+Without a database URL a temporary SQLite database is used. A Postgres URL must point at a scratch database,
+because the tables are dropped and recreated.
+"""
+
+import argparse
+import statistics
+import tempfile
+import time
+from pathlib import Path
+
+from sqlalchemy import Connection, create_engine, insert, text
+
+from database import Base, DutyAssignmentTable, DutyCycleTable, MemberTable
+
+OLD_QUERIES = [
+    "SELECT MAX(cycle_id) FROM duty_assignments WHERE duty_type = :duty_type",
+    "SELECT DISTINCT member_id FROM duty_assignments WHERE duty_type = :duty_type AND cycle_id = :cycle_id",
+]
+
+NEW_QUERIES = [
+    "SELECT cycle_id FROM duty_cycles WHERE duty_type = :duty_type",
+    "SELECT DISTINCT member_id FROM duty_assignments WHERE duty_type = :duty_type AND cycle_id = :cycle_id",
+]
+
+MEMBER_COUNT = 50
+BATCH_SIZE = 50_000
+
+
+def seed_history(connection: Connection, rows: int) -> int:
+    """
+    Insert members and a history of `rows` assignments, alternating between duty types. Returns the last cycle.
+    """
+    connection.execute(insert(MemberTable), [{"id": i, "username": f"member_{i}"} for i in range(1, MEMBER_COUNT + 1)])
+
+    batch = []
+    for i in range(rows):
+        batch.append(
+            {
+                "member_id": (i // 2) % MEMBER_COUNT + 1,
+                "duty_type": "coffee" if i % 2 == 0 else "fridge",
+                "cycle_id": i // (2 * MEMBER_COUNT),
+            }
+        )
+        if len(batch) == BATCH_SIZE:
+            connection.execute(insert(DutyAssignmentTable), batch)
+            batch = []
+    if batch:
+        connection.execute(insert(DutyAssignmentTable), batch)
+
+    last_cycle = (rows - 1) // (2 * MEMBER_COUNT)
+    connection.execute(
+        insert(DutyCycleTable),
+        [{"duty_type": "coffee", "cycle_id": last_cycle}, {"duty_type": "fridge", "cycle_id": last_cycle}],
+    )
+    return last_cycle
+
+
+def explain(connection: Connection, query: str, params: dict[str, object]) -> str:
+    prefix = "EXPLAIN ANALYZE" if connection.dialect.name == "postgresql" else "EXPLAIN QUERY PLAN"
+    rows = connection.execute(text(f"{prefix} {query}"), params).all()
+    return "\n".join("    " + " ".join(str(column) for column in row) for row in rows)
+
+
+def time_queries(connection: Connection, queries: list[str], params: dict[str, object], repeat: int) -> list[float]:
+    durations = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for query in queries:
+            connection.execute(text(query), params).all()
+        durations.append((time.perf_counter() - start) * 1000)
+    return durations
+
+
+def report(label: str, connection: Connection, queries: list[str], params: dict[str, object], repeat: int) -> float:
+    print(f"\n== {label} ==")
+    for query in queries:
+        print(f"  {query}\n{explain(connection, query, params)}")
+
+    durations = time_queries(connection, queries, params, repeat)
+    median = statistics.median(durations)
+    print(f"  median {median:.3f} ms, min {min(durations):.3f} ms, max {max(durations):.3f} ms over {repeat} runs")
+    return median
+
+
+def run(database_url: str, rows: int, repeat: int) -> None:
+    engine = create_engine(database_url)
+    Base.metadata.drop_all(engine)
+    Base.metadata.create_all(engine)
+
+    with engine.begin() as connection:
+        # Start from the schema as it was before the migration
+        connection.execute(text("DROP INDEX ix_duty_assignments_duty_cycle_member"))
+        start = time.perf_counter()
+        last_cycle = seed_history(connection, rows)
+        print(f"Seeded {rows} assignments in {time.perf_counter() - start:.1f} s ({engine.dialect.name})")
+        if engine.dialect.name == "postgresql":
+            connection.execute(text("ANALYZE duty_assignments"))
+
+    params: dict[str, object] = {"duty_type": "coffee", "cycle_id": last_cycle}
+
+    with engine.connect() as connection:
+        old = report("max(cycle_id) + DISTINCT, no index", connection, OLD_QUERIES, params, repeat)
+
+        connection.execute(
+            text(
+                "CREATE INDEX ix_duty_assignments_duty_cycle_member "
+                "ON duty_assignments (duty_type, cycle_id, member_id)"
+            )
+        )
+        if engine.dialect.name == "postgresql":
+            connection.execute(text("ANALYZE duty_assignments"))
+        connection.commit()
+
+        new = report("duty_cycles pointer + indexed DISTINCT", connection, NEW_QUERIES, params, repeat)
+
+    print(f"\nSpeed-up: {old / new:.1f}x")
+    engine.dispose()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--database-url", help="SQLAlchemy URL of a scratch database")
+    parser.add_argument("--rows", type=int, default=500_000, help="number of synthetic assignments")
+    parser.add_argument("--repeat", type=int, default=50, help="number of timed lookups")
+    args = parser.parse_args()
+
+    if args.database_url:
+        run(args.database_url, args.rows, args.repeat)
+        return
+
+    with tempfile.TemporaryDirectory() as directory:
+        run(f"sqlite:///{Path(directory) / 'cycle_lookup.db'}", args.rows, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
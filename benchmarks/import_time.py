@@ -0,0 +1,133 @@
+"""
+Measure the cold-start import cost of every HTTP entry point with `python -X importtime`.
+
+Usage:
+    python -m benchmarks.import_time [--runs N] [--output results.json] [--compare baseline.json]
+
+Every run starts a fresh interpreter that imports `main` and answers a GET health check of one entry point,
+which is the work a cold instance does before it can respond. Results can be saved and compared to an earlier
+run, which fails when an entry point got more than `--tolerance` slower or started loading a heavy dependency.
+"""
+
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+from typing import Any
+
+ENTRY_POINTS = ["assign_coffee_duty", "assign_fridge_duty", "drain_notifications"]
+
+# Dependencies that should only be loaded on code paths that need them
+HEAVY_MODULES = ["sqlalchemy", "pydantic", "google.cloud.secretmanager", "grpc", "requests", "httpx", "asyncpg"]
+
+COLD_START_SCRIPT = """
+import json
+import sys
+
+import main
+from flask import Flask, request
+
+with Flask("import_time").test_request_context(method="GET"):
+    main.{entry_point}(request)
+
+print(json.dumps(sorted(module for module in {heavy_modules} if module in sys.modules)))
+"""
+
+REPOSITORY_ROOT = Path(__file__).resolve().parent.parent
+
+
+def parse_importtime(stderr: str) -> dict[str, int]:
+    """
+    Cumulative import time in microseconds per top-level import.
+    """
+    cumulative: dict[str, int] = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative_us, name = line.split("|")
+        # Nested imports are indented below the import that triggered them
+        if not name[1:].startswith(" "):
+            cumulative[name.strip()] = int(cumulative_us)
+    return cumulative
+
+
+def importtime(script: str) -> tuple[dict[str, int], str, float]:
+    start = time.perf_counter()
+    process = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", script],
+        cwd=REPOSITORY_ROOT,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return parse_importtime(process.stderr), process.stdout, (time.perf_counter() - start) * 1000
+
+
+def measure_entry_point(entry_point: str, interpreter_modules: set[str]) -> tuple[float, float, list[str]]:
+    """
+    Import time of the entry point (ms), wall-clock time of the process (ms) and heavy modules loaded.
+    """
+    script = COLD_START_SCRIPT.format(entry_point=entry_point, heavy_modules=HEAVY_MODULES)
+    imports, stdout, wall_ms = importtime(script)
+
+    import_ms = sum(us for name, us in imports.items() if name not in interpreter_modules) / 1000
+    return import_ms, wall_ms, json.loads(stdout.strip().splitlines()[-1])
+
+
+def run(runs: int) -> dict[str, dict[str, Any]]:
+    # Modules the interpreter imports at startup are not part of the cost of the entry points
+    interpreter_modules = set(importtime("pass")[0])
+
+    results: dict[str, dict[str, Any]] = {}
+    for entry_point in ENTRY_POINTS:
+        samples = [measure_entry_point(entry_point, interpreter_modules) for _ in range(runs)]
+        results[entry_point] = {
+            "import_ms": round(statistics.median(sample[0] for sample in samples), 1),
+            "wall_ms": round(statistics.median(sample[1] for sample in samples), 1),
+            "heavy_modules": samples[-1][2],
+        }
+        print(
+            f"{entry_point:<22} import {results[entry_point]['import_ms']:>8} ms  "
+            f"process {results[entry_point]['wall_ms']:>8} ms  heavy modules: {samples[-1][2] or 'none'}"
+        )
+    return results
+
+
+def compare(results: dict[str, dict[str, Any]], baseline: dict[str, dict[str, Any]], tolerance: float) -> bool:
+    ok = True
+    for entry_point, result in results.items():
+        if entry_point not in baseline:
+            continue
+        previous = baseline[entry_point]["import_ms"]
+        current = result["import_ms"]
+        if current > previous * (1 + tolerance):
+            print(f"REGRESSION {entry_point}: {previous} ms -> {current} ms")
+            ok = False
+        new_modules = set(result["heavy_modules"]) - set(baseline[entry_point]["heavy_modules"])
+        if new_modules:
+            print(f"REGRESSION {entry_point}: now imports {sorted(new_modules)}")
+            ok = False
+    return ok
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5, help="cold starts per entry point, the median is reported")
+    parser.add_argument("--output", type=Path, help="write the results as JSON")
+    parser.add_argument("--compare", type=Path, help="JSON results of an earlier run to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed relative slowdown")
+    args = parser.parse_args()
+
+    results = run(args.runs)
+
+    if args.output:
+        args.output.write_text(json.dumps(results, indent=2))
+    if args.compare and not compare(results, json.loads(args.compare.read_text()), args.tolerance):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,356 @@
+"""
+Fire concurrent triggers at the assignment functions, like overlapping Cloud Scheduler retries and duties that fire
+at the same time, and report the throughput, latency percentiles, duplicate assignments and pool exhaustion.
+
+Usage:
+    python -m benchmarks.load_test [--database-url URL] [--handlers assign_coffee_duty,assign_fridge_duty]
+                                   [--requests N] [--concurrency N] [--retries N] [--server]
+                                   [--pool-size N] [--max-overflow N] [--pool-timeout SECONDS]
+                                   [--webhook-latency SECONDS] [--history N]
+
+The requests are spread over the handlers, and every `--retries` consecutive requests of a handler are triggers of
+the same duty period, so they overlap like retries of one Scheduler job. Each period should get exactly one
+assignment and one notification. The handlers run through the test client of functions_framework, or with
+`--server` behind a local HTTP server, against a stub Mattermost server and a fake Secret Manager. The connection
+pool of every simulated instance has the size of the function (DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_TIMEOUT),
+unless overridden. Without a database URL a temporary SQLite database is used, which has no advisory or row locks
+and takes one writer at a time, so concurrency safety is only measured faithfully on Postgres. A Postgres URL must
+point at a scratch database, because the tables are dropped and recreated.
+"""
+
+import argparse
+import collections
+import logging
+import statistics
+import tempfile
+import threading
+import time
+from collections.abc import Callable, Iterator
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack, contextmanager
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any
+from unittest import mock
+
+import flask
+import requests
+from functions_framework import create_app
+from sqlalchemy import create_engine, func, select
+from werkzeug.serving import make_server
+
+import database
+import google_utils
+import mattermost
+import outbox
+from benchmarks.cycle_lookup import seed_history
+from database import DutyAssignmentTable
+from duty_calendar import DutyCalendar
+from scheduling import DUTY_SELECTION_STRATEGY, SelectionStrategy
+from tests.stubs import FakeSecretManagerClient, StubMattermostServer
+
+HANDLERS = ["assign_coffee_duty", "assign_fridge_duty"]
+SOURCE = str(Path(__file__).resolve().parent.parent / "main.py")
+# Duty period of a request, instead of the one of today, so every run of the harness has new periods
+PERIOD_HEADER = "X-Load-Test-Period"
+PERIOD_PREFIX = "load-"
+
+
+@dataclass
+class Outcome:
+    handler: str
+    status: int
+    latency: float
+    message: str
+
+    @property
+    def pool_exhausted(self) -> bool:
+        # SQLAlchemy's TimeoutError when no connection could be checked out within the pool timeout
+        return self.status >= 500 and "QueuePool limit" in self.message
+
+    @property
+    def already_assigned(self) -> bool:
+        return self.status == 200 and "was already assigned" in self.message
+
+
+@dataclass
+class LoadReport:
+    outcomes: list[Outcome] = field(default_factory=list)
+    duration: float = 0.0
+    periods: int = 0
+    assignments: int = 0
+    # Assignments beyond the first of a duty period
+    duplicate_assignments: int = 0
+    # Members that got a second turn in a cycle, which the random strategy never does
+    repeated_members: int = 0
+    notifications: int = 0
+
+    @property
+    def duplicate_notifications(self) -> int:
+        return max(self.notifications - self.assignments, 0)
+
+
+def _period_key(original: Callable[[DutyCalendar, Any], str]) -> Callable[[DutyCalendar, Any], str]:
+    def period_key(calendar: DutyCalendar, date: Any) -> str:
+        if flask.has_request_context() and PERIOD_HEADER in flask.request.headers:
+            return flask.request.headers[PERIOD_HEADER]
+        return original(calendar, date)
+
+    return period_key
+
+
+class TestClientTarget:
+    """
+    The handlers called through the Flask test client of functions_framework, with a client per thread.
+    """
+
+    def __init__(self, handlers: list[str]) -> None:
+        self._apps = {handler: create_app(target=handler, source=SOURCE) for handler in handlers}
+        self._local = threading.local()
+
+    def post(self, handler: str, period: str) -> tuple[int, str]:
+        clients = self._local.__dict__.setdefault("clients", {})
+        if handler not in clients:
+            clients[handler] = self._apps[handler].test_client()
+        response = clients[handler].post("/", json={"test_mode": True}, headers={PERIOD_HEADER: period})
+        body = response.get_json(silent=True)
+        return response.status_code, body.get("message", "") if isinstance(body, dict) else response.get_data(True)
+
+    def close(self) -> None:
+        pass
+
+
+class ServerTarget:
+    """
+    The handlers served over HTTP by local threaded servers, with a connection pool per thread.
+    """
+
+    def __init__(self, handlers: list[str]) -> None:
+        self._servers = {
+            handler: make_server("127.0.0.1", 0, create_app(target=handler, source=SOURCE), threaded=True)
+            for handler in handlers
+        }
+        for server in self._servers.values():
+            threading.Thread(target=server.serve_forever, daemon=True).start()
+        self._local = threading.local()
+
+    def post(self, handler: str, period: str) -> tuple[int, str]:
+        if not hasattr(self._local, "session"):
+            self._local.session = requests.Session()
+        server = self._servers[handler]
+        response = self._local.session.post(
+            f"http://127.0.0.1:{server.server_port}/", json={"test_mode": True}, headers={PERIOD_HEADER: period}
+        )
+        try:
+            body = response.json()
+        except ValueError:
+            body = None
+        return response.status_code, body.get("message", "") if isinstance(body, dict) else response.text
+
+    def close(self) -> None:
+        for server in self._servers.values():
+            server.shutdown()
+            server.server_close()
+
+
+@contextmanager
+def pool_settings(pool_size: int | None, max_overflow: int | None, pool_timeout: int | None) -> Iterator[None]:
+    """
+    Override the pool settings of the engines created in the meantime.
+    """
+    overrides = {"DB_POOL_SIZE": pool_size, "DB_MAX_OVERFLOW": max_overflow, "DB_POOL_TIMEOUT": pool_timeout}
+    with ExitStack() as stack:
+        for name, value in overrides.items():
+            if value is not None:
+                stack.enter_context(mock.patch.object(database, name, value))
+        yield
+
+
+def count_duplicates(database_url: str, report: LoadReport) -> None:
+    """
+    Count the assignments of the load test, the ones beyond the first of a period, and the members that got a
+    second turn in a cycle.
+    """
+    engine = create_engine(database_url)
+    per_period = (
+        select(func.count().label("assignments"))
+        .where(DutyAssignmentTable.period_key.like(f"{PERIOD_PREFIX}%"))
+        .group_by(DutyAssignmentTable.office, DutyAssignmentTable.duty_type, DutyAssignmentTable.period_key)
+        .subquery()
+    )
+    per_member = (
+        select(func.count().label("turns"))
+        .select_from(DutyAssignmentTable)
+        .group_by(
+            DutyAssignmentTable.office,
+            DutyAssignmentTable.duty_type,
+            DutyAssignmentTable.cycle_id,
+            DutyAssignmentTable.member_id,
+        )
+        .having(func.count() > 1)
+        .subquery()
+    )
+    with engine.connect() as connection:
+        report.assignments, report.duplicate_assignments = connection.execute(
+            select(
+                func.coalesce(func.sum(per_period.c.assignments), 0),
+                func.coalesce(func.sum(per_period.c.assignments - 1), 0),
+            )
+        ).one()
+        report.repeated_members = connection.execute(
+            select(func.coalesce(func.sum(per_member.c.turns - 1), 0))
+        ).scalar_one()
+    engine.dispose()
+
+
+def run(
+    database_url: str,
+    handlers: list[str],
+    requests_count: int,
+    concurrency: int,
+    retries: int,
+    server: bool = False,
+    pool_size: int | None = None,
+    max_overflow: int | None = None,
+    pool_timeout: int | None = None,
+    webhook_latency: float = 0.0,
+    history: int = 1000,
+) -> LoadReport:
+    engine = create_engine(database_url)
+    database.Base.metadata.drop_all(engine)
+    database.Base.metadata.create_all(engine)
+    with engine.begin() as connection:
+        seed_history(connection, history)
+    engine.dispose()
+
+    # Request i goes to handler i % len(handlers), and the retries of a period of a handler are consecutive
+    jobs = [
+        (handlers[i % len(handlers)], f"{PERIOD_PREFIX}{i // len(handlers) // retries}") for i in range(requests_count)
+    ]
+    report = LoadReport(periods=len(set(jobs)))
+
+    google_utils._client = FakeSecretManagerClient(  # type: ignore[assignment]
+        secrets={database._get_database_secret_name(True): database_url}
+    )
+    with (
+        StubMattermostServer(latency=webhook_latency) as stub,
+        pool_settings(pool_size, max_overflow, pool_timeout),
+        mock.patch.object(DutyCalendar, "period_key", _period_key(DutyCalendar.period_key)),
+    ):
+        # The test channel is the same for every message, so the rate limits are lifted
+        mattermost._client = mattermost.MattermostClient(webhook_url=stub.url, rate_per_destination=0)
+        database.dispose_engines()
+        target = TestClientTarget(handlers) if not server else ServerTarget(handlers)
+
+        def fire(job: tuple[str, str]) -> Outcome:
+            handler, period = job
+            start = time.perf_counter()
+            status, message = target.post(handler, period)
+            return Outcome(handler, status, time.perf_counter() - start, message)
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            report.outcomes = list(executor.map(fire, jobs))
+        report.duration = time.perf_counter() - start
+
+        # Wait for the background deliveries, a message they claimed is skipped by the drain below until its lease
+        # expires. Then deliver what the last requests left in the outbox
+        for thread in threading.enumerate():
+            if thread.name == "outbox-drainer":
+                thread.join()
+        outbox.drain_outbox(test_mode=True, time_budget=30)
+        report.notifications = len(stub.received)
+        target.close()
+        database.dispose_engines()
+        google_utils.invalidate_secret()
+
+    count_duplicates(database_url, report)
+    return report
+
+
+def _row(label: str, outcomes: list[Outcome], duration: float) -> str:
+    latencies = [outcome.latency * 1000 for outcome in outcomes]
+    if len(latencies) > 1:
+        cut_points = statistics.quantiles(latencies, n=100, method="inclusive")
+        p50, p90, p99 = cut_points[49], cut_points[89], cut_points[98]
+    else:
+        p50 = p90 = p99 = latencies[0]
+    succeeded = sum(outcome.status == 200 for outcome in outcomes)
+    already = sum(outcome.already_assigned for outcome in outcomes)
+    exhausted = sum(outcome.pool_exhausted for outcome in outcomes)
+    return (
+        f"  {label:<20} {len(outcomes):>8} {len(outcomes) / duration:>8.1f} {p50:>8.1f} {p90:>8.1f} {p99:>8.1f}"
+        f" {succeeded:>6} {already:>8} {exhausted:>6} {len(outcomes) - succeeded - exhausted:>7}"
+    )
+
+
+def print_report(report: LoadReport) -> None:
+    print(
+        f"  {'handler':<20} {'requests':>8} {'req/s':>8} {'p50 ms':>8} {'p90 ms':>8} {'p99 ms':>8}"
+        f" {'ok':>6} {'already':>8} {'pool':>6} {'errors':>7}"
+    )
+    by_handler = collections.defaultdict(list)
+    for outcome in report.outcomes:
+        by_handler[outcome.handler].append(outcome)
+    for handler, outcomes in by_handler.items():
+        print(_row(handler, outcomes, report.duration))
+    if len(by_handler) > 1:
+        print(_row("all", report.outcomes, report.duration))
+
+    repeated = report.repeated_members if DUTY_SELECTION_STRATEGY == SelectionStrategy.RANDOM else "n/a"
+    print(
+        f"\n  {report.assignments} assignments for {report.periods} periods, "
+        f"{report.duplicate_assignments} duplicate assignments, {repeated} members repeated in a cycle, "
+        f"{report.notifications} notifications ({report.duplicate_notifications} duplicates)"
+    )
+
+    errors = collections.Counter(
+        outcome.message[:120] for outcome in report.outcomes if outcome.status != 200 and not outcome.pool_exhausted
+    )
+    for message, count in errors.most_common(5):
+        print(f"  {count:>6}x {message}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--database-url", help="SQLAlchemy URL of a scratch database")
+    parser.add_argument("--handlers", default=",".join(HANDLERS), help="comma separated handlers to trigger")
+    parser.add_argument("--requests", type=int, default=200, help="total number of requests")
+    parser.add_argument("--concurrency", type=int, default=8, help="number of requests in flight")
+    parser.add_argument("--retries", type=int, default=4, help="overlapping triggers per duty period")
+    parser.add_argument("--server", action="store_true", help="send the requests over HTTP to a local server")
+    parser.add_argument("--pool-size", type=int, help="DB_POOL_SIZE of the instance")
+    parser.add_argument("--max-overflow", type=int, help="DB_MAX_OVERFLOW of the instance")
+    parser.add_argument("--pool-timeout", type=int, help="DB_POOL_TIMEOUT of the instance in seconds")
+    parser.add_argument("--webhook-latency", type=float, default=0.02, help="latency of the stub server in seconds")
+    parser.add_argument("--history", type=int, default=1000, help="number of assignments in the history")
+    args = parser.parse_args()
+    # Failed requests are summarised in the report
+    logging.disable(logging.ERROR)
+    handlers = args.handlers.split(",")
+
+    with tempfile.TemporaryDirectory() as directory:
+        url = args.database_url or f"sqlite:///{Path(directory) / 'load_test.db'}"
+        report = run(
+            url,
+            handlers,
+            args.requests,
+            args.concurrency,
+            args.retries,
+            server=args.server,
+            pool_size=args.pool_size,
+            max_overflow=args.max_overflow,
+            pool_timeout=args.pool_timeout,
+            webhook_latency=args.webhook_latency,
+            history=args.history,
+        )
+        print(
+            f"{args.requests} requests to {', '.join(handlers)} ({url.split(':')[0]}, "
+            f"{'local server' if args.server else 'test client'}), {args.concurrency} concurrent, "
+            f"{args.retries} triggers per period, in {report.duration:.2f} s:\n"
+        )
+        print_report(report)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""
+Measure Mattermost notification throughput against a local stub webhook server.
+
+Usage:
+    python -m benchmarks.mattermost_fanout [--messages N] [--latency SECONDS] [--workers N]
+
+Compares a new connection per message (bare requests.post), a kept-alive session sending one message at a time,
+and MattermostClient.send_batch fanning out over a thread pool.
+"""
+
+import argparse
+import time
+from collections.abc import Callable
+
+import requests
+
+from mattermost import MattermostClient
+from tests.stubs import StubMattermostServer
+
+
+def build_payloads(count: int) -> list[dict[str, str]]:
+    # One message to the office channel, the rest are DMs, like a fan-out to assignees and backups
+    return [
+        {"text": "It's your turn to clean!", "channel": "nycoffice" if i == 0 else f"@member_{i}"} for i in range(count)
+    ]
+
+
+def measure(label: str, count: int, send: Callable[[], int]) -> None:
+    start = time.perf_counter()
+    sent = send()
+    duration = time.perf_counter() - start
+    print(f"{label:<40} {sent:>5}/{count} sent in {duration:6.2f} s  {sent / duration:8.1f} msg/s")
+
+
+def run(messages: int, latency: float, workers: int) -> None:
+    payloads = build_payloads(messages)
+
+    with StubMattermostServer(latency=latency) as stub:
+        print(f"{messages} messages, {latency * 1000:.0f} ms server latency\n")
+
+        def bare_requests() -> int:
+            return sum(requests.post(stub.url, json=payload, timeout=10).ok for payload in payloads)
+
+        client = MattermostClient(webhook_url=stub.url, max_workers=workers)
+
+        def sequential_client() -> int:
+            return sum(client.post(payload).success for payload in payloads)
+
+        def batched_client() -> int:
+            return client.send_batch(payloads).sent
+
+        measure("requests.post per message", messages, bare_requests)
+        measure("MattermostClient.post (keep-alive)", messages, sequential_client)
+        measure(f"MattermostClient.send_batch ({workers} workers)", messages, batched_client)
+        client.close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=300, help="number of messages to send")
+    parser.add_argument("--latency", type=float, default=0.01, help="latency of the stub server in seconds")
+    parser.add_argument("--workers", type=int, default=16, help="size of the fan-out thread pool")
+    args = parser.parse_args()
+
+    run(args.messages, args.latency, args.workers)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+"""
+Compare assigning the due duties of many offices one at a time with a single batch run.
+
+Usage:
+    python -m benchmarks.multi_office [--database-url URL] [--offices N,N,...] [--members N] [--latency SECONDS]
+
+For every number of synthetic offices the coffee and fridge duty are assigned in every office, first with a
+transaction per office and duty (assign_next_member, like separate triggers), then with one assign_batch for all
+of them. The notifications are then delivered to a local stub webhook server one at a time and fanned out with
+MattermostClient.send_batch. The batch run takes a constant number of statements, so its runtime should grow much
+slower than the number of offices. Without a database URL a temporary SQLite database is used. A Postgres URL must
+point at a scratch database, because the tables are dropped and recreated.
+"""
+
+import argparse
+import functools
+import itertools
+import logging
+import tempfile
+import time
+from collections.abc import Callable
+from pathlib import Path
+
+from sqlalchemy import create_engine, insert, select
+
+from database import Base, MemberTable, NotificationOutboxTable, SqlRepository
+from duties import DutyType
+from main import select_next_member
+from mattermost import MattermostClient, build_mattermost_payload
+from models import DueDuty, OfficeMember
+from scheduling import SelectionStrategy
+from tests.stubs import StubMattermostServer
+
+select_member = functools.partial(select_next_member, strategy=SelectionStrategy.STRIDE)
+
+
+def seed(repository: SqlRepository, offices: int, members: int) -> list[str]:
+    names = [f"office_{i}" for i in range(offices)]
+    with repository.session() as session:
+        session.execute(
+            insert(MemberTable),
+            [
+                {"username": f"{office}_member_{i}", "office": office, "coffee_drinker": i % 3 != 0}
+                for office in names
+                for i in range(members)
+            ],
+        )
+    return names
+
+
+def notify(duty_type: str, member: OfficeMember) -> dict[str, str]:
+    return build_mattermost_payload(member.username, duty_type, test_mode=True, office=member.office)
+
+
+def measure(label: str, run: Callable[[], object], baseline: float | None = None) -> float:
+    start = time.perf_counter()
+    run()
+    duration = time.perf_counter() - start
+    speedup = f"  {baseline / duration:5.1f}x" if baseline else ""
+    print(f"  {label:<45} {duration * 1000:9.1f} ms{speedup}")
+    return duration
+
+
+def run_offices(repository: SqlRepository, offices: int, members: int, stub: StubMattermostServer) -> None:
+    Base.metadata.drop_all(repository.engine)
+    Base.metadata.create_all(repository.engine)
+    names = seed(repository, offices, members)
+    periods = itertools.count()
+
+    def due_duties() -> list[DueDuty]:
+        period = next(periods)
+        return [
+            DueDuty(DutyType.COFFEE, coffee_drinkers_only=True, period_key=f"coffee-{period}"),
+            DueDuty(DutyType.FRIDGE, period_key=f"fridge-{period}"),
+        ]
+
+    def per_office() -> None:
+        duties = due_duties()
+        for office in names:
+            for duty in duties:
+                repository.assign_next_member(
+                    duty.duty_type,
+                    select_member,
+                    duty.coffee_drinkers_only,
+                    functools.partial(notify, duty.duty_type),
+                    duty.period_key,
+                    office,
+                )
+
+    def batch() -> None:
+        result = repository.assign_batch(due_duties(), select_member, notify)
+        assert result.success, result.message
+
+    print(f"{offices} offices, {offices * members} members ({repository.engine.dialect.name}):")
+    baseline = measure("assign_next_member per office and duty", per_office)
+    measure("assign_batch", batch, baseline)
+
+    with repository.session() as session:
+        payloads = session.scalars(
+            select(NotificationOutboxTable.payload).order_by(NotificationOutboxTable.id.desc()).limit(2 * offices)
+        ).all()
+    # Without the per-channel rate limit, test mode sends every notification to the same DM
+    client = MattermostClient(webhook_url=stub.url, rate_per_destination=0)
+    baseline = measure(
+        f"deliver {len(payloads)} notifications one at a time", lambda: [client.post(payload) for payload in payloads]
+    )
+    measure("deliver them with send_batch", lambda: client.send_batch(list(payloads)), baseline)
+    client.close()
+    print()
+
+
+def run(database_url: str, office_counts: list[int], members: int, latency: float) -> None:
+    repository = SqlRepository(create_engine(database_url), test_mode=True)
+    with StubMattermostServer(latency=latency) as stub:
+        for offices in office_counts:
+            run_offices(repository, offices, members, stub)
+    repository.dispose()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--database-url", help="SQLAlchemy URL of a scratch database")
+    parser.add_argument("--offices", default="1,10,100", help="comma separated numbers of offices")
+    parser.add_argument("--members", type=int, default=20, help="number of members per office")
+    parser.add_argument("--latency", type=float, default=0.01, help="latency of the stub server in seconds")
+    args = parser.parse_args()
+    logging.disable(logging.INFO)
+    office_counts = [int(count) for count in args.offices.split(",")]
+
+    if args.database_url:
+        run(args.database_url, office_counts, args.members, args.latency)
+        return
+
+    with tempfile.TemporaryDirectory() as directory:
+        run(f"sqlite:///{Path(directory) / 'multi_office.db'}", office_counts, args.members, args.latency)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""
+Measure the time and memory of a roster sync from a large HR export.
+
+Usage:
+    python -m benchmarks.roster_sync [--database-url URL] [--rows N,N,...]
+
+For every size a members table of that many members is synced with a CSV export in which a tenth of them changed,
+a tenth left and a tenth are new. The peak of the memory allocated by Python during a dry run of the sync should
+stay the same for every size, as the export is streamed into the staging table. Without a database URL a temporary
+SQLite database is used. A Postgres URL must point at a scratch database, because the tables are dropped and
+recreated.
+"""
+
+import argparse
+import csv
+import logging
+import tempfile
+import tracemalloc
+from pathlib import Path
+
+from sqlalchemy import create_engine, insert
+
+import database
+import google_utils
+from database import Base, MemberTable
+from roster_sync import read_export, sync_roster
+from tests.stubs import FakeSecretManagerClient
+
+
+def write_export(path: Path, rows: int) -> None:
+    """
+    An export of the seeded members where every tenth one switched coffee preference, every tenth one left and
+    as many joined.
+    """
+    with path.open("w", newline="") as file:
+        writer = csv.writer(file)
+        writer.writerow(["username", "full_name", "coffee_drinker", "active", "office"])
+        for i in range(rows):
+            if i % 10 == 1:
+                continue
+            coffee_drinker = i % 3 != 0 if i % 10 != 0 else i % 3 == 0
+            writer.writerow([f"member_{i}", f"Member {i}", str(coffee_drinker).lower(), "true", f"office_{i % 5}"])
+        for i in range(rows // 10):
+            writer.writerow([f"new_member_{i}", f"New Member {i}", "true", "true", f"office_{i % 5}"])
+
+
+def run(database_url: str, sizes: list[int], directory: Path) -> None:
+    engine = create_engine(database_url)
+    google_utils._client = FakeSecretManagerClient(  # type: ignore[assignment]
+        secrets={database._get_database_secret_name(True): database_url}
+    )
+    print(f"Roster sync ({engine.dialect.name}):\n")
+
+    for rows in sizes:
+        Base.metadata.drop_all(engine)
+        Base.metadata.create_all(engine)
+        with engine.begin() as connection:
+            connection.execute(
+                insert(MemberTable),
+                [
+                    {
+                        "username": f"member_{i}",
+                        "full_name": f"Member {i}",
+                        "coffee_drinker": i % 3 != 0,
+                        "office": f"office_{i % 5}",
+                    }
+                    for i in range(rows)
+                ],
+            )
+        export = directory / f"export_{rows}.csv"
+        write_export(export, rows)
+
+        # Tracing allocations slows the sync down, so the memory is measured on a dry run that is rolled back
+        tracemalloc.start()
+        with export.open(newline="") as lines:
+            sync_roster(read_export(lines), test_mode=True, dry_run=True)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        with export.open(newline="") as lines:
+            result = sync_roster(read_export(lines), test_mode=True)
+
+        print(
+            f"  {rows:>8} members  {result.duration:7.2f} s  peak {peak / 2**20:6.1f} MiB   "
+            f"{result.inserted} inserted, {result.updated} updated, {result.deactivated} deactivated"
+        )
+        database.dispose_engines()
+
+    engine.dispose()
+    google_utils.invalidate_secret()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--database-url", help="SQLAlchemy URL of a scratch database")
+    parser.add_argument("--rows", default="10000,50000,200000", help="comma separated numbers of members")
+    args = parser.parse_args()
+    logging.disable(logging.INFO)
+    sizes = [int(size) for size in args.rows.split(",")]
+
+    with tempfile.TemporaryDirectory() as directory:
+        url = args.database_url or f"sqlite:///{Path(directory) / 'roster_sync.db'}"
+        run(url, sizes, Path(directory))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+"""
+Compare ways of mapping members and assignments read from the database to Python objects.
+
+Usage:
+    python -m benchmarks.row_mapping [--database-url URL] [--rows N] [--repeat N]
+
+The read paths of database.py build slotted OfficeMembers for the (cached) roster and slotted AssignmentRecords for
+the history, straight from column tuples. For every mapping the time per 100k rows and the memory of the resulting
+objects (and the peak while building them) are reported, measured with tracemalloc. Without a database URL a
+temporary SQLite database is used. A Postgres URL must point at a scratch database, because the tables are dropped
+and recreated.
+"""
+
+import argparse
+import gc
+import statistics
+import tempfile
+import time
+import tracemalloc
+from collections.abc import Callable, Sequence
+from pathlib import Path
+from typing import Any
+
+from pydantic import BaseModel
+from sqlalchemy import create_engine, insert, select
+from sqlalchemy.orm import Session
+
+from database import ASSIGNMENT_COLUMNS, MEMBER_COLUMNS, Base, DutyAssignmentTable, MemberTable
+from models import AssignmentRecord, DutyAssignment, OfficeMember
+
+BATCH_SIZE = 50_000
+
+
+class MemberModel(BaseModel):
+    """
+    A pydantic model with the fields of OfficeMember, which was one before it became a slotted dataclass.
+    """
+
+    id: int
+    username: str
+    full_name: str | None
+    coffee_drinker: bool
+    active: bool
+    duty_weight: float
+    duty_credit: float | None
+    office: str
+
+
+def seed(session: Session, rows: int) -> None:
+    members = [
+        {"id": i, "username": f"member_{i}", "full_name": f"Member {i}", "duty_credit": i % 7}
+        for i in range(1, rows + 1)
+    ]
+    assignments = [
+        {"member_id": i % rows + 1, "duty_type": "coffee" if i % 2 else "fridge", "cycle_id": i // 100}
+        for i in range(rows)
+    ]
+    for start in range(0, rows, BATCH_SIZE):
+        session.execute(insert(MemberTable), members[start : start + BATCH_SIZE])
+        session.execute(insert(DutyAssignmentTable), assignments[start : start + BATCH_SIZE])
+    session.commit()
+
+
+def mappings(session: Session) -> dict[str, Callable[[], Sequence[Any]]]:
+    return {
+        "members: ORM entities + model_validate(__dict__)": lambda: [
+            MemberModel.model_validate(member.__dict__) for member in session.query(MemberTable)
+        ],
+        "members: column tuples + model_validate": lambda: [
+            MemberModel.model_validate(row._asdict()) for row in session.execute(select(*MEMBER_COLUMNS))
+        ],
+        "members: column tuples + model_construct": lambda: [
+            MemberModel.model_construct(**row._asdict()) for row in session.execute(select(*MEMBER_COLUMNS))
+        ],
+        "members: column tuples + OfficeMember": lambda: [
+            OfficeMember(*row) for row in session.execute(select(*MEMBER_COLUMNS))
+        ],
+        "members: column tuples only": lambda: session.execute(select(*MEMBER_COLUMNS)).all(),
+        "history: ORM entities + model_validate(__dict__)": lambda: [
+            DutyAssignment.model_validate(assignment.__dict__) for assignment in session.query(DutyAssignmentTable)
+        ],
+        "history: column tuples + model_construct": lambda: [
+            DutyAssignment.model_construct(**row._asdict()) for row in session.execute(select(*ASSIGNMENT_COLUMNS))
+        ],
+        "history: column tuples + AssignmentRecord": lambda: [
+            AssignmentRecord(*row) for row in session.execute(select(*ASSIGNMENT_COLUMNS))
+        ],
+    }
+
+
+def measure(session: Session, build: Callable[[], Sequence[Any]], repeat: int) -> tuple[float, float, float]:
+    """
+    Median time (s), memory of the result and peak memory while building it (bytes).
+    """
+    durations = []
+    for _ in range(repeat):
+        session.expunge_all()
+        gc.collect()
+        start = time.perf_counter()
+        build()
+        durations.append(time.perf_counter() - start)
+
+    session.expunge_all()
+    gc.collect()
+    tracemalloc.start()
+    result = build()
+    session.expunge_all()
+    gc.collect()
+    retained, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+
+    return statistics.median(durations), retained, peak
+
+
+def run(database_url: str, rows: int, repeat: int) -> None:
+    engine = create_engine(database_url)
+    Base.metadata.drop_all(engine)
+    Base.metadata.create_all(engine)
+
+    with Session(engine) as session:
+        seed(session, rows)
+        print(f"{rows} members and assignments ({engine.dialect.name}), per 100k rows:\n")
+        print(f"{'mapping':<50} {'time':>10} {'retained':>12} {'peak':>12}")
+
+        scale = 100_000 / rows
+        for label, build in mappings(session).items():
+            duration, retained, peak = measure(session, build, repeat)
+            print(
+                f"{label:<50} {duration * scale * 1000:>7.0f} ms {retained * scale / 2**20:>8.1f} MiB "
+                f"{peak * scale / 2**20:>8.1f} MiB"
+            )
+
+    engine.dispose()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--database-url", help="SQLAlchemy URL of a scratch database")
+    parser.add_argument("--rows", type=int, default=100_000, help="number of members and of assignments")
+    parser.add_argument("--repeat", type=int, default=3, help="timed runs per mapping, the median is reported")
+    args = parser.parse_args()
+
+    if args.database_url:
+        run(args.database_url, args.rows, args.repeat)
+        return
+
+    with tempfile.TemporaryDirectory() as directory:
+        run(f"sqlite:///{Path(directory) / 'row_mapping.db'}", args.rows, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
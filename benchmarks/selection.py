@@ -0,0 +1,56 @@
+"""
+Micro-benchmark of member selection on large rosters.
+
+Usage:
+    python -m benchmarks.selection [--members N] [--picks N]
+
+Compares select_next_member with the random strategy (rebuilds a dict, a set and a list per call) and the stride
+strategy (scans the members' credit per call, like a trigger does).
+"""
+
+import argparse
+import random
+import time
+from collections.abc import Callable
+
+from main import select_next_member
+from models import OfficeMember
+from scheduling import SelectionStrategy
+
+
+def measure(label: str, picks: int, pick: Callable[[], object]) -> None:
+    start = time.perf_counter()
+    for _ in range(picks):
+        pick()
+    per_pick = (time.perf_counter() - start) / picks
+    print(f"{label:<45} {per_pick * 1e6:10.1f} us/pick")
+
+
+def run(member_count: int, picks: int) -> None:
+    members = [
+        OfficeMember(id=i, username=f"member_{i}", duty_weight=random.choice([0.5, 1.0]), duty_credit=random.random())
+        for i in range(member_count)
+    ]
+    # Half of the members already had a turn in the current cycle
+    assigned = {member.id for member in members[: member_count // 2]}
+    print(f"{member_count} members, {picks} picks\n")
+
+    measure("select_next_member (random)", picks, lambda: select_next_member(members, assigned))
+    measure(
+        "select_next_member (stride)",
+        picks,
+        lambda: select_next_member(members, assigned, strategy=SelectionStrategy.STRIDE),
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--members", type=int, default=10_000, help="roster size")
+    parser.add_argument("--picks", type=int, default=200, help="number of picks per strategy")
+    args = parser.parse_args()
+
+    run(args.members, args.picks)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,271 @@
+"""
+Monte-Carlo simulation of the duty rotation over many years, to see how evenly duties are spread with churn.
+
+Usage:
+    python -m benchmarks.simulation [--runs N] [--years N] [--members N] [--seed N]
+
+Every run replays the same calendar as production for both duty types, with members joining and leaving at random.
+All runs are simulated at once: the loop is over duty dates, and every draw is a NumPy operation across all runs.
+"""
+
+import argparse
+import datetime
+import math
+import time
+from dataclasses import dataclass, field
+
+import numpy as np
+import numpy.typing as npt
+
+from duties import DutyType
+from duty_calendar import get_schedule_rule
+from main import select_next_member
+from models import OfficeMember
+
+DUTY_TYPES = list(DutyType)
+
+
+@dataclass
+class SimulationConfig:
+    runs: int = 2000
+    years: int = 5
+    # Members at the start of every run
+    members: int = 12
+    coffee_drinker_share: float = 0.75
+    # Members leave after an exponentially distributed tenure, and are replaced at the same rate on average
+    mean_tenure_years: float = 3.0
+    start_date: datetime.date = field(default_factory=lambda: datetime.date(2025, 1, 1))
+    seed: int | None = None
+
+
+@dataclass
+class Roster:
+    """
+    Member slots of every run. A slot is active from its join day (inclusive) up to its leave day (exclusive).
+    """
+
+    join_day: npt.NDArray[np.int64]  # (runs, slots)
+    leave_day: npt.NDArray[np.int64]  # (runs, slots)
+    coffee_drinker: npt.NDArray[np.bool_]  # (runs, slots)
+
+    @property
+    def slots(self) -> int:
+        return int(self.join_day.shape[1])
+
+    def active(self, day: int) -> npt.NDArray[np.bool_]:
+        return (self.join_day <= day) & (day < self.leave_day)
+
+    def eligible(self, duty_type: DutyType, day: int) -> npt.NDArray[np.bool_]:
+        """
+        Eligibility per slot, with the same filters as get_duty_config.
+        """
+        active = self.active(day)
+        return active & self.coffee_drinker if duty_type == DutyType.COFFEE else active
+
+
+@dataclass
+class SimulationResult:
+    config: SimulationConfig
+    roster: Roster
+    horizon_days: int
+    counts: npt.NDArray[np.int64]  # (runs, slots, duty types)
+    gap_sum: npt.NDArray[np.float64]  # (runs, slots, duty types), in days
+    gap_count: npt.NDArray[np.int64]  # (runs, slots, duty types)
+    gap_max: npt.NDArray[np.int64]  # (runs, slots, duty types), in days
+    skipped: npt.NDArray[np.int64]  # (duty types,) events without any eligible member
+    duration: float
+
+    def active_years(self) -> npt.NDArray[np.float64]:
+        start = np.clip(self.roster.join_day, 0, self.horizon_days)
+        end = np.clip(self.roster.leave_day, 0, self.horizon_days)
+        return np.asarray((end - start) / 365.25, dtype=np.float64)
+
+    def summary(self, min_active_years: float = 1.0) -> dict[str, dict[str, float]]:
+        """
+        Distribution of assignments per active year and of the gaps between turns, over all members that were
+        eligible for at least `min_active_years`.
+        """
+        active_years = self.active_years()
+        summary: dict[str, dict[str, float]] = {}
+
+        for index, duty_type in enumerate(DUTY_TYPES):
+            eligible_years = active_years
+            if duty_type == DutyType.COFFEE:
+                eligible_years = np.where(self.roster.coffee_drinker, active_years, 0.0)
+            mask = eligible_years >= min_active_years
+
+            per_year = self.counts[..., index][mask] / eligible_years[mask]
+            gap_count = self.gap_count[..., index][mask]
+            gaps = self.gap_sum[..., index][mask][gap_count > 0] / gap_count[gap_count > 0]
+
+            summary[duty_type.value] = {
+                "members": float(mask.sum()),
+                "per_year_mean": float(per_year.mean()) if per_year.size else math.nan,
+                "per_year_std": float(per_year.std()) if per_year.size else math.nan,
+                "per_year_p5": float(np.percentile(per_year, 5)) if per_year.size else math.nan,
+                "per_year_p95": float(np.percentile(per_year, 95)) if per_year.size else math.nan,
+                "mean_gap_days": float(gaps.mean()) if gaps.size else math.nan,
+                "p95_gap_days": float(np.percentile(gaps, 95)) if gaps.size else math.nan,
+                "max_gap_days": float(self.gap_max[..., index][mask].max()) if mask.any() else math.nan,
+                "skipped_runs": float(self.skipped[index]),
+            }
+
+        return summary
+
+
+def duty_events(start_date: datetime.date, years: int) -> list[tuple[int, DutyType]]:
+    """
+    Days (since the start date) on which each duty runs, following the production schedule rules.
+    """
+    end_date = start_date + datetime.timedelta(days=round(years * 365.25) - 1)
+    events = [
+        ((date - start_date).days, duty_type)
+        for duty_type in DUTY_TYPES
+        for date in get_schedule_rule(duty_type).candidate_dates(start_date, end_date)
+    ]
+    return sorted(events)
+
+
+def generate_roster(config: SimulationConfig, horizon_days: int, rng: np.random.Generator) -> Roster:
+    """
+    Initial members plus joiners arriving as a Poisson process, all with exponentially distributed tenures.
+    """
+    tenure_days = config.mean_tenure_years * 365.25
+    join_rate = config.members / tenure_days  # joiners per day that keep the office size stable on average
+
+    # Enough slots for the joiners of (almost) every run, the rare overflow is simply not simulated
+    expected_joiners = join_rate * horizon_days
+    joiner_slots = int(math.ceil(expected_joiners + 4 * math.sqrt(expected_joiners) + 1))
+    shape = (config.runs, config.members + joiner_slots)
+
+    join_day = np.zeros(shape, dtype=np.int64)
+    arrivals = np.cumsum(rng.exponential(1 / join_rate, size=(config.runs, joiner_slots)), axis=1)
+    join_day[:, config.members :] = np.minimum(np.ceil(arrivals), horizon_days + 1).astype(np.int64)
+
+    leave_day = join_day + np.ceil(rng.exponential(tenure_days, size=shape)).astype(np.int64)
+    coffee_drinker = rng.random(shape) < config.coffee_drinker_share
+
+    return Roster(join_day=join_day, leave_day=leave_day, coffee_drinker=coffee_drinker)
+
+
+def simulate(config: SimulationConfig, roster: Roster | None = None) -> SimulationResult:
+    """
+    Replay the rotation of both duties for every run at once.
+    Selection follows select_next_member: a uniformly random eligible member who has not had a turn in the current
+    cycle, and a new cycle once every eligible member had one.
+    """
+    start = time.perf_counter()
+    rng = np.random.default_rng(config.seed)
+    events = duty_events(config.start_date, config.years)
+    horizon_days = round(config.years * 365.25)
+    if roster is None:
+        roster = generate_roster(config, horizon_days, rng)
+
+    runs, slots, duties = config.runs, roster.slots, len(DUTY_TYPES)
+    run_index = np.arange(runs)
+
+    assigned = np.zeros((duties, runs, slots), dtype=bool)
+    counts = np.zeros((runs, slots, duties), dtype=np.int64)
+    last_day = np.full((runs, slots, duties), -1, dtype=np.int64)
+    gap_sum = np.zeros((runs, slots, duties), dtype=np.float64)
+    gap_count = np.zeros((runs, slots, duties), dtype=np.int64)
+    gap_max = np.zeros((runs, slots, duties), dtype=np.int64)
+    skipped = np.zeros(duties, dtype=np.int64)
+
+    for day, duty_type in events:
+        duty = DUTY_TYPES.index(duty_type)
+        eligible = roster.eligible(duty_type, day)
+        available = eligible & ~assigned[duty]
+
+        # Start a new cycle where everyone eligible had a turn
+        new_cycle = ~available.any(axis=1)
+        assigned[duty][new_cycle] = False
+        available[new_cycle] = eligible[new_cycle]
+
+        # Uniform choice among the available members: the largest random key wins
+        keys = np.where(available, rng.random((runs, slots)), -1.0)
+        selected = keys.argmax(axis=1)
+        has_member = available[run_index, selected]
+        skipped[duty] += int((~has_member).sum())
+
+        picked_runs, picked = run_index[has_member], selected[has_member]
+        assigned[duty][picked_runs, picked] = True
+        counts[picked_runs, picked, duty] += 1
+
+        previous = last_day[picked_runs, picked, duty]
+        had_turn = previous >= 0
+        gaps = day - previous[had_turn]
+        gap_runs, gap_slots = picked_runs[had_turn], picked[had_turn]
+        gap_sum[gap_runs, gap_slots, duty] += gaps
+        gap_count[gap_runs, gap_slots, duty] += 1
+        gap_max[gap_runs, gap_slots, duty] = np.maximum(gap_max[gap_runs, gap_slots, duty], gaps)
+        last_day[picked_runs, picked, duty] = day
+
+    return SimulationResult(
+        config=config,
+        roster=roster,
+        horizon_days=horizon_days,
+        counts=counts,
+        gap_sum=gap_sum,
+        gap_count=gap_count,
+        gap_max=gap_max,
+        skipped=skipped,
+        duration=time.perf_counter() - start,
+    )
+
+
+def simulate_run(config: SimulationConfig, roster: Roster, run: int) -> npt.NDArray[np.int64]:
+    """
+    Replay a single run one assignment at a time with select_next_member itself. Much slower than `simulate`,
+    but useful to check that both follow the same rotation rules. Returns the counts per slot and duty type.
+    """
+    counts = np.zeros((roster.slots, len(DUTY_TYPES)), dtype=np.int64)
+    assigned: dict[DutyType, set[int]] = {duty_type: set() for duty_type in DUTY_TYPES}
+
+    for day, duty_type in duty_events(config.start_date, config.years):
+        eligible = np.flatnonzero(roster.eligible(duty_type, day)[run])
+        members = [OfficeMember(id=int(slot), username=f"member_{slot}") for slot in eligible]
+
+        selected = select_next_member(members, assigned[duty_type])
+        if selected is None:
+            assigned[duty_type] = set()
+            selected = select_next_member(members, assigned[duty_type])
+            if selected is None:
+                continue
+
+        assigned[duty_type].add(selected.id)
+        counts[selected.id, DUTY_TYPES.index(duty_type)] += 1
+
+    return counts
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=2000, help="number of simulated schedules")
+    parser.add_argument("--years", type=int, default=5, help="years per schedule")
+    parser.add_argument("--members", type=int, default=12, help="office size at the start")
+    parser.add_argument("--coffee-drinker-share", type=float, default=0.75)
+    parser.add_argument("--mean-tenure-years", type=float, default=3.0)
+    parser.add_argument("--seed", type=int)
+    args = parser.parse_args()
+
+    config = SimulationConfig(
+        runs=args.runs,
+        years=args.years,
+        members=args.members,
+        coffee_drinker_share=args.coffee_drinker_share,
+        mean_tenure_years=args.mean_tenure_years,
+        seed=args.seed,
+    )
+    result = simulate(config)
+
+    simulated_years = config.runs * config.years
+    print(f"Simulated {simulated_years} years ({config.runs} runs of {config.years}) in {result.duration:.2f} s")
+    for duty_type, stats in result.summary().items():
+        print(f"\n{duty_type}")
+        for name, value in stats.items():
+            print(f"  {name:<16} {value:10.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+"""
+End-to-end latency of the assignment functions, with pytest-benchmark.
+
+Usage:
+    pytest benchmarks/ [--benchmark-autosave] [--benchmark-compare] [--benchmark-compare-fail=median:25%]
+
+The Flask handlers run against a seeded database (SQLite, or the scratch Postgres of BENCHMARK_DATABASE_URL),
+a stub Mattermost server and a fake Secret Manager, so nothing goes over the network. Every handler is measured
+on a cold instance (no engine, cached secret or Mattermost connection yet) and on a warm one, for every history
+size in BENCHMARK_HISTORY_SIZES. The p50 and p99 latency are stored in the extra_info of every benchmark.
+"""
+
+import functools
+from pathlib import Path
+
+import pytest
+from flask.testing import FlaskClient
+from functions_framework import create_app
+from pytest_benchmark.fixture import BenchmarkFixture
+
+import outbox
+from benchmarks.conftest import Instance, record_percentiles
+from tests.stubs import StubMattermostServer
+
+HANDLERS = ["assign_coffee_duty", "assign_fridge_duty"]
+COLD_ROUNDS = 30
+WARM_ROUNDS = 200
+
+REQUEST = {"test_mode": True}
+
+
+@functools.cache
+def get_client(handler: str) -> FlaskClient:
+    client: FlaskClient = create_app(
+        target=handler, source=str(Path(__file__).resolve().parent.parent / "main.py")
+    ).test_client()
+    return client
+
+
+@pytest.mark.parametrize("handler", HANDLERS)
+def test_cold_assignment(
+    benchmark: BenchmarkFixture, instance: Instance, mattermost_stub: StubMattermostServer, handler: str
+) -> None:
+    client = get_client(handler)
+    sent = len(mattermost_stub.received)
+
+    response = benchmark.pedantic(
+        client.post, args=("/",), kwargs={"json": REQUEST}, setup=instance.reset, rounds=COLD_ROUNDS
+    )
+
+    assert response.status_code == 200
+    assert len(mattermost_stub.received) > sent
+    assert outbox._count_pending(test_mode=True) == 0
+    record_percentiles(benchmark)
+
+
+@pytest.mark.parametrize("handler", HANDLERS)
+def test_warm_assignment(
+    benchmark: BenchmarkFixture, instance: Instance, mattermost_stub: StubMattermostServer, handler: str
+) -> None:
+    client = get_client(handler)
+    # The first request warms up the instance
+    assert client.post("/", json=REQUEST).status_code == 200
+    sent = len(mattermost_stub.received)
+
+    response = benchmark.pedantic(client.post, args=("/",), kwargs={"json": REQUEST}, rounds=WARM_ROUNDS)
+
+    assert response.status_code == 200
+    assert len(mattermost_stub.received) > sent
+    assert outbox._count_pending(test_mode=True) == 0
+    record_percentiles(benchmark)
@@ -0,0 +1,72 @@
+"""
+Latency of the assignment history endpoint, with pytest-benchmark.
+
+Usage:
+    pytest benchmarks/test_history.py [--benchmark-autosave] [--benchmark-compare]
+
+The first page and a page close to the oldest assignment are read for every history size in
+BENCHMARK_HISTORY_SIZES, once with a cold response cache and once revalidated by their ETag. With keyset
+pagination the deep page should be as fast as the first one.
+"""
+
+from pathlib import Path
+
+import pytest
+from flask.testing import FlaskClient
+from functions_framework import create_app
+from pytest_benchmark.fixture import BenchmarkFixture
+from sqlalchemy import func, select
+
+import database
+import history
+from benchmarks.conftest import Instance, record_percentiles
+
+ROUNDS = 200
+
+
+@pytest.fixture(scope="module")
+def client() -> FlaskClient:
+    client: FlaskClient = create_app(
+        target="assignment_history", source=str(Path(__file__).resolve().parent.parent / "main.py")
+    ).test_client()
+    return client
+
+
+def page_url(page: str) -> str:
+    if page == "first":
+        return "/?test_mode=true&limit=50"
+    # The page after the assignment a tenth of the way into the history
+    with database.get_db_session(test_mode=True) as session:
+        total = session.scalar(select(func.count(database.DutyAssignmentTable.id))) or 0
+        position = max(total // 10, 1)
+        assigned_at = session.scalar(
+            select(database.DutyAssignmentTable.assigned_at).where(database.DutyAssignmentTable.id == position)
+        )
+    assert assigned_at is not None
+    return f"/?test_mode=true&limit=50&cursor={history.encode_cursor((assigned_at, position))}"
+
+
+@pytest.mark.parametrize("page", ["first", "deep"])
+def test_uncached_history_page(benchmark: BenchmarkFixture, instance: Instance, client: FlaskClient, page: str) -> None:
+    url = page_url(page)
+
+    response = benchmark.pedantic(
+        client.get, args=(url,), setup=history.get_history_cache(test_mode=True).invalidate, rounds=ROUNDS
+    )
+
+    assert response.status_code == 200
+    assert response.json["assignments"]
+    record_percentiles(benchmark)
+
+
+@pytest.mark.parametrize("page", ["first", "deep"])
+def test_revalidated_history_page(
+    benchmark: BenchmarkFixture, instance: Instance, client: FlaskClient, page: str
+) -> None:
+    url = page_url(page)
+    etag = client.get(url).headers["ETag"]
+
+    response = benchmark.pedantic(client.get, args=(url,), kwargs={"headers": {"If-None-Match": etag}}, rounds=ROUNDS)
+
+    assert response.status_code == 304
+    record_percentiles(benchmark)
@@ -1,18 +1,89 @@
+import dataclasses
+import datetime
 import logging
-from collections.abc import Generator
-from contextlib import contextmanager
-from typing import Any
+import os
+import threading
+from collections import defaultdict
+from collections.abc import Callable, Generator
+from contextlib import AbstractContextManager, contextmanager
+from enum import StrEnum
+from typing import Any, Protocol
 
-from sqlalchemy import Boolean, Column, DateTime, ForeignKey, Integer, String, create_engine
+from sqlalchemy import (
+    JSON,
+    Boolean,
+    Column,
+    DateTime,
+    Float,
+    ForeignKey,
+    Index,
+    Integer,
+    String,
+    Text,
+    UniqueConstraint,
+    and_,
+    case,
+    create_engine,
+    event,
+    false,
+    insert,
+    or_,
+    select,
+    true,
+    tuple_,
+    update,
+)
+from sqlalchemy.engine import Engine, Row
+from sqlalchemy.exc import IntegrityError, OperationalError
 from sqlalchemy.ext.declarative import DeclarativeMeta, declarative_base
 from sqlalchemy.orm import Session, sessionmaker
-from sqlalchemy.sql import func
+from sqlalchemy.pool import QueuePool, StaticPool
+from sqlalchemy.sql import Select, func
 
-from google_utils import get_secret
-from models import AssignmentResult, CycleInfo, DutyType, OfficeMember
+from duties import DEFAULT_OFFICE
+from google_utils import get_secret, invalidate_secret
+from history import HistoryVersion
+from models import (
+    AssignmentRecord,
+    AssignmentResult,
+    BatchAssignmentResult,
+    CycleInfo,
+    DueDuty,
+    HistoryEntry,
+    HistoryPage,
+    OfficeMember,
+)
+from roster import RosterCache, RosterVersion
+from scheduling import charged_credit
+from timing import span
 
 logger = logging.getLogger(__name__)
 
+# Pool settings, overridable through the environment of the Cloud Run function
+DB_POOL_SIZE = int(os.environ.get("DB_POOL_SIZE", "2"))
+DB_MAX_OVERFLOW = int(os.environ.get("DB_MAX_OVERFLOW", "2"))
+DB_POOL_TIMEOUT = int(os.environ.get("DB_POOL_TIMEOUT", "10"))
+# Neon closes idle connections after a few minutes, so recycle well before that
+DB_POOL_RECYCLE = int(os.environ.get("DB_POOL_RECYCLE", "240"))
+DB_POOL_PRE_PING = os.environ.get("DB_POOL_PRE_PING", "true").lower() in ("1", "true", "yes")
+
+
+class StorageBackend(StrEnum):
+    # Neon, with the connection string from Secret Manager
+    POSTGRES = "postgres"
+    # A SQLite file per database in SQLITE_DIRECTORY
+    SQLITE = "sqlite"
+    # An in-memory SQLite database per instance, which starts out empty
+    MEMORY = "memory"
+
+
+STORAGE_BACKEND = StorageBackend(os.environ.get("STORAGE_BACKEND", StorageBackend.POSTGRES))
+# Backend of the dev database used by test mode runs, defaults to STORAGE_BACKEND
+TEST_MODE_STORAGE_BACKEND = (
+    StorageBackend(os.environ["TEST_MODE_STORAGE_BACKEND"]) if os.environ.get("TEST_MODE_STORAGE_BACKEND") else None
+)
+SQLITE_DIRECTORY = os.environ.get("SQLITE_DIRECTORY", ".")
+
 Base: DeclarativeMeta = declarative_base()
 
 
@@ -24,6 +95,11 @@ class MemberTable(Base):  # type: ignore[valid-type,misc]
     full_name = Column(String(100))
     coffee_drinker = Column(Boolean, default=True)
     active = Column(Boolean, default=True)
+    duty_weight = Column(Float, nullable=False, default=1.0, server_default="1")
+    duty_credit = Column(Float, nullable=True)
+    # Incremented on every update, so warm instances can tell whether their cached roster is still current
+    row_version = Column(Integer, nullable=False, default=0, server_default="0")
+    office = Column(String(50), nullable=False, default=DEFAULT_OFFICE, server_default=DEFAULT_OFFICE)
 
 
 class DutyAssignmentTable(Base):  # type: ignore[valid-type,misc]
@@ -34,131 +110,1162 @@ class DutyAssignmentTable(Base):  # type: ignore[valid-type,misc]
     duty_type = Column(String(20), nullable=False)
     assigned_at = Column(DateTime, server_default=func.now())
     cycle_id = Column(Integer, nullable=False)
-    completed = Column(Boolean, default=False)
+    completed = Column(Boolean, default=False, server_default=false())
     completed_at = Column(DateTime, nullable=True)
+    # When the assignee was reminded of an assignment they hadn't completed yet, see reminders.py
+    reminder_sent_at = Column(DateTime, nullable=True)
+    # Until when a sweep has claimed the reminder, after which another sweep may send it if it wasn't recorded as sent
+    reminder_claimed_until = Column(DateTime, nullable=True)
+    # Duty period the assignment was made for (see DutyCalendar.period_key), at most one assignment per period
+    period_key = Column(String(20), nullable=True)
+    office = Column(String(50), nullable=False, default=DEFAULT_OFFICE, server_default=DEFAULT_OFFICE)
+
+    __table_args__ = (
+        Index("ix_duty_assignments_office_duty_cycle_member", "office", "duty_type", "cycle_id", "member_id"),
+        UniqueConstraint("office", "duty_type", "period_key", name="uq_duty_assignments_office_duty_period"),
+        # Keyset pagination of the history, overall and per duty or member, and the version of the history
+        Index("ix_duty_assignments_assigned", "assigned_at", "id"),
+        Index("ix_duty_assignments_duty_assigned", "duty_type", "assigned_at", "id"),
+        Index("ix_duty_assignments_member_assigned", "member_id", "assigned_at", "id"),
+        Index("ix_duty_assignments_completed_at", "completed_at"),
+        # Only the assignments still waiting for a reminder, so the sweep doesn't grow with the history
+        Index(
+            "ix_duty_assignments_unreminded",
+            "assigned_at",
+            "id",
+            postgresql_where=and_(completed == false(), reminder_sent_at.is_(None)),
+            sqlite_where=and_(completed == false(), reminder_sent_at.is_(None)),
+        ),
+    )
+
+
+class DutyCycleTable(Base):  # type: ignore[valid-type,misc]
+    """
+    Pointer to the current cycle of every duty type per office, so it doesn't have to be derived from the full
+    history.
+    """
+
+    __tablename__ = "duty_cycles"
+
+    office = Column(String(50), primary_key=True, default=DEFAULT_OFFICE, server_default=DEFAULT_OFFICE)
+    duty_type = Column(String(20), primary_key=True)
+    cycle_id = Column(Integer, nullable=False)
+    # Incremented when the cycles of existing assignments are rewritten, so cached history responses are rebuilt
+    row_version = Column(Integer, nullable=False, default=0, server_default="0")
+
+
+class NotificationOutboxTable(Base):  # type: ignore[valid-type,misc]
+    """
+    Notifications written in the same transaction as the assignment they announce, delivered by outbox.py.
+    """
+
+    __tablename__ = "notification_outbox"
+
+    id = Column(Integer, primary_key=True)
+    dedupe_key = Column(String(100), unique=True, nullable=False)
+    payload = Column(JSON, nullable=False)
+    status = Column(String(10), nullable=False, default="pending")
+    attempts = Column(Integer, nullable=False, default=0)
+    next_attempt_at = Column(DateTime, nullable=False, default=lambda: utcnow())
+    created_at = Column(DateTime, server_default=func.now())
+    sent_at = Column(DateTime, nullable=True)
+    last_error = Column(Text, nullable=True)
+
+    __table_args__ = (Index("ix_notification_outbox_pending", "status", "next_attempt_at"),)
+
+
+def _get_database_secret_name(test_mode: bool) -> str:
+    return "neon-database-connection-string-dev" if test_mode else "neon-database-connection-string"
+
+
+def utcnow() -> datetime.datetime:
+    """
+    Current time in UTC, without timezone like the DateTime columns.
+    """
+    return datetime.datetime.now(datetime.UTC).replace(tzinfo=None)
 
 
 def get_database_url(test_mode: bool = False) -> str:
     """
     Get database connection URL from Google Secret Manager.
     """
-    secret_name = "neon-database-connection-string-dev" if test_mode else "neon-database-connection-string"
-    connection_string = get_secret(secret_name)
+    connection_string = get_secret(_get_database_secret_name(test_mode))
 
     return connection_string
 
 
-@contextmanager
-def get_db_session(test_mode: bool = False) -> Generator[Session, Any, None]:
+def is_auth_error(error: Exception) -> bool:
     """
-    Context manager for database sessions.
+    Check whether a database error was caused by rejected credentials.
     """
-    engine = create_engine(get_database_url(test_mode))
-    SessionLocal = sessionmaker(bind=engine)
-    session = SessionLocal()
+    if not isinstance(error, OperationalError):
+        return False
 
-    try:
-        yield session
-        session.commit()
-    except Exception as e:
-        logger.error(f"Database error: {e}")
-        session.rollback()
-        raise
-    finally:
-        session.close()
+    message = str(error.orig if error.orig is not None else error).lower()
+    return "authentication failed" in message or ("role" in message and "does not exist" in message)
 
 
-def get_office_members(coffee_drinkers_only: bool = False, test_mode: bool = False) -> list[OfficeMember]:
+def refresh_database_credentials(test_mode: bool = False) -> None:
     """
-    Fetch office members from database.
+    Forget the cached connection string and engine, so the next session uses the latest secret version.
     """
-    with get_db_session(test_mode) as session:
-        query = session.query(MemberTable).filter(MemberTable.active == True)
+    invalidate_secret(_get_database_secret_name(test_mode))
+    with _repositories_lock:
+        repository = _repositories.pop(test_mode, None)
+    if repository is not None:
+        repository.dispose()
+
+    logger.warning(f"Refreshed database credentials ({'dev' if test_mode else 'prod'})")
+
 
-        if coffee_drinkers_only:
-            query = query.filter(MemberTable.coffee_drinker == True)
+def _get_current_cycle_id(session: Session, duty_type: str, office: str = DEFAULT_OFFICE) -> int | None:
+    return session.execute(
+        select(DutyCycleTable.cycle_id).where(DutyCycleTable.office == office, DutyCycleTable.duty_type == duty_type)
+    ).scalar()
 
-        members = query.all()
 
-        return [OfficeMember.model_validate(member.__dict__) for member in members]
+def _set_current_cycle_id(session: Session, duty_type: str, cycle_id: int, office: str = DEFAULT_OFFICE) -> None:
+    updated = session.execute(
+        update(DutyCycleTable)
+        .where(DutyCycleTable.office == office, DutyCycleTable.duty_type == duty_type)
+        .values(cycle_id=cycle_id)
+    )
+    if updated.rowcount == 0:  # type: ignore[attr-defined]
+        session.add(DutyCycleTable(office=office, duty_type=duty_type, cycle_id=cycle_id))
+        session.flush()
 
 
-def get_current_cycle_info(duty_type: DutyType, test_mode: bool = False) -> CycleInfo:
+# Read paths select these columns as tuples instead of loading ORM entities
+MEMBER_COLUMNS = (
+    MemberTable.id,
+    MemberTable.username,
+    MemberTable.full_name,
+    MemberTable.coffee_drinker,
+    MemberTable.active,
+    MemberTable.duty_weight,
+    MemberTable.duty_credit,
+    MemberTable.office,
+)
+ASSIGNMENT_COLUMNS = (
+    DutyAssignmentTable.id,
+    DutyAssignmentTable.member_id,
+    DutyAssignmentTable.duty_type,
+    DutyAssignmentTable.assigned_at,
+    DutyAssignmentTable.cycle_id,
+    DutyAssignmentTable.office,
+)
+HISTORY_COLUMNS = (
+    DutyAssignmentTable.id,
+    DutyAssignmentTable.member_id,
+    MemberTable.username,
+    DutyAssignmentTable.duty_type,
+    DutyAssignmentTable.office,
+    DutyAssignmentTable.assigned_at,
+    DutyAssignmentTable.cycle_id,
+    DutyAssignmentTable.period_key,
+    DutyAssignmentTable.completed,
+    DutyAssignmentTable.completed_at,
+)
+
+
+def member_from_row(row: Row[Any]) -> OfficeMember:
     """
-    Get information about the current assignment cycle.
+    The member of a row of MEMBER_COLUMNS, which are in the order of the fields of OfficeMember.
+    """
+    return OfficeMember(*row)
+
+
+def roster_version_query() -> Select[tuple[int, int, int]]:
     """
-    with get_db_session(test_mode) as session:
-        # Get the current cycle ID
-        current_cycle = (
-            session.query(func.max(DutyAssignmentTable.cycle_id))
-            .filter(DutyAssignmentTable.duty_type == duty_type)
-            .scalar()
-            or 0
+    The RosterVersion of the members table, which the cached rosters are checked against.
+    """
+    return select(
+        func.count(MemberTable.id).label("member_count"),
+        func.coalesce(func.max(MemberTable.id), 0).label("max_member_id"),
+        func.coalesce(func.sum(MemberTable.row_version), 0).label("row_version_sum"),
+    )
+
+
+def cycle_query(duty_type: str, office: str, period_key: str | None) -> Select[Any]:
+    """
+    The current cycle of a duty in an office, the members assigned in it (a row each), the version of the roster
+    and the assignment already made for the period, in a single query.
+    """
+    pointer = (
+        select(DutyCycleTable.cycle_id)
+        .where(DutyCycleTable.office == office, DutyCycleTable.duty_type == duty_type)
+        .scalar_subquery()
+    )
+    current_cycle = select(func.coalesce(pointer, 0).label("cycle_id"), pointer.is_(None).label("is_first")).cte(
+        "current_cycle"
+    )
+    assigned = (
+        select(DutyAssignmentTable.member_id)
+        .join(current_cycle, DutyAssignmentTable.cycle_id == current_cycle.c.cycle_id)
+        .where(DutyAssignmentTable.office == office, DutyAssignmentTable.duty_type == duty_type)
+        .distinct()
+        .cte("assigned")
+    )
+
+    roster_version = roster_version_query().subquery("roster_version")
+    # The assignment already made for the period, if any (at most one, by the unique constraint)
+    existing = (
+        select(
+            DutyAssignmentTable.member_id.label("existing_member_id"),
+            DutyAssignmentTable.cycle_id.label("existing_cycle_id"),
         )
+        .where(
+            DutyAssignmentTable.office == office,
+            DutyAssignmentTable.duty_type == duty_type,
+            DutyAssignmentTable.period_key == period_key,
+        )
+        .subquery("existing")
+    )
 
-        # Get assigned user IDs in current cycle
-        assigned_ids = (
-            session.query(DutyAssignmentTable.member_id)
-            .filter(DutyAssignmentTable.duty_type == duty_type, DutyAssignmentTable.cycle_id == current_cycle)
-            .distinct()
-            .all()
+    return (
+        select(
+            current_cycle.c.cycle_id,
+            current_cycle.c.is_first,
+            roster_version.c.member_count,
+            roster_version.c.max_member_id,
+            roster_version.c.row_version_sum,
+            assigned.c.member_id,
+            existing.c.existing_member_id,
+            existing.c.existing_cycle_id,
         )
+        .select_from(current_cycle)
+        .join(roster_version, true())
+        .outerjoin(assigned, true())
+        .outerjoin(existing, true() if period_key is not None else false())
+    )
+
+
+def already_assigned_result(
+    duty_type: str, period_key: str | None, member: OfficeMember, cycle_id: int
+) -> AssignmentResult:
+    """
+    The result of an assignment for a period that was already assigned to `member`.
+    """
+    logger.info(f"{duty_type} duty for {period_key} was already assigned to {member.username} (ID: {member.id})")
+    return AssignmentResult(
+        success=True,
+        message=f"{duty_type} duty for {period_key} was already assigned to {member.username}",
+        member=member,
+        cycle_id=cycle_id,
+        period_key=period_key,
+        already_assigned=True,
+    )
+
+
+def select_in_cycle(
+    duty_type: str,
+    select_member: Callable[[list[OfficeMember], set[int]], OfficeMember | None],
+    members: list[OfficeMember],
+    assigned_member_ids: set[int],
+    cycle_id: int,
+) -> tuple[OfficeMember | None, int]:
+    """
+    Select the next member and the cycle of the assignment. A new cycle starts once every eligible member had a turn.
+    The stride strategy can give a member with little credit a second turn before that, which stays in the current
+    cycle.
+    """
+    selected_member = select_member(members, assigned_member_ids)
+
+    if selected_member is None or all(member.id in assigned_member_ids for member in members):
+        cycle_id += 1
+        logger.info(f"All users have had a turn for {duty_type}. Started new cycle {cycle_id}")
+
+        if selected_member is None:
+            selected_member = select_member(members, set())
+
+    return selected_member, cycle_id
+
+
+class DutyRepository(Protocol):
+    """
+    Storage of the roster, the assignment history and the notification outbox of one database (prod or dev).
+    """
 
-        return CycleInfo(
-            cycle_id=current_cycle, duty_type=duty_type, assigned_member_ids={row[0] for row in assigned_ids}
+    engine: Engine
+    connections_opened: int
+
+    def session(self) -> AbstractContextManager[Session]: ...
+
+    def dispose(self) -> None: ...
+
+    def lock_duty_type(self, session: Session, duty_type: str) -> None: ...
+
+    def get_office_members(
+        self, coffee_drinkers_only: bool = False, office: str | None = None
+    ) -> list[OfficeMember]: ...
+
+    def get_assignment_history(
+        self, duty_type: str | None = None, office: str | None = None
+    ) -> list[AssignmentRecord]: ...
+
+    def get_period_assignment(
+        self, duty_type: str, period_key: str, office: str = DEFAULT_OFFICE
+    ) -> AssignmentResult | None: ...
+
+    def get_history_version(self) -> HistoryVersion: ...
+
+    def get_history_page(
+        self,
+        duty_type: str | None = None,
+        member_id: int | None = None,
+        limit: int = 50,
+        after: tuple[datetime.datetime, int] | None = None,
+    ) -> HistoryPage: ...
+
+    def complete_assignment(self, assignment_id: int) -> HistoryEntry | None: ...
+
+    def get_current_cycle_info(self, duty_type: str, office: str = DEFAULT_OFFICE) -> CycleInfo: ...
+
+    def start_new_cycle(self, duty_type: str, office: str = DEFAULT_OFFICE) -> CycleInfo: ...
+
+    def record_duty_assignment(
+        self, member_id: int, username: str, duty_type: str, cycle_id: int | None = None, office: str = DEFAULT_OFFICE
+    ) -> AssignmentResult: ...
+
+    def assign_next_member(
+        self,
+        duty_type: str,
+        select_member: Callable[[list[OfficeMember], set[int]], OfficeMember | None],
+        coffee_drinkers_only: bool = False,
+        notification: Callable[[OfficeMember], dict[str, str]] | None = None,
+        period_key: str | None = None,
+        office: str = DEFAULT_OFFICE,
+    ) -> AssignmentResult: ...
+
+    def assign_batch(
+        self,
+        duties: list[DueDuty],
+        select_member: Callable[[list[OfficeMember], set[int]], OfficeMember | None],
+        notification: Callable[[str, OfficeMember], dict[str, str]] | None = None,
+        offices: list[str] | None = None,
+    ) -> BatchAssignmentResult: ...
+
+
+class SqlRepository:
+    """
+    Repository on a SQLAlchemy engine. The queries are portable, backends only differ in how they connect
+    and how they serialise concurrent assignments.
+    """
+
+    def __init__(self, engine: Engine, test_mode: bool) -> None:
+        self.engine = engine
+        self.test_mode = test_mode
+        self.session_factory = sessionmaker(bind=engine)
+        self.connections_opened = 0
+        self.roster_cache = RosterCache()
+        event.listen(engine, "connect", self._on_connect)
+
+    def _on_connect(self, dbapi_connection: Any, connection_record: Any) -> None:
+        self.connections_opened += 1
+
+    @contextmanager
+    def session(self) -> Generator[Session, Any, None]:
+        """
+        Context manager for database sessions.
+        """
+        session = self.session_factory()
+
+        try:
+            yield session
+            with span("database.commit"):
+                session.commit()
+        except Exception as e:
+            logger.error(f"Database error: {e}")
+            session.rollback()
+            if is_auth_error(e):
+                # The connection string was probably rotated, make sure the next attempt picks up the new one
+                refresh_database_credentials(self.test_mode)
+            raise
+        finally:
+            session.close()
+
+    def dispose(self) -> None:
+        self.engine.dispose()
+
+    def lock_duty_type(self, session: Session, duty_type: str) -> None:
+        """
+        Serialise assignments of the same duty type until the end of the transaction.
+        """
+
+    def get_office_members(self, coffee_drinkers_only: bool = False, office: str | None = None) -> list[OfficeMember]:
+        """
+        Fetch office members from database, of all offices or of the given one.
+        """
+        with self.session() as session:
+            version = RosterVersion(*session.execute(roster_version_query()).one())
+            return self._get_roster(session, version, coffee_drinkers_only, office)
+
+    def _get_roster(
+        self, session: Session, version: RosterVersion, coffee_drinkers_only: bool, office: str | None = None
+    ) -> list[OfficeMember]:
+        """
+        Active members of the given roster version, from the cache if this instance already read that version.
+        """
+        members = self.roster_cache.get(version, coffee_drinkers_only)
+        if members is None:
+            with span("database.roster_query"):
+                rows = session.execute(select(*MEMBER_COLUMNS).where(MemberTable.active == True))
+                roster = [member_from_row(row) for row in rows]
+            self.roster_cache.store(version, roster)
+            members = [member for member in roster if member.coffee_drinker or not coffee_drinkers_only]
+
+        if office is not None:
+            return [member for member in members if member.office == office]
+        return members
+
+    def _get_member(self, session: Session, member_id: int, version: RosterVersion | None = None) -> OfficeMember:
+        """
+        A member by id, from the cached roster of the given version if the member is in it.
+        """
+        if version is not None:
+            for member in self.roster_cache.get(version) or []:
+                if member.id == member_id:
+                    return member
+
+        return member_from_row(session.execute(select(*MEMBER_COLUMNS).where(MemberTable.id == member_id)).one())
+
+    def get_period_assignment(
+        self, duty_type: str, period_key: str, office: str = DEFAULT_OFFICE
+    ) -> AssignmentResult | None:
+        """
+        The assignment recorded for a duty period, or None if the duty wasn't assigned for it yet.
+        """
+        with self.session() as session:
+            row = session.execute(
+                select(DutyAssignmentTable.member_id, DutyAssignmentTable.cycle_id).where(
+                    DutyAssignmentTable.office == office,
+                    DutyAssignmentTable.duty_type == duty_type,
+                    DutyAssignmentTable.period_key == period_key,
+                )
+            ).one_or_none()
+            if row is None:
+                return None
+            return already_assigned_result(
+                duty_type, period_key, self._get_member(session, row.member_id), row.cycle_id
+            )
+
+    def get_assignment_history(self, duty_type: str | None = None, office: str | None = None) -> list[AssignmentRecord]:
+        """
+        All assignments (of a duty type, in an office) in the order in which they were made, as lightweight records.
+        """
+        query = select(*ASSIGNMENT_COLUMNS).order_by(DutyAssignmentTable.assigned_at, DutyAssignmentTable.id)
+        if duty_type is not None:
+            query = query.where(DutyAssignmentTable.duty_type == duty_type)
+        if office is not None:
+            query = query.where(DutyAssignmentTable.office == office)
+
+        with self.session() as session:
+            return [AssignmentRecord(*row) for row in session.execute(query)]
+
+    def get_history_version(self) -> HistoryVersion:
+        """
+        The current version of the assignment history, from two index lookups and the row versions of the members
+        and the cycle pointers.
+        """
+        with self.session() as session:
+            return HistoryVersion(
+                *session.execute(
+                    select(
+                        func.coalesce(select(func.max(DutyAssignmentTable.id)).scalar_subquery(), 0),
+                        select(func.max(DutyAssignmentTable.completed_at)).scalar_subquery(),
+                        func.coalesce(select(func.sum(MemberTable.row_version)).scalar_subquery(), 0),
+                        func.coalesce(select(func.sum(DutyCycleTable.row_version)).scalar_subquery(), 0),
+                    )
+                ).one()
+            )
+
+    def get_history_page(
+        self,
+        duty_type: str | None = None,
+        member_id: int | None = None,
+        limit: int = 50,
+        after: tuple[datetime.datetime, int] | None = None,
+    ) -> HistoryPage:
+        """
+        A page of the assignment history (of a duty type, of a member), newest first, continuing after the given
+        (assigned_at, id). The position is compared as a row value, so the page is read from the index without
+        skipping the rows of earlier pages, however deep it is. Assignments without assigned_at aren't listed.
+        """
+        query = (
+            select(*HISTORY_COLUMNS)
+            .join(MemberTable, MemberTable.id == DutyAssignmentTable.member_id)
+            .where(DutyAssignmentTable.assigned_at.is_not(None))
+            .order_by(DutyAssignmentTable.assigned_at.desc(), DutyAssignmentTable.id.desc())
+            # One more than requested, to know whether there is a next page
+            .limit(limit + 1)
         )
+        if duty_type is not None:
+            query = query.where(DutyAssignmentTable.duty_type == duty_type)
+        if member_id is not None:
+            query = query.where(DutyAssignmentTable.member_id == member_id)
+        if after is not None:
+            query = query.where(tuple_(DutyAssignmentTable.assigned_at, DutyAssignmentTable.id) < after)
+
+        with self.session() as session:
+            entries = [HistoryEntry(*row) for row in session.execute(query)]
+
+        if len(entries) <= limit:
+            return HistoryPage(entries)
+        entries = entries[:limit]
+        return HistoryPage(entries, next_position=(entries[-1].assigned_at, entries[-1].id))
+
+    def complete_assignment(self, assignment_id: int) -> HistoryEntry | None:
+        """
+        Mark an assignment as completed, or None if it doesn't exist. Completing it again keeps the first
+        completion time.
+        """
+        with self.session() as session:
+            session.execute(
+                update(DutyAssignmentTable)
+                .where(DutyAssignmentTable.id == assignment_id, DutyAssignmentTable.completed_at.is_(None))
+                .values(completed=True, completed_at=utcnow())
+            )
+            row = session.execute(
+                select(*HISTORY_COLUMNS)
+                .join(MemberTable, MemberTable.id == DutyAssignmentTable.member_id)
+                .where(DutyAssignmentTable.id == assignment_id)
+            ).one_or_none()
+            return HistoryEntry(*row) if row is not None else None
+
+    def get_current_cycle_info(self, duty_type: str, office: str = DEFAULT_OFFICE) -> CycleInfo:
+        """
+        Get information about the current assignment cycle.
+        """
+        with self.session() as session:
+            # Get the current cycle ID
+            current_cycle = _get_current_cycle_id(session, duty_type, office) or 0
+
+            # Get assigned user IDs in current cycle
+            assigned_ids = (
+                session.query(DutyAssignmentTable.member_id)
+                .filter(
+                    DutyAssignmentTable.office == office,
+                    DutyAssignmentTable.duty_type == duty_type,
+                    DutyAssignmentTable.cycle_id == current_cycle,
+                )
+                .distinct()
+                .all()
+            )
+
+            return CycleInfo(
+                cycle_id=current_cycle,
+                duty_type=duty_type,
+                assigned_member_ids={row[0] for row in assigned_ids},
+                office=office,
+            )
+
+    def start_new_cycle(self, duty_type: str, office: str = DEFAULT_OFFICE) -> CycleInfo:
+        """
+        Start a new assignment cycle and return the cycle info.
+        """
+        with self.session() as session:
+            self.lock_duty_type(session, duty_type)
+            new_cycle_id = (_get_current_cycle_id(session, duty_type, office) or 0) + 1
+            _set_current_cycle_id(session, duty_type, new_cycle_id, office)
+            logger.info(f"Started new cycle {new_cycle_id} for {duty_type} in {office}")
+
+            return CycleInfo(cycle_id=new_cycle_id, duty_type=duty_type, assigned_member_ids=set(), office=office)
+
+    def record_duty_assignment(
+        self, member_id: int, username: str, duty_type: str, cycle_id: int | None = None, office: str = DEFAULT_OFFICE
+    ) -> AssignmentResult:
+        """
+        Record a duty assignment in the database.
+        """
+        try:
+            with self.session() as session:
+                # If no cycle_id provided, get the current one
+                current_cycle_id = _get_current_cycle_id(session, duty_type, office)
+                if cycle_id is None:
+                    cycle_id = current_cycle_id or 1
+                if current_cycle_id is None or cycle_id > current_cycle_id:
+                    _set_current_cycle_id(session, duty_type, cycle_id, office)
+
+                # Create new assignment
+                assignment_record = DutyAssignmentTable(
+                    member_id=member_id, duty_type=duty_type, cycle_id=cycle_id, office=office
+                )
+                session.add(assignment_record)
+                session.commit()
+                logger.info(f"Recorded {duty_type} assignment for {username} (ID: {member_id}) in cycle {cycle_id}")
+
+                return AssignmentResult(
+                    success=True,
+                    message=f"Successfully assigned {duty_type} duty to {username}",
+                )
+
+        except Exception as e:
+            logger.error(f"Failed to record assignment: {e}")
+            return AssignmentResult(
+                success=False,
+                message=f"Failed to record assignment: {str(e)}",
+            )
+
+    def assign_next_member(
+        self,
+        duty_type: str,
+        select_member: Callable[[list[OfficeMember], set[int]], OfficeMember | None],
+        coffee_drinkers_only: bool = False,
+        notification: Callable[[OfficeMember], dict[str, str]] | None = None,
+        period_key: str | None = None,
+        office: str = DEFAULT_OFFICE,
+    ) -> AssignmentResult:
+        """
+        Select and record the next member of an office for a duty in a single transaction.
+        The roster and the members assigned in the current cycle are read in one query, and concurrent
+        assignments of the same duty type wait for each other, so two triggers can't pick the same member.
+        If `notification` is given, the payload it builds for the selected member is added to the outbox
+        in the same transaction. If `period_key` is given and the duty was already assigned for that period,
+        the stored assignment is returned with `already_assigned` set, without assigning or notifying again.
+        """
+        try:
+            with self.session() as session:
+                # The first statement also checks a connection out of the pool (or opens one on a cold start)
+                with span("database.lock"):
+                    self.lock_duty_type(session, duty_type)
 
+                # One round trip for the cycle, the members assigned in it, the version of the roster and the
+                # assignment of the period
+                with span("database.cycle_query"):
+                    rows = session.execute(cycle_query(duty_type, office, period_key)).all()
 
-def start_new_cycle(duty_type: DutyType, test_mode: bool = False) -> CycleInfo:
+                cycle_id = rows[0].cycle_id
+                version = RosterVersion(rows[0].member_count, rows[0].max_member_id, rows[0].row_version_sum)
+                if rows[0].existing_member_id is not None:
+                    member = self._get_member(session, rows[0].existing_member_id, version)
+                    return already_assigned_result(duty_type, period_key, member, rows[0].existing_cycle_id)
+
+                members = self._get_roster(session, version, coffee_drinkers_only, office)
+                if not members:
+                    return AssignmentResult(success=False, message=f"No members eligible for {duty_type} duty")
+
+                assigned_member_ids = {row.member_id for row in rows if row.member_id is not None}
+                with span("database.select_member"):
+                    selected_member, cycle_id = select_in_cycle(
+                        duty_type, select_member, members, assigned_member_ids, cycle_id
+                    )
+
+                if selected_member is None:
+                    return AssignmentResult(
+                        success=False, message=f"No users available for {duty_type} duty after cycle reset"
+                    )
+
+                with span("database.insert"):
+                    if rows[0].is_first or cycle_id != rows[0].cycle_id:
+                        _set_current_cycle_id(session, duty_type, cycle_id, office)
+
+                    assignment_record = DutyAssignmentTable(
+                        member_id=selected_member.id,
+                        duty_type=duty_type,
+                        cycle_id=cycle_id,
+                        period_key=period_key,
+                        office=office,
+                    )
+                    session.add(assignment_record)
+                    duty_credit = charged_credit(selected_member, members)
+                    session.execute(
+                        update(MemberTable)
+                        .where(MemberTable.id == selected_member.id)
+                        .values(duty_credit=duty_credit, row_version=MemberTable.row_version + 1)
+                    )
+                    session.flush()
+                    # If the transaction fails after all, the cached version doesn't match and the roster is read again
+                    self.roster_cache.update_member(
+                        version, dataclasses.replace(selected_member, duty_credit=duty_credit)
+                    )
+
+                    if notification is not None:
+                        session.add(
+                            NotificationOutboxTable(
+                                dedupe_key=f"assignment:{assignment_record.id}", payload=notification(selected_member)
+                            )
+                        )
+                logger.info(
+                    f"Recorded {duty_type} assignment for {selected_member.username} (ID: {selected_member.id}) "
+                    f"in cycle {cycle_id}"
+                )
+
+                return AssignmentResult(
+                    success=True,
+                    message=f"Successfully assigned {duty_type} duty to {selected_member.username}",
+                    member=selected_member,
+                    cycle_id=cycle_id,
+                    period_key=period_key,
+                )
+
+        except Exception as e:
+            if isinstance(e, IntegrityError) and period_key is not None:
+                # Another instance recorded an assignment for the period first
+                result = self.get_period_assignment(duty_type, period_key, office)
+                if result is not None:
+                    return result
+            logger.error(f"Failed to assign {duty_type} duty: {e}")
+            return AssignmentResult(
+                success=False,
+                message=f"Failed to assign {duty_type} duty: {str(e)}",
+            )
+
+    def assign_batch(
+        self,
+        duties: list[DueDuty],
+        select_member: Callable[[list[OfficeMember], set[int]], OfficeMember | None],
+        notification: Callable[[str, OfficeMember], dict[str, str]] | None = None,
+        offices: list[str] | None = None,
+    ) -> BatchAssignmentResult:
+        """
+        Select and record the next member of every office (by default all offices with active members) for every
+        duty, in a single transaction. The cycles, the members assigned in them and the assignments of the periods
+        are read with one query each for all offices, and the assignments, credits, cycle pointers and notifications
+        are written with one multi-row statement each, so the number of round trips doesn't grow with the number
+        of offices. Duties that were already assigned for their period in an office are returned as they are.
+        """
+        if not duties:
+            return BatchAssignmentResult(success=True, message="No duties to assign")
+
+        duty_types = [duty.duty_type for duty in duties]
+        try:
+            with self.session() as session:
+                with span("database.lock"):
+                    # In a fixed order, so batches and single assignments can't deadlock
+                    for duty_type in sorted(duty_types):
+                        self.lock_duty_type(session, duty_type)
+
+                with span("database.cycle_query"):
+                    version = RosterVersion(*session.execute(roster_version_query()).one())
+                    pointers = {
+                        (row.office, row.duty_type): row.cycle_id
+                        for row in session.execute(
+                            select(DutyCycleTable.office, DutyCycleTable.duty_type, DutyCycleTable.cycle_id).where(
+                                DutyCycleTable.duty_type.in_(duty_types)
+                            )
+                        )
+                    }
+                    assigned: dict[tuple[str, str], set[int]] = defaultdict(set)
+                    for row in session.execute(
+                        select(DutyAssignmentTable.office, DutyAssignmentTable.duty_type, DutyAssignmentTable.member_id)
+                        .join(
+                            DutyCycleTable,
+                            and_(
+                                DutyCycleTable.office == DutyAssignmentTable.office,
+                                DutyCycleTable.duty_type == DutyAssignmentTable.duty_type,
+                                DutyCycleTable.cycle_id == DutyAssignmentTable.cycle_id,
+                            ),
+                        )
+                        .where(DutyAssignmentTable.duty_type.in_(duty_types))
+                        .distinct()
+                    ):
+                        assigned[row.office, row.duty_type].add(row.member_id)
+
+                    existing: dict[tuple[str, str], tuple[int, int]] = {}
+                    periods = [
+                        and_(
+                            DutyAssignmentTable.duty_type == duty.duty_type,
+                            DutyAssignmentTable.period_key == duty.period_key,
+                        )
+                        for duty in duties
+                        if duty.period_key is not None
+                    ]
+                    if periods:
+                        for existing_row in session.execute(
+                            select(
+                                DutyAssignmentTable.office,
+                                DutyAssignmentTable.duty_type,
+                                DutyAssignmentTable.member_id,
+                                DutyAssignmentTable.cycle_id,
+                            ).where(or_(*periods))
+                        ):
+                            existing[existing_row.office, existing_row.duty_type] = (
+                                existing_row.member_id,
+                                existing_row.cycle_id,
+                            )
+
+                roster = self._get_roster(session, version, coffee_drinkers_only=False)
+                # Members with the credit charged earlier in this batch, when one gets several duties
+                current = {member.id: member for member in roster}
+                office_members: dict[str, list[int]] = defaultdict(list)
+                for member in roster:
+                    office_members[member.office].append(member.id)
+
+                assignments: list[tuple[DueDuty, OfficeMember, int]] = []
+                cycle_inserts: list[dict[str, Any]] = []
+                cycle_updates: list[dict[str, Any]] = []
+                results: dict[str, dict[str, AssignmentResult]] = defaultdict(dict)
+                with span("database.select_member"):
+                    for office in offices if offices is not None else sorted(office_members):
+                        for duty in duties:
+                            key = (office, duty.duty_type)
+                            if key in existing:
+                                member_id, cycle_id = existing[key]
+                                member = current.get(member_id) or self._get_member(session, member_id)
+                                results[office][duty.duty_type] = already_assigned_result(
+                                    duty.duty_type, duty.period_key, member, cycle_id
+                                )
+                                continue
+
+                            members = [
+                                current[member_id]
+                                for member_id in office_members[office]
+                                if current[member_id].coffee_drinker or not duty.coffee_drinkers_only
+                            ]
+                            cycle_id = pointers.get(key, 0)
+                            selected, new_cycle_id = (
+                                select_in_cycle(duty.duty_type, select_member, members, assigned[key], cycle_id)
+                                if members
+                                else (None, cycle_id)
+                            )
+                            if selected is None:
+                                results[office][duty.duty_type] = AssignmentResult(
+                                    success=False, message=f"No members eligible for {duty.duty_type} duty in {office}"
+                                )
+                                continue
+
+                            if key not in pointers:
+                                cycle_inserts.append(
+                                    {"office": office, "duty_type": duty.duty_type, "cycle_id": new_cycle_id}
+                                )
+                            elif new_cycle_id != cycle_id:
+                                cycle_updates.append(
+                                    {"office": office, "duty_type": duty.duty_type, "cycle_id": new_cycle_id}
+                                )
+
+                            selected = dataclasses.replace(selected, duty_credit=charged_credit(selected, members))
+                            current[selected.id] = selected
+                            assignments.append((duty, selected, new_cycle_id))
+
+                if assignments:
+                    with span("database.insert"):
+                        self._insert_batch(session, assignments, cycle_inserts, cycle_updates, notification)
+                    # If the transaction fails after all, the cached version doesn't match and the roster is read again
+                    self.roster_cache.update_members(version, [member for _, member, _ in assignments])
+
+                for duty, member, cycle_id in assignments:
+                    results[member.office][duty.duty_type] = AssignmentResult(
+                        success=True,
+                        message=f"Successfully assigned {duty.duty_type} duty to {member.username}",
+                        member=member,
+                        cycle_id=cycle_id,
+                        period_key=duty.period_key,
+                    )
+                logger.info(f"Recorded {len(assignments)} assignments in {len(results)} offices")
+
+                return BatchAssignmentResult(
+                    success=True, message=f"Assigned {len(assignments)} duties", assignments=dict(results)
+                )
+
+        except Exception as e:
+            logger.error(f"Failed to assign {', '.join(duty_types)} duties: {e}")
+            return BatchAssignmentResult(success=False, message=f"Failed to assign duties: {str(e)}")
+
+    def _insert_batch(
+        self,
+        session: Session,
+        assignments: list[tuple[DueDuty, OfficeMember, int]],
+        cycle_inserts: list[dict[str, Any]],
+        cycle_updates: list[dict[str, Any]],
+        notification: Callable[[str, OfficeMember], dict[str, str]] | None,
+    ) -> None:
+        """
+        Write the assignments of a batch, and everything that changes with them, with one statement per table.
+        """
+        if cycle_inserts:
+            session.execute(insert(DutyCycleTable), cycle_inserts)
+        if cycle_updates:
+            # A single UPDATE with CASE, executemany would be a round trip per row on psycopg2
+            conditions = [
+                (
+                    and_(DutyCycleTable.office == row["office"], DutyCycleTable.duty_type == row["duty_type"]),
+                    row["cycle_id"],
+                )
+                for row in cycle_updates
+            ]
+            session.execute(
+                update(DutyCycleTable)
+                .where(or_(*(condition for condition, _ in conditions)))
+                .values(cycle_id=case(*conditions, else_=DutyCycleTable.cycle_id))
+            )
+
+        # Mapped back by office and duty type, which are unique within a batch, so the rows can come back in any order
+        assignment_ids = {
+            (row.office, row.duty_type): row.id
+            for row in session.execute(
+                insert(DutyAssignmentTable).returning(
+                    DutyAssignmentTable.id, DutyAssignmentTable.office, DutyAssignmentTable.duty_type
+                ),
+                [
+                    {
+                        "member_id": member.id,
+                        "duty_type": duty.duty_type,
+                        "cycle_id": cycle_id,
+                        "period_key": duty.period_key,
+                        "office": member.office,
+                    }
+                    for duty, member, cycle_id in assignments
+                ],
+            )
+        }
+
+        # One row per member with the final credit, also if the member got several duties
+        credits = {member.id: member.duty_credit for _, member, _ in assignments}
+        session.execute(
+            update(MemberTable)
+            .where(MemberTable.id.in_(credits))
+            .values(
+                duty_credit=case(credits, value=MemberTable.id, else_=MemberTable.duty_credit),
+                row_version=MemberTable.row_version + 1,
+            )
+            .execution_options(synchronize_session=False)
+        )
+
+        if notification is not None:
+            session.execute(
+                insert(NotificationOutboxTable),
+                [
+                    {
+                        "dedupe_key": f"assignment:{assignment_ids[member.office, duty.duty_type]}",
+                        "payload": notification(duty.duty_type, member),
+                    }
+                    for duty, member, _ in assignments
+                ],
+            )
+
+
+class PostgresRepository(SqlRepository):
     """
-    Start a new assignment cycle and return the cycle info.
+    The Neon database, with the connection string from Secret Manager and a pool sized for Cloud Run.
     """
-    with get_db_session(test_mode) as session:
-        # Get the current max cycle ID
-        current_max = (
-            session.query(func.max(DutyAssignmentTable.cycle_id))
-            .filter(DutyAssignmentTable.duty_type == duty_type)
-            .scalar()
-            or 0
+
+    def __init__(self, test_mode: bool) -> None:
+        database_url = get_database_url(test_mode)
+        with span("database.create_engine"):
+            engine = create_engine(
+                database_url,
+                poolclass=QueuePool,
+                pool_size=DB_POOL_SIZE,
+                max_overflow=DB_MAX_OVERFLOW,
+                pool_timeout=DB_POOL_TIMEOUT,
+                pool_recycle=DB_POOL_RECYCLE,
+                pool_pre_ping=DB_POOL_PRE_PING,
+            )
+        super().__init__(engine, test_mode)
+
+    def lock_duty_type(self, session: Session, duty_type: str) -> None:
+        # Tests point the connection string at SQLite, which has no advisory locks
+        if session.get_bind().dialect.name == "postgresql":
+            session.execute(select(func.pg_advisory_xact_lock(func.hashtext(f"duty:{duty_type}"))))
+
+
+class SqliteRepository(SqlRepository):
+    """
+    A local SQLite database (or an in-memory one) for dry runs, local development and tests, without network
+    access. The schema is created on first use.
+    """
+
+    def __init__(self, test_mode: bool, path: str | None = None) -> None:
+        if path is None:
+            # One connection shared by all threads, as every connection to ":memory:" is a separate database
+            engine = create_engine("sqlite://", poolclass=StaticPool, connect_args={"check_same_thread": False})
+        else:
+            engine = create_engine(f"sqlite:///{path}", connect_args={"check_same_thread": False})
+        super().__init__(engine, test_mode)
+        Base.metadata.create_all(engine)
+
+    def lock_duty_type(self, session: Session, duty_type: str) -> None:
+        # SQLite has no row or advisory locks, a no-op write takes the database write lock for the transaction
+        session.execute(
+            update(DutyCycleTable).where(DutyCycleTable.duty_type == duty_type).values(cycle_id=DutyCycleTable.cycle_id)
         )
 
-        new_cycle_id = current_max + 1
-        logger.info(f"Started new cycle {new_cycle_id} for {duty_type}")
 
-        return CycleInfo(cycle_id=new_cycle_id, duty_type=duty_type, assigned_member_ids=set())
+def get_storage_backend(test_mode: bool = False) -> StorageBackend:
+    if test_mode and TEST_MODE_STORAGE_BACKEND is not None:
+        return TEST_MODE_STORAGE_BACKEND
+    return STORAGE_BACKEND
+
+
+def _create_repository(test_mode: bool) -> DutyRepository:
+    backend = get_storage_backend(test_mode)
+    if backend == StorageBackend.SQLITE:
+        filename = "java_janitor_dev.db" if test_mode else "java_janitor.db"
+        return SqliteRepository(test_mode, os.path.join(SQLITE_DIRECTORY, filename))
+    if backend == StorageBackend.MEMORY:
+        return SqliteRepository(test_mode)
+    return PostgresRepository(test_mode)
+
+
+# One repository per database (prod/dev), shared by all sessions of a (warm) instance
+_repositories: dict[bool, DutyRepository] = {}
+_repositories_lock = threading.Lock()
+
+
+def get_repository(test_mode: bool = False) -> DutyRepository:
+    """
+    Get the repository of the prod or dev database on the configured storage backend, creating it on first use.
+    """
+    repository = _repositories.get(test_mode)
+    if repository is not None:
+        return repository
+
+    with _repositories_lock:
+        # Another thread may have created the repository while we were waiting for the lock
+        repository = _repositories.get(test_mode)
+        if repository is None:
+            repository = _create_repository(test_mode)
+            _repositories[test_mode] = repository
+            logger.info(f"Created {get_storage_backend(test_mode)} repository ({'dev' if test_mode else 'prod'})")
+
+        return repository
+
+
+def get_engine(test_mode: bool = False) -> Engine:
+    """
+    Get the pooled engine for the prod or dev database, creating it on first use.
+    """
+    return get_repository(test_mode).engine
+
+
+def dispose_engines() -> None:
+    """
+    Close all pooled connections and forget the repositories, e.g. after the connection string changed.
+    """
+    with _repositories_lock:
+        for repository in _repositories.values():
+            repository.dispose()
+        _repositories.clear()
+
+
+def get_pool_stats() -> dict[str, dict[str, int | str]]:
+    """
+    Get connection pool statistics per database, to check that warm starts reuse connections.
+    """
+    stats: dict[str, dict[str, int | str]] = {}
+    for test_mode, repository in list(_repositories.items()):
+        pool = repository.engine.pool
+        database = "dev" if test_mode else "prod"
+        if isinstance(pool, QueuePool):
+            stats[database] = {
+                "size": pool.size(),
+                "checked_in": pool.checkedin(),
+                "checked_out": pool.checkedout(),
+                "overflow": pool.overflow(),
+                "connections_opened": repository.connections_opened,
+            }
+        else:
+            stats[database] = {"status": pool.status(), "connections_opened": repository.connections_opened}
+
+    return stats
+
+
+def get_db_session(test_mode: bool = False) -> AbstractContextManager[Session]:
+    """
+    Context manager for database sessions.
+    """
+    return get_repository(test_mode).session()
+
+
+def get_office_members(
+    coffee_drinkers_only: bool = False, office: str | None = None, test_mode: bool = False
+) -> list[OfficeMember]:
+    """
+    Fetch office members from database, of all offices or of the given one.
+    """
+    return get_repository(test_mode).get_office_members(coffee_drinkers_only, office)
+
+
+def get_assignment_history(
+    duty_type: str | None = None, office: str | None = None, test_mode: bool = False
+) -> list[AssignmentRecord]:
+    """
+    Fetch the assignment history, e.g. for exports.
+    """
+    return get_repository(test_mode).get_assignment_history(duty_type, office)
+
+
+def get_history_version(test_mode: bool = False) -> HistoryVersion:
+    """
+    The current version of the assignment history, see SqlRepository.get_history_version.
+    """
+    return get_repository(test_mode).get_history_version()
+
+
+def get_history_page(
+    duty_type: str | None = None,
+    member_id: int | None = None,
+    limit: int = 50,
+    after: tuple[datetime.datetime, int] | None = None,
+    test_mode: bool = False,
+) -> HistoryPage:
+    """
+    A page of the assignment history, newest first, see SqlRepository.get_history_page.
+    """
+    return get_repository(test_mode).get_history_page(duty_type, member_id, limit, after)
+
+
+def complete_assignment(assignment_id: int, test_mode: bool = False) -> HistoryEntry | None:
+    """
+    Mark an assignment as completed, see SqlRepository.complete_assignment.
+    """
+    return get_repository(test_mode).complete_assignment(assignment_id)
+
+
+def get_current_cycle_info(duty_type: str, office: str = DEFAULT_OFFICE, test_mode: bool = False) -> CycleInfo:
+    """
+    Get information about the current assignment cycle.
+    """
+    return get_repository(test_mode).get_current_cycle_info(duty_type, office)
+
+
+def start_new_cycle(duty_type: str, office: str = DEFAULT_OFFICE, test_mode: bool = False) -> CycleInfo:
+    """
+    Start a new assignment cycle and return the cycle info.
+    """
+    return get_repository(test_mode).start_new_cycle(duty_type, office)
 
 
 def record_duty_assignment(
-    member_id: int, username: str, duty_type: DutyType, cycle_id: int | None = None, test_mode: bool = False
+    member_id: int,
+    username: str,
+    duty_type: str,
+    cycle_id: int | None = None,
+    office: str = DEFAULT_OFFICE,
+    test_mode: bool = False,
 ) -> AssignmentResult:
     """
     Record a duty assignment in the database.
     """
-    try:
-        with get_db_session(test_mode) as session:
-            # If no cycle_id provided, get the current one
-            if cycle_id is None:
-                cycle_id = (
-                    session.query(func.max(DutyAssignmentTable.cycle_id))
-                    .filter(DutyAssignmentTable.duty_type == duty_type)
-                    .scalar()
-                    or 1
-                )
+    return get_repository(test_mode).record_duty_assignment(member_id, username, duty_type, cycle_id, office)
 
-            # Create new assignment
-            assignment_record = DutyAssignmentTable(member_id=member_id, duty_type=duty_type, cycle_id=cycle_id)
-            session.add(assignment_record)
-            session.commit()
-            logger.info(f"Recorded {duty_type} assignment for {username} (ID: {member_id}) in cycle {cycle_id}")
 
-            return AssignmentResult(
-                success=True,
-                message=f"Successfully assigned {duty_type} duty to {username}",
-            )
+def assign_next_member(
+    duty_type: str,
+    select_member: Callable[[list[OfficeMember], set[int]], OfficeMember | None],
+    coffee_drinkers_only: bool = False,
+    notification: Callable[[OfficeMember], dict[str, str]] | None = None,
+    period_key: str | None = None,
+    office: str = DEFAULT_OFFICE,
+    test_mode: bool = False,
+) -> AssignmentResult:
+    """
+    Select and record the next member for a duty in a single transaction, see DutyRepository.assign_next_member.
+    """
+    return get_repository(test_mode).assign_next_member(
+        duty_type, select_member, coffee_drinkers_only, notification, period_key, office
+    )
 
-    except Exception as e:
-        logger.error(f"Failed to record assignment: {e}")
-        return AssignmentResult(
-            success=False,
-            message=f"Failed to record assignment: {str(e)}",
-        )
+
+def assign_batch(
+    duties: list[DueDuty],
+    select_member: Callable[[list[OfficeMember], set[int]], OfficeMember | None],
+    notification: Callable[[str, OfficeMember], dict[str, str]] | None = None,
+    offices: list[str] | None = None,
+    test_mode: bool = False,
+) -> BatchAssignmentResult:
+    """
+    Select and record the next member of every office for every duty in a single transaction,
+    see DutyRepository.assign_batch.
+    """
+    return get_repository(test_mode).assign_batch(duties, select_member, notification, offices)
@@ -0,0 +1,136 @@
+import json
+import os
+import threading
+from dataclasses import dataclass, field
+from enum import StrEnum
+from pathlib import Path
+from typing import Any
+
+# Duty definitions, see duties.json for the format
+DUTIES_CONFIG = os.environ.get("DUTIES_CONFIG", str(Path(__file__).resolve().parent / "duties.json"))
+
+# Office of members and assignments that were added before offices were introduced
+DEFAULT_OFFICE = "default"
+
+WEEKDAYS = ["monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday"]
+
+_registry: "dict[str, DutyDefinition] | None" = None
+_registry_lock = threading.Lock()
+
+
+class DutyType(StrEnum):
+    """
+    Duties of the default configuration, which have their own functions. Other duties only need a definition.
+    """
+
+    COFFEE = "coffee"
+    FRIDGE = "fridge"
+
+
+class Eligibility(StrEnum):
+    ALL = "all"
+    COFFEE_DRINKERS = "coffee_drinkers"
+
+
+class ScheduleRuleType(StrEnum):
+    ODD_ISO_WEEK = "odd_iso_week"
+    LAST_WEEKDAY_OF_MONTH = "last_weekday_of_month"
+
+
+@dataclass
+class DutyConfig:
+    coffee_drinkers_only: bool
+    duty_name: str
+
+
+@dataclass(frozen=True)
+class DutyDefinition:
+    """
+    A duty: who is eligible, when it runs and how the assignment is announced.
+    The message template can use {greeting} (a random one of `greetings`) and {mention} (the assignee).
+    """
+
+    duty_type: str
+    duty_name: str
+    eligibility: Eligibility
+    schedule_rule: ScheduleRuleType
+    weekday: int
+    message: str
+    greetings: tuple[str, ...]
+    channel: str
+    test_channel: str
+    # Channel per office, offices that aren't listed are announced in `channel`
+    office_channels: dict[str, str] = field(default_factory=dict)
+
+    @property
+    def coffee_drinkers_only(self) -> bool:
+        return self.eligibility == Eligibility.COFFEE_DRINKERS
+
+    def get_channel(self, office: str = DEFAULT_OFFICE) -> str:
+        return self.office_channels.get(office, self.channel)
+
+    @classmethod
+    def from_dict(cls, data: dict[str, Any]) -> "DutyDefinition":
+        """
+        Parse a definition from the config file, raising ValueError if it is incomplete or invalid.
+        """
+        try:
+            schedule = data["schedule"]
+            if len(data["duty_type"]) > 20:
+                raise ValueError(f"Duty type {data['duty_type']} is longer than 20 characters")
+            weekday = schedule["weekday"].lower()
+            if weekday not in WEEKDAYS:
+                raise ValueError(f"Unknown weekday {schedule['weekday']}")
+
+            return cls(
+                duty_type=data["duty_type"],
+                duty_name=data["duty_name"],
+                eligibility=Eligibility(data.get("eligibility", Eligibility.ALL)),
+                schedule_rule=ScheduleRuleType(schedule["rule"]),
+                weekday=WEEKDAYS.index(weekday),
+                message=data["message"],
+                greetings=tuple(data.get("greetings") or ["Hello everyone!"]),
+                channel=data["channel"],
+                test_channel=data["test_channel"],
+                office_channels=dict(data.get("office_channels", {})),
+            )
+        except KeyError as e:
+            raise ValueError(f"Duty definition {data.get('duty_type')} is missing {e}") from e
+
+
+def load_duty_registry(path: str = DUTIES_CONFIG) -> dict[str, DutyDefinition]:
+    """
+    Read the duty definitions from a JSON config file, keyed by duty type.
+    """
+    with open(path, encoding="utf-8") as file:
+        config = json.load(file)
+
+    registry: dict[str, DutyDefinition] = {}
+    for data in config["duties"]:
+        definition = DutyDefinition.from_dict(data)
+        if definition.duty_type in registry:
+            raise ValueError(f"Duty type {definition.duty_type} is defined twice in {path}")
+        registry[definition.duty_type] = definition
+
+    return registry
+
+
+def get_duty_registry() -> dict[str, DutyDefinition]:
+    """
+    Get the duty definitions, read once per instance.
+    """
+    global _registry
+
+    if _registry is None:
+        with _registry_lock:
+            if _registry is None:
+                _registry = load_duty_registry()
+
+    return _registry
+
+
+def get_duty_definition(duty_type: str) -> DutyDefinition:
+    definition = get_duty_registry().get(duty_type)
+    if definition is None:
+        raise ValueError(f"Unknown duty type {duty_type}")
+    return definition
@@ -0,0 +1,203 @@
+import bisect
+import datetime
+import logging
+import os
+import threading
+from collections.abc import Iterator
+from dataclasses import dataclass, field
+from typing import Protocol
+
+from duties import ScheduleRuleType, get_duty_definition
+
+logger = logging.getLogger(__name__)
+
+MONDAY, TUESDAY, WEDNESDAY, THURSDAY, FRIDAY, SATURDAY, SUNDAY = range(7)
+
+# Number of days of run dates that are computed at once
+CALENDAR_HORIZON_DAYS = 366
+# Number of days next_run_days looks ahead for the next run date before giving up
+MAX_RUN_DAY_SEARCH_DAYS = 366
+
+
+class ScheduleRule(Protocol):
+    def candidate_dates(self, start: datetime.date, end: datetime.date) -> Iterator[datetime.date]:
+        """
+        Dates in [start, end] on which the duty would run, before holidays are taken into account.
+        """
+        ...
+
+    def period_key(self, date: datetime.date) -> str:
+        """
+        Key of the period (e.g. the week or month) a date belongs to, with at most one run per period.
+        """
+        ...
+
+
+@dataclass(frozen=True)
+class OddIsoWeekRule:
+    """
+    Runs on the given weekday of every odd ISO week.
+    """
+
+    weekday: int
+
+    def candidate_dates(self, start: datetime.date, end: datetime.date) -> Iterator[datetime.date]:
+        date = start + datetime.timedelta(days=(self.weekday - start.weekday()) % 7)
+        while date <= end:
+            if date.isocalendar()[1] % 2 == 1:
+                yield date
+            date += datetime.timedelta(days=7)
+
+    def period_key(self, date: datetime.date) -> str:
+        iso_year, iso_week, _ = date.isocalendar()
+        return f"{iso_year}-W{iso_week:02d}"
+
+
+@dataclass(frozen=True)
+class LastWeekdayOfMonthRule:
+    """
+    Runs on the last occurrence of the given weekday in every month.
+    """
+
+    weekday: int
+
+    def candidate_dates(self, start: datetime.date, end: datetime.date) -> Iterator[datetime.date]:
+        date = start + datetime.timedelta(days=(self.weekday - start.weekday()) % 7)
+        while date <= end:
+            if (date + datetime.timedelta(days=7)).month != date.month:
+                yield date
+            date += datetime.timedelta(days=7)
+
+    def period_key(self, date: datetime.date) -> str:
+        return f"{date.year}-{date.month:02d}"
+
+
+@dataclass
+class DutyCalendar:
+    """
+    Precomputed run dates of a duty. Candidate dates that fall on a holiday are moved to the next business day,
+    or skipped if shifting is disabled.
+    """
+
+    rule: ScheduleRule
+    holidays: frozenset[datetime.date] = frozenset()
+    shift_to_next_business_day: bool = True
+    horizon_days: int = CALENDAR_HORIZON_DAYS
+    _start: datetime.date | None = field(default=None, init=False, repr=False)
+    _end: datetime.date | None = field(default=None, init=False, repr=False)
+    _run_days: frozenset[datetime.date] = field(default=frozenset(), init=False, repr=False)
+    # Scheduled (candidate) date of every run date, which differ when a run was shifted past a holiday
+    _scheduled_dates: dict[datetime.date, datetime.date] = field(default_factory=dict, init=False, repr=False)
+    _sorted_run_days: list[datetime.date] = field(default_factory=list, init=False, repr=False)
+    _lock: threading.Lock = field(default_factory=threading.Lock, init=False, repr=False)
+
+    def is_business_day(self, date: datetime.date) -> bool:
+        return date.weekday() < SATURDAY and date not in self.holidays
+
+    def _next_business_day(self, date: datetime.date) -> datetime.date:
+        while not self.is_business_day(date):
+            date += datetime.timedelta(days=1)
+        return date
+
+    def _ensure_covers(self, date: datetime.date) -> None:
+        if self._start is not None and self._end is not None and self._start <= date <= self._end:
+            return
+
+        with self._lock:
+            start = date
+            end = date + datetime.timedelta(days=self.horizon_days)
+            # Candidates shortly before the window can be shifted into it
+            lookback = start - datetime.timedelta(days=14)
+
+            scheduled_dates = {}
+            for candidate in self.rule.candidate_dates(lookback, end):
+                run_day = candidate
+                if not self.is_business_day(candidate):
+                    if not self.shift_to_next_business_day:
+                        continue
+                    run_day = self._next_business_day(candidate)
+                if start <= run_day <= end:
+                    scheduled_dates[run_day] = candidate
+
+            run_days = set(scheduled_dates)
+            self._scheduled_dates = scheduled_dates
+            self._run_days = frozenset(run_days)
+            self._sorted_run_days = sorted(run_days)
+            self._start, self._end = start, end
+
+    def is_run_day(self, date: datetime.date) -> bool:
+        """
+        Whether the duty runs on the given date, answered from the precomputed set of run dates.
+        """
+        self._ensure_covers(date)
+        return date in self._run_days
+
+    def period_key(self, date: datetime.date) -> str:
+        """
+        Key of the duty period of a date. A run that was shifted past a holiday keeps the period it was scheduled in,
+        even if it moved into the next week or month.
+        """
+        self._ensure_covers(date)
+        return self.rule.period_key(self._scheduled_dates.get(date, date))
+
+    def next_run_days(self, date: datetime.date, count: int) -> list[datetime.date]:
+        """
+        The first `count` run dates on or after the given date.
+        Raises ValueError if the duty doesn't run within MAX_RUN_DAY_SEARCH_DAYS after the date or a run date, e.g.
+        when holidays cover all candidate dates and shifting is disabled.
+        """
+        self._ensure_covers(date)
+        index = bisect.bisect_left(self._sorted_run_days, date)
+        run_days = self._sorted_run_days[index : index + count]
+
+        # Look further ahead if the precomputed window doesn't hold enough dates
+        while len(run_days) < count and self._end is not None:
+            last = run_days[-1] if run_days else date - datetime.timedelta(days=1)
+            if (self._end - last).days >= MAX_RUN_DAY_SEARCH_DAYS:
+                raise ValueError(f"No run date within {MAX_RUN_DAY_SEARCH_DAYS} days after {last.isoformat()}")
+            following = self._end + datetime.timedelta(days=1)
+            self._ensure_covers(following)
+            index = bisect.bisect_right(self._sorted_run_days, last)
+            run_days += self._sorted_run_days[index : index + count - len(run_days)]
+
+        return run_days
+
+
+SCHEDULE_RULES: dict[ScheduleRuleType, type[OddIsoWeekRule] | type[LastWeekdayOfMonthRule]] = {
+    ScheduleRuleType.ODD_ISO_WEEK: OddIsoWeekRule,
+    ScheduleRuleType.LAST_WEEKDAY_OF_MONTH: LastWeekdayOfMonthRule,
+}
+
+_calendars: dict[str, DutyCalendar] = {}
+_calendars_lock = threading.Lock()
+
+
+def get_office_holidays() -> frozenset[datetime.date]:
+    """
+    Office closures, configured as comma-separated ISO dates in the OFFICE_HOLIDAYS environment variable.
+    """
+    value = os.environ.get("OFFICE_HOLIDAYS", "")
+    return frozenset(datetime.date.fromisoformat(day.strip()) for day in value.split(",") if day.strip())
+
+
+def get_schedule_rule(duty_type: str) -> ScheduleRule:
+    """
+    The schedule rule of a duty type, as configured in its definition.
+    """
+    definition = get_duty_definition(duty_type)
+    return SCHEDULE_RULES[definition.schedule_rule](weekday=definition.weekday)
+
+
+def get_duty_calendar(duty_type: str) -> DutyCalendar:
+    """
+    Get the calendar of a duty type, shared by all requests of this instance.
+    """
+    calendar = _calendars.get(duty_type)
+    if calendar is None:
+        with _calendars_lock:
+            calendar = _calendars.get(duty_type)
+            if calendar is None:
+                calendar = DutyCalendar(rule=get_schedule_rule(duty_type), holidays=get_office_holidays())
+                _calendars[duty_type] = calendar
+
+    return calendar
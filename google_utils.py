@@ -1,17 +1,79 @@
-from google.cloud import secretmanager
+import os
+import threading
+import time
+from typing import TYPE_CHECKING
+
+from timing import span
+
+if TYPE_CHECKING:
+    from google.cloud import secretmanager
 
 PROJECT_ID = "java-janitor"
 
+# Secrets are cached per instance, so warm invocations don't go over the network
+SECRET_CACHE_TTL_SECONDS = float(os.environ.get("SECRET_CACHE_TTL_SECONDS", "600"))
+
+_client: "secretmanager.SecretManagerServiceClient | None" = None
+_client_lock = threading.Lock()
+
+# Maps the token name to the secret and the monotonic time at which it expires
+_secret_cache: dict[str, tuple[str, float]] = {}
+_secret_cache_lock = threading.Lock()
+
+
+def get_secret_manager_client() -> "secretmanager.SecretManagerServiceClient":
+    """
+    Gets the Secret Manager client shared by this instance, creating it on first use
+    """
+    global _client
+
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                with span("secret_manager.create_client"):
+                    # Imported here, because loading the gRPC stack is slow and not every code path needs it
+                    from google.cloud import secretmanager
+
+                    _client = secretmanager.SecretManagerServiceClient()
 
-def get_secret(token_name: str) -> str:
+    return _client
+
+
+def get_secret(token_name: str, force_refresh: bool = False) -> str:
     """
-    Gets the secret from Google Secret Manager
+    Gets the secret from Google Secret Manager, served from an in-process cache while it is fresh
     :param token_name: str with name of the token in GSM
+    :param force_refresh: bool to bypass the cache, e.g. after the secret was rotated
     :return: secret: str unhashed version of the secret
     """
-    client = secretmanager.SecretManagerServiceClient()
+    with _secret_cache_lock:
+        cached = _secret_cache.get(token_name)
+        if cached is not None and not force_refresh and time.monotonic() < cached[1]:
+            return cached[0]
+
+        # Fetch while holding the lock, so concurrent cache misses result in a single call to GSM
+        secret = _fetch_secret(token_name)
+        _secret_cache[token_name] = (secret, time.monotonic() + SECRET_CACHE_TTL_SECONDS)
+
+        return secret
+
+
+def invalidate_secret(token_name: str | None = None) -> None:
+    """
+    Drops a secret (or all secrets if no name is given) from the cache, so the next read fetches it again
+    """
+    with _secret_cache_lock:
+        if token_name is None:
+            _secret_cache.clear()
+        else:
+            _secret_cache.pop(token_name, None)
+
+
+def _fetch_secret(token_name: str) -> str:
+    client = get_secret_manager_client()
     name = f"projects/{PROJECT_ID}/secrets/{token_name}/versions/latest"
-    response = client.access_secret_version(name=name)
+    with span("secret_manager.access_secret"):
+        response = client.access_secret_version(name=name)
     secret = response.payload.data.decode("UTF-8")
 
     assert isinstance(secret, str)
@@ -0,0 +1,101 @@
+import base64
+import datetime
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, NamedTuple
+
+# Number of history responses every instance keeps in memory, per database
+HISTORY_CACHE_SIZE = int(os.environ.get("HISTORY_CACHE_SIZE", "256"))
+
+
+class HistoryVersion(NamedTuple):
+    """
+    Version of the assignment history. New assignments raise the highest id and completing one raises the latest
+    completion time, so a write by any instance results in a different version. Both are read from an index.
+    The history also shows usernames and cycles, so updates of members (e.g. by the roster sync) and cycle backfills
+    change the version as well, through the row versions of the members and the cycle pointers.
+    """
+
+    max_assignment_id: int
+    last_completed_at: datetime.datetime | None
+    member_row_version_sum: int
+    cycle_row_version_sum: int
+
+
+def encode_cursor(position: tuple[datetime.datetime, int]) -> str:
+    """
+    Opaque cursor of the page after the given (assigned_at, id).
+    """
+    assigned_at, assignment_id = position
+    return base64.urlsafe_b64encode(f"{assigned_at.isoformat()}|{assignment_id}".encode()).decode()
+
+
+def decode_cursor(cursor: str) -> tuple[datetime.datetime, int]:
+    """
+    The (assigned_at, id) position of a cursor, raising ValueError if it wasn't made by encode_cursor.
+    """
+    try:
+        assigned_at, assignment_id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+        return datetime.datetime.fromisoformat(assigned_at), int(assignment_id)
+    except (ValueError, UnicodeDecodeError) as e:
+        raise ValueError(f"Invalid cursor {cursor}") from e
+
+
+@dataclass(frozen=True)
+class CachedResponse:
+    version: HistoryVersion
+    etag: str
+    body: dict[str, Any]
+
+
+class HistoryCache:
+    """
+    Responses of the history endpoint by their query, least recently used first. A response is only served while
+    the history is at the version it was built for, and its ETag is derived from that version and the query, so
+    clients can revalidate without the page being read again.
+    """
+
+    def __init__(self, size: int = HISTORY_CACHE_SIZE) -> None:
+        self.size = size
+        self._lock = threading.Lock()
+        self._responses: OrderedDict[tuple[Any, ...], CachedResponse] = OrderedDict()
+
+    @staticmethod
+    def etag(version: HistoryVersion, query: tuple[Any, ...]) -> str:
+        return hashlib.sha256(repr((version, query)).encode()).hexdigest()[:32]
+
+    def get(self, query: tuple[Any, ...], version: HistoryVersion) -> CachedResponse | None:
+        with self._lock:
+            cached = self._responses.get(query)
+            if cached is None or cached.version != version:
+                return None
+            self._responses.move_to_end(query)
+            return cached
+
+    def store(self, query: tuple[Any, ...], version: HistoryVersion, body: dict[str, Any]) -> CachedResponse:
+        cached = CachedResponse(version, self.etag(version, query), body)
+        with self._lock:
+            self._responses[query] = cached
+            self._responses.move_to_end(query)
+            while len(self._responses) > self.size:
+                self._responses.popitem(last=False)
+        return cached
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._responses.clear()
+
+
+_caches: dict[bool, HistoryCache] = {}
+_caches_lock = threading.Lock()
+
+
+def get_history_cache(test_mode: bool = False) -> HistoryCache:
+    """
+    Get the response cache of the prod or dev database, creating it on first use.
+    """
+    with _caches_lock:
+        return _caches.setdefault(test_mode, HistoryCache())
@@ -1,19 +1,29 @@
 import datetime
+import functools
 import logging
+import os
 import random
+from typing import TYPE_CHECKING, Any
 
 import functions_framework
 from flask import Request
 
-from database import get_current_cycle_info, get_office_members, record_duty_assignment, start_new_cycle
-from mattermost import (
-    configure_and_send_mattermost_webhook,
-)
-from models import DutyConfig, DutyType, OfficeMember
+from duties import DEFAULT_OFFICE, DutyConfig, DutyType, get_duty_definition, get_duty_registry
+from duty_calendar import get_duty_calendar
+from scheduling import DUTY_SELECTION_STRATEGY, SelectionStrategy, select_by_credit
+from timing import span, traced
+
+# SQLAlchemy, pydantic, Secret Manager and requests are only imported on the code paths that need them,
+# so health checks and "not this week" requests don't pay for them on a cold start
+if TYPE_CHECKING:
+    from models import OfficeMember
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Assign through async_pipeline, which overlaps database and webhook I/O and delivers the notification in the request
+ASYNC_PIPELINE_ENABLED = os.environ.get("ASYNC_PIPELINE_ENABLED", "false").lower() in ("1", "true", "yes")
+
 
 def is_coffee_execution_week(date: datetime.date) -> bool:
     """
@@ -41,23 +51,28 @@ def is_fridge_execution_week(date: datetime.date) -> bool:
     return is_last_wednesday
 
 
-def get_duty_config(duty_type: DutyType) -> DutyConfig:
+def get_duty_config(duty_type: str) -> DutyConfig:
     """
-    Get configuration for a specific duty type.
+    Get configuration for a specific duty type, from its definition in the duty registry.
     """
-    if duty_type == DutyType.COFFEE:
-        return DutyConfig(coffee_drinkers_only=True, duty_name="coffee machine cleaning")
-    elif duty_type == DutyType.FRIDGE:
-        return DutyConfig(coffee_drinkers_only=False, duty_name="fridge cleaning")
-    else:
-        raise ValueError(f"Unknown duty type {duty_type}")
+    definition = get_duty_definition(duty_type)
+    return DutyConfig(coffee_drinkers_only=definition.coffee_drinkers_only, duty_name=definition.duty_name)
 
 
-def select_next_member(members: list[OfficeMember], assigned_member_ids: set[int]) -> OfficeMember | None:
+def select_next_member(
+    members: list["OfficeMember"],
+    assigned_member_ids: set[int],
+    strategy: SelectionStrategy = SelectionStrategy.RANDOM,
+) -> "OfficeMember | None":
     """
     Select the next member for duty from available members.
     Returns None if all members have been assigned.
+    With the stride strategy the member with the least credit is selected, even if they already had a turn
+    in the current cycle.
     """
+    if strategy == SelectionStrategy.STRIDE:
+        return select_by_credit(members)
+
     member_lookup = {member.id: member for member in members}
     all_member_ids = set(member_lookup.keys())
     available_user_ids = list(all_member_ids - assigned_member_ids)
@@ -69,99 +84,415 @@ def select_next_member(members: list[OfficeMember], assigned_member_ids: set[int
     return member_lookup[selected_user_id]
 
 
-def _assign_duty(duty_type: DutyType, test_mode: bool = False) -> tuple[dict[str, str], int]:
+def _assign_duty(duty_type: str, test_mode: bool = False, office: str = DEFAULT_OFFICE) -> tuple[dict[str, str], int]:
     """
-    Assign a duty, track it in the database, and send a notification on Mattermost.
+    Assign a duty in an office, track it in the database, and send a notification on Mattermost.
     """
+    with span("main.imports"):
+        if ASYNC_PIPELINE_ENABLED:
+            from async_pipeline import assign_next_member
+        else:
+            from database import assign_next_member
+        from database import get_pool_stats
+        from mattermost import build_mattermost_payload
+        from outbox import start_background_delivery
+
     # Get duty configuration
     config = get_duty_config(duty_type)
+    # A retried or duplicated trigger for the same period gets the assignment that was already made
+    period_key = get_duty_calendar(duty_type).period_key(datetime.date.today())
+
+    # Select and record the next member together with its notification, in a single transaction
+    result = assign_next_member(
+        duty_type,
+        functools.partial(select_next_member, strategy=DUTY_SELECTION_STRATEGY),
+        coffee_drinkers_only=config.coffee_drinkers_only,
+        notification=lambda member: build_mattermost_payload(
+            member.username, duty_type=duty_type, test_mode=test_mode, office=office
+        ),
+        period_key=period_key,
+        office=office,
+        test_mode=test_mode,
+    )
 
-    # Get eligible members from database
-    members = get_office_members(coffee_drinkers_only=config.coffee_drinkers_only, test_mode=test_mode)
-    if not members:
-        logger.warning(f"No members eligible for {config.duty_name}. Aborting.")
-        return {"status": "error", "message": f"No members eligible for {config.duty_name}"}, 500
-
-    # Get current cycle and select member
-    cycle_info = get_current_cycle_info(duty_type, test_mode)
-    selected_member = select_next_member(members, cycle_info.assigned_member_ids)
-
-    # Start new cycle if needed
-    if selected_member is None:
-        logger.info(f"All users have had a turn for {config.duty_name}. Starting new cycle.")
-        cycle_info = start_new_cycle(duty_type, test_mode)
-        selected_member = select_next_member(members, cycle_info.assigned_member_ids)
+    if not result.success or result.member is None:
+        logger.error(f"Failed to assign {config.duty_name}: {result.message}")
+        return {"status": "error", "message": result.message}, 500
 
-        if selected_member is None:
-            logger.error(f"No users available for {config.duty_name} even after cycle reset.")
-            return {"status": "error", "message": f"No users available for {config.duty_name} after cycle reset."}, 500
+    selected_member = result.member
+    if result.already_assigned:
+        logger.info(f"{config.duty_name} for {period_key} was already assigned to {selected_member.username}.")
+        return {
+            "status": "success",
+            "message": f"{config.duty_name} for {period_key} was already assigned to {selected_member.username}.",
+        }, 200
 
     logger.info(f"Selected user for {config.duty_name}: {selected_member.username} (ID: {selected_member.id})")
 
-    # Send notification
-    if not configure_and_send_mattermost_webhook(selected_member.username, duty_type=duty_type, test_mode=test_mode):
-        logger.error(f"Failed to send Mattermost webhook for {selected_member.username}")
-
-    # Record assignment
-    result = record_duty_assignment(
-        member_id=selected_member.id,
-        username=selected_member.username,
-        duty_type=duty_type,
-        cycle_id=cycle_info.cycle_id,
-        test_mode=test_mode,
-    )
-
-    if not result.success:
-        logger.error(f"Failed to record {selected_member.username} in database: {result.message}")
-        return {"status": "error", "message": result.message}, 500
+    # Deliver the notification without holding up the response, retries are handled by the outbox.
+    # The async pipeline already delivered it, and hands it to the outbox itself if that failed.
+    if result.delivery is None:
+        with span("outbox.start_delivery"):
+            start_background_delivery(test_mode)
 
     logger.info(f"{config.duty_name} assignment process completed successfully.")
+    logger.info(f"Database pool stats: {get_pool_stats()}")
     return {"status": "success", "message": f"Assigned {config.duty_name} to {selected_member.username}."}, 200
 
 
 @functions_framework.http
+@traced
 def assign_coffee_duty(request: Request) -> tuple[str, int] | tuple[dict[str, str], int]:
     """
     HTTP Cloud Function for assigning coffee machine cleaning duty.
-    Expected payload: {"test_mode": true | false}
+    Expected payload: {"test_mode": true | false, "office": "..." (optional)}
     """
     if request.method != "POST":
         return "Java Janitor is alive! Use POST to trigger.", 200
 
     request_json = request.get_json(silent=True) or {}
     test_mode = request_json.get("test_mode", True)
+    office = request_json.get("office", DEFAULT_OFFICE)
 
-    # Check if it's execution week
+    # Check if it's a scheduled run day
     today = datetime.date.today()
-    if not is_coffee_execution_week(today):
+    if not get_duty_calendar(DutyType.COFFEE).is_run_day(today):
         if test_mode:
-            logger.info("Would not have assigned coffee duty this week.")
+            logger.info("Would not have assigned coffee duty today.")
         else:
-            return {"status": "success", "message": "Not assigning coffee duty this week."}, 200
+            return {"status": "success", "message": "Not assigning coffee duty today."}, 200
 
     logger.info(f"Coffee duty assignment process started (test mode = {test_mode})")
-    return _assign_duty(DutyType.COFFEE, test_mode)
+    return _assign_duty(DutyType.COFFEE, test_mode, office)
 
 
 @functions_framework.http
+@traced
 def assign_fridge_duty(request: Request) -> tuple[str, int] | tuple[dict[str, str], int]:
     """
     HTTP Cloud Function for assigning fridge cleaning duty.
-    Expected payload: {"test_mode": true | false}
+    Expected payload: {"test_mode": true | false, "office": "..." (optional)}
     """
     if request.method != "POST":
         return "Fridge Warden is alive! Use POST to trigger.", 200
 
     request_json = request.get_json(silent=True) or {}
     test_mode = request_json.get("test_mode", True)
+    office = request_json.get("office", DEFAULT_OFFICE)
 
-    # Check if it's execution week
+    # Check if it's a scheduled run day
     today = datetime.date.today()
-    if not is_fridge_execution_week(today):
+    if not get_duty_calendar(DutyType.FRIDGE).is_run_day(today):
         if test_mode:
-            logger.info("Would not have assigned fridge duty this week.")
+            logger.info("Would not have assigned fridge duty today.")
         else:
-            return {"status": "success", "message": "Not executing fridge duty this week."}, 200
+            return {"status": "success", "message": "Not executing fridge duty today."}, 200
 
     logger.info(f"Fridge duty assignment process started (test mode = {test_mode})")
-    return _assign_duty(DutyType.FRIDGE, test_mode)
+    return _assign_duty(DutyType.FRIDGE, test_mode, office)
+
+
+@functions_framework.http
+@traced
+def assign_due_duties(request: Request) -> tuple[str, int] | tuple[dict[str, Any], int]:
+    """
+    HTTP Cloud Function for assigning every duty of the registry that is due today in every office, in a single
+    invocation.
+    Expected payload: {"test_mode": true | false, "duties": ["coffee", ...], "offices": ["nyc", ...]}
+    Duties and offices are optional, and default to all duties and all offices with active members.
+    In test mode the duties are assigned even if they aren't due today.
+    """
+    if request.method != "POST":
+        return "Duty dispatcher is alive! Use POST to trigger.", 200
+
+    request_json = request.get_json(silent=True) or {}
+    test_mode = request_json.get("test_mode", True)
+
+    registry = get_duty_registry()
+    duty_types = request_json.get("duties") or list(registry)
+    if isinstance(duty_types, str):
+        duty_types = [duty_types]
+    unknown = [duty_type for duty_type in duty_types if duty_type not in registry]
+    if unknown:
+        return {"status": "error", "message": f"Unknown duty types {', '.join(unknown)}"}, 400
+
+    today = datetime.date.today()
+    due = [duty_type for duty_type in duty_types if get_duty_calendar(duty_type).is_run_day(today)]
+    if test_mode:
+        logger.info(f"Would have assigned {', '.join(due) or 'no duties'} today.")
+        due = duty_types
+    if not due:
+        return {"status": "success", "message": "No duties due today.", "duties": {}}, 200
+
+    with span("main.imports"):
+        from database import assign_batch
+        from mattermost import build_mattermost_payload
+        from models import DueDuty
+        from outbox import start_background_delivery
+
+    logger.info(f"Assigning {', '.join(due)} (test mode = {test_mode})")
+    # All offices and duties are assigned in one transaction, with a handful of statements
+    batch = assign_batch(
+        [
+            DueDuty(
+                duty_type,
+                coffee_drinkers_only=get_duty_definition(duty_type).coffee_drinkers_only,
+                period_key=get_duty_calendar(duty_type).period_key(today),
+            )
+            for duty_type in due
+        ],
+        functools.partial(select_next_member, strategy=DUTY_SELECTION_STRATEGY),
+        notification=lambda duty_type, member: build_mattermost_payload(
+            member.username, duty_type=duty_type, test_mode=test_mode, office=member.office
+        ),
+        offices=request_json.get("offices"),
+        test_mode=test_mode,
+    )
+    if not batch.success:
+        logger.error(f"Failed to assign {', '.join(due)}: {batch.message}")
+        return {"status": "error", "message": batch.message}, 500
+
+    results: dict[str, dict[str, dict[str, str]]] = {duty_type: {} for duty_type in due}
+    failed = False
+    for office, assignments in batch.assignments.items():
+        for duty_type, result in assignments.items():
+            results[duty_type][office] = {"status": "success" if result.success else "error", "message": result.message}
+            failed = failed or not result.success
+
+    # The notifications of all offices are fanned out together
+    with span("outbox.start_delivery"):
+        start_background_delivery(test_mode)
+
+    if failed:
+        return {"status": "error", "message": "Not all duties could be assigned.", "duties": results}, 500
+    return {"status": "success", "message": f"Assigned {', '.join(due)}.", "duties": results}, 200
+
+
+@functions_framework.http
+@traced
+def drain_notifications(request: Request) -> tuple[str, int] | tuple[dict[str, str | int], int]:
+    """
+    HTTP Cloud Function for delivering notifications that are still pending in the outbox.
+    Expected payload: {"test_mode": true | false}
+    """
+    if request.method != "POST":
+        return "Notification drainer is alive! Use POST to trigger.", 200
+
+    with span("main.imports"):
+        from outbox import drain_outbox
+
+    request_json = request.get_json(silent=True) or {}
+    test_mode = request_json.get("test_mode", True)
+
+    result = drain_outbox(test_mode)
+    response: dict[str, str | int] = {
+        "status": "success",
+        "sent": result.sent,
+        "retried": result.retried,
+        "failed": result.failed,
+        "pending": result.pending,
+    }
+    return response, 200
+
+
+# Largest reminder threshold the sweeper accepts, a year in hours
+MAX_REMINDER_AFTER_HOURS = 8760
+
+
+@functions_framework.http
+@traced
+def send_reminders(request: Request) -> tuple[str, int] | tuple[dict[str, str | int], int]:
+    """
+    HTTP Cloud Function reminding assignees of the duties they haven't completed, once per assignment.
+    Expected payload: {"test_mode": true | false, "after_hours": N}
+    after_hours is optional and defaults to REMINDER_AFTER_HOURS.
+    """
+    if request.method != "POST":
+        return "Reminder sweeper is alive! Use POST to trigger.", 200
+
+    with span("main.imports"):
+        from reminders import REMINDER_AFTER_HOURS
+        from reminders import send_reminders as sweep
+
+    request_json = request.get_json(silent=True) or {}
+    test_mode = request_json.get("test_mode", True)
+    after_hours = request_json.get("after_hours", REMINDER_AFTER_HOURS)
+    response: dict[str, str | int]
+    if (
+        not isinstance(after_hours, int | float)
+        or isinstance(after_hours, bool)
+        or not 0 <= after_hours <= MAX_REMINDER_AFTER_HOURS
+    ):
+        response = {"status": "error", "message": f"after_hours must be between 0 and {MAX_REMINDER_AFTER_HOURS}"}
+        return response, 400
+
+    result = sweep(test_mode, after_hours=after_hours)
+    response = {"status": "success", "sent": result.sent, "failed": result.failed}
+    return response, 200
+
+
+# Maximum number of dates the schedule endpoint returns per duty
+MAX_SCHEDULE_DATES = 52
+DASHBOARD_ORIGIN = "https://clean-office-command-center.vercel.app"
+
+
+@functions_framework.http
+def duty_schedule(request: Request) -> tuple[dict[str, list[str]] | dict[str, str], int, dict[str, str]]:
+    """
+    HTTP Cloud Function returning the next scheduled run dates of every duty, for the dashboard.
+    Query parameters: ?duty=<duty type> (default all) and ?count=N (default 5)
+    """
+    headers = {"Access-Control-Allow-Origin": DASHBOARD_ORIGIN, "Cache-Control": "public, max-age=3600"}
+
+    if request.method != "GET":
+        return {"status": "error", "message": "Use GET to read the schedule."}, 405, headers
+
+    duty = request.args.get("duty")
+    registry = get_duty_registry()
+    if duty is not None and duty not in registry:
+        return {"status": "error", "message": f"Unknown duty type {duty}"}, 400, headers
+
+    count = request.args.get("count", default=5, type=int)
+    if count is None or not 1 <= count <= MAX_SCHEDULE_DATES:
+        return {"status": "error", "message": f"count must be between 1 and {MAX_SCHEDULE_DATES}"}, 400, headers
+
+    today = datetime.date.today()
+    duty_types = [duty] if duty is not None else list(registry)
+    try:
+        schedule = {
+            duty_type: [date.isoformat() for date in get_duty_calendar(duty_type).next_run_days(today, count)]
+            for duty_type in duty_types
+        }
+    except ValueError as e:
+        logger.error(f"Could not compute the schedule: {e}")
+        return {"status": "error", "message": str(e)}, 500, headers
+    return schedule, 200, headers
+
+
+# Number of assignments per page of the history endpoint, by default and at most
+HISTORY_PAGE_SIZE = 50
+MAX_HISTORY_PAGE_SIZE = 200
+
+
+@functions_framework.http
+@traced
+def assignment_history(request: Request) -> tuple[dict[str, Any] | str, int, dict[str, str]]:
+    """
+    HTTP Cloud Function returning the assignment history for the dashboard, newest first.
+    Query parameters: ?duty=<duty type>, ?member_id=N, ?limit=N (default 50), ?cursor=<next_cursor of the previous
+    page> and ?test_mode=true, all optional.
+    Responses carry an ETag of the history version, and If-None-Match is answered with 304 while nothing changed.
+    """
+    headers = {"Access-Control-Allow-Origin": DASHBOARD_ORIGIN, "Cache-Control": "no-cache"}
+
+    if request.method != "GET":
+        return {"status": "error", "message": "Use GET to read the history."}, 405, headers
+
+    duty = request.args.get("duty")
+    if duty is not None and duty not in get_duty_registry():
+        return {"status": "error", "message": f"Unknown duty type {duty}"}, 400, headers
+
+    member_id = request.args.get("member_id", type=int)
+    if member_id is None and "member_id" in request.args:
+        return {"status": "error", "message": "member_id must be a number"}, 400, headers
+
+    limit = request.args.get("limit", default=HISTORY_PAGE_SIZE, type=int)
+    if limit is None or not 1 <= limit <= MAX_HISTORY_PAGE_SIZE:
+        return {"status": "error", "message": f"limit must be between 1 and {MAX_HISTORY_PAGE_SIZE}"}, 400, headers
+
+    with span("main.imports"):
+        from database import get_history_page, get_history_version
+        from history import decode_cursor, encode_cursor, get_history_cache
+
+    cursor = request.args.get("cursor")
+    try:
+        after = decode_cursor(cursor) if cursor is not None else None
+    except ValueError as e:
+        return {"status": "error", "message": str(e)}, 400, headers
+
+    test_mode = request.args.get("test_mode", "false").lower() == "true"
+    cache = get_history_cache(test_mode)
+    query = (duty, member_id, limit, after)
+    # Every instance checks the version, so writes through other instances are seen as well
+    version = get_history_version(test_mode)
+    cached = cache.get(query, version)
+    if cached is None:
+        page = get_history_page(duty, member_id, limit, after, test_mode)
+        body = {
+            "assignments": [entry.to_dict() for entry in page.entries],
+            "next_cursor": encode_cursor(page.next_position) if page.next_position is not None else None,
+        }
+        cached = cache.store(query, version, body)
+
+    headers["ETag"] = f'"{cached.etag}"'
+    if request.if_none_match.contains(cached.etag):
+        return "", 304, headers
+    # A copy, because the response of a traced handler gets its timings added
+    return dict(cached.body), 200, headers
+
+
+@functions_framework.http
+@traced
+def complete_assignment(request: Request) -> tuple[str, int] | tuple[dict[str, Any], int]:
+    """
+    HTTP Cloud Function marking an assignment as completed.
+    Expected payload: {"assignment_id": N, "test_mode": true | false}
+    Completing an assignment again keeps its first completion time.
+    """
+    if request.method != "POST":
+        return "Completion endpoint is alive! Use POST to complete an assignment.", 200
+
+    request_json = request.get_json(silent=True) or {}
+    test_mode = request_json.get("test_mode", True)
+    assignment_id = request_json.get("assignment_id")
+    if not isinstance(assignment_id, int) or isinstance(assignment_id, bool):
+        return {"status": "error", "message": "assignment_id must be a number"}, 400
+
+    with span("main.imports"):
+        from database import complete_assignment as complete
+        from history import get_history_cache
+
+    entry = complete(assignment_id, test_mode)
+    if entry is None:
+        return {"status": "error", "message": f"Assignment {assignment_id} not found"}, 404
+    # Other instances see the new completion time in the history version
+    get_history_cache(test_mode).invalidate()
+
+    logger.info(f"Assignment {assignment_id} of {entry.username} completed.")
+    return {"status": "success", "assignment": entry.to_dict()}, 200
+
+
+# Largest idle period the analytics endpoint filters on, in days
+MAX_IDLE_DAYS = 3650
+
+
+@functions_framework.http
+@traced
+def duty_analytics(request: Request) -> tuple[dict[str, Any], int, dict[str, str]]:
+    """
+    HTTP Cloud Function returning the turn statistics of the active members for the dashboard, longest idle first.
+    Query parameters: ?duty=<duty type>, ?office=<office>, ?idle_days=N (only members without a turn in N days) and
+    ?test_mode=true, all optional.
+    """
+    # The response lists usernames, so shared caches must not keep it
+    headers = {"Access-Control-Allow-Origin": DASHBOARD_ORIGIN, "Cache-Control": "private, max-age=300"}
+
+    if request.method != "GET":
+        return {"status": "error", "message": "Use GET to read the analytics."}, 405, headers
+
+    duty = request.args.get("duty")
+    if duty is not None and duty not in get_duty_registry():
+        return {"status": "error", "message": f"Unknown duty type {duty}"}, 400, headers
+
+    idle_days = request.args.get("idle_days", type=float)
+    if (idle_days is None and "idle_days" in request.args) or (
+        idle_days is not None and not 0 <= idle_days <= MAX_IDLE_DAYS
+    ):
+        return {"status": "error", "message": f"idle_days must be between 0 and {MAX_IDLE_DAYS}"}, 400, headers
+
+    with span("main.imports"):
+        from analytics import get_member_stats
+
+    test_mode = request.args.get("test_mode", "false").lower() == "true"
+    stats = get_member_stats(duty, request.args.get("office"), idle_days, test_mode)
+    return {"members": [member.to_dict() for member in stats]}, 200, headers
@@ -1,69 +1,47 @@
 import logging
 import os
 import random
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
 
 import requests
+from requests.adapters import HTTPAdapter
 
-from models import DutyType
+from duties import DEFAULT_OFFICE, get_duty_definition
+from models import BatchDelivery, WebhookDelivery
+from timing import span
 
 MATTERMOST_WEBHOOK_URL = os.environ.get("MATTERMOST_WEBHOOK_URL")
+# Concurrency of batched sends, which is also the number of kept-alive connections
+MATTERMOST_MAX_WORKERS = int(os.environ.get("MATTERMOST_MAX_WORKERS", "8"))
+MATTERMOST_RATE_PER_DESTINATION = float(os.environ.get("MATTERMOST_RATE_PER_DESTINATION", "1"))
+MATTERMOST_BURST_PER_DESTINATION = int(os.environ.get("MATTERMOST_BURST_PER_DESTINATION", "5"))
+
+_client: "MattermostClient | None" = None
+_client_lock = threading.Lock()
 
 logger = logging.getLogger(__name__)
 
-COFFEE_GREETINGS = [
-    "Hey team!",
-    "Good afternoon, coffee lovers!",
-    "Your biweekly coffee reminder is here!",
-    "Hello everyone!",
-    "Time for our coffee care update!",
-    "Happy coffee week!",
-    "Ready for a fresh brew?",
-    "Greetings, coffee crew!",
-]
-
-FRIDGE_GREETINGS = [
-    "Hey team!",
-    "Good afternoon, hungry folks!",
-    "Your monthly fridge reminder is here!",
-    "Hello everyone!",
-    "Time for our fridge care update!",
-    "Happy fridge cleaning day!",
-    "Ready for a fresh fridge?",
-    "Fridge cleaning time!",
-    "Hello, clean fridge champions!",
-]
-
-
-def configure_and_send_mattermost_webhook(username: str, duty_type: DutyType, test_mode: bool = True) -> bool:
+
+def configure_and_send_mattermost_webhook(username: str, duty_type: str, test_mode: bool = True) -> bool:
     """
     Build and send a message to the configured Mattermost incoming webhook.
     """
-    if duty_type == DutyType.COFFEE:
-        greetings = COFFEE_GREETINGS
-        machine_to_clean = "coffee machine"
-        emoji = "☕"
-    elif duty_type == DutyType.FRIDGE:
-        greetings = FRIDGE_GREETINGS
-        machine_to_clean = "fridge"
-        emoji = "🧼"
-    else:
-        raise ValueError("Unsupported duty type for Mattermost")
+    return send_mattermost_webhook(username, build_mattermost_payload(username, duty_type, test_mode))
 
-    if test_mode is True:
-        message = (
-            f"{emoji} {random.choice(greetings)} {emoji}\nIt's {username}'s turn to clean the "
-            f"{machine_to_clean} this week! ✨ Click "
-            f"[here](https://clean-office-command-center.vercel.app/) for instructions, and "
-            f"to mark the job as completed."
-        )
 
-    else:
-        message = (
-            f"{emoji} {random.choice(greetings)} {emoji}\nIt's @{username}'s turn to clean the "
-            f"{machine_to_clean} this week! ✨ Click "
-            f"[here](https://clean-office-command-center.vercel.app/) for instructions, and "
-            f"to mark the job as completed."
-        )
+def build_mattermost_payload(
+    username: str, duty_type: str, test_mode: bool = True, office: str = DEFAULT_OFFICE
+) -> dict[str, str]:
+    """
+    Build the webhook payload announcing the duty assignment of `username`, in the channel of their office.
+    """
+    definition = get_duty_definition(duty_type)
+    # Test messages go to a DM and don't mention the assignee
+    mention = username if test_mode is True else f"@{username}"
+    message = definition.message.format(greeting=random.choice(definition.greetings), mention=mention)
 
     payload = {
         "text": message,
@@ -72,28 +50,215 @@ def configure_and_send_mattermost_webhook(username: str, duty_type: DutyType, te
     }
 
     if test_mode is True:
-        payload.update({"channel": "@lotte_lutkenhaus"})
+        payload.update({"channel": definition.test_channel})
     else:
-        payload.update({"channel": "nycoffice"})
+        payload.update({"channel": definition.get_channel(office)})
+
+    return payload
 
-    return send_mattermost_webhook(username, payload)
+
+def build_reminder_payload(username: str, duty_type: str, test_mode: bool = True) -> dict[str, str]:
+    """
+    Build the webhook payload reminding `username` of a duty they haven't marked as completed, in a direct message.
+    """
+    definition = get_duty_definition(duty_type)
+    return {
+        "text": (
+            f"👋 Hi {username}, a friendly reminder that the {definition.duty_name} is still open. ✨ Mark the job "
+            "as completed [here](https://clean-office-command-center.vercel.app/) once it's done."
+        ),
+        "icon_url": "https://storage.cloud.google.com/public-images-java-janitor/java-janitor.png",
+        "username": "Java Janitor",
+        "channel": definition.test_channel if test_mode is True else f"@{username}",
+    }
 
 
 def send_mattermost_webhook(username: str, payload: dict[str, str]) -> bool:
     """
     Sends a message to the configured Mattermost incoming webhook.
     """
-    if not MATTERMOST_WEBHOOK_URL:
-        logger.error("Mattermost Webhook URL is not configured.")
-        return False
+    delivery = post_mattermost_webhook(payload)
+    if delivery.success:
+        logger.info(f"Successfully sent webhook notification for user {username}.")
+    else:
+        logger.error(f"Error sending Mattermost webhook: {delivery.error}")
+
+    return delivery.success
+
 
-    headers = {"Content-Type": "application/json"}
+def post_mattermost_webhook(payload: dict[str, str]) -> WebhookDelivery:
+    """
+    Posts a payload to the configured Mattermost incoming webhook and reports how it went,
+    including the delay Mattermost asks for when it rate limits us.
+    """
+    return get_mattermost_client().post(payload)
 
+
+def get_mattermost_client() -> "MattermostClient":
+    """
+    Gets the Mattermost client shared by this instance, creating it on first use.
+    """
+    global _client
+
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = MattermostClient()
+
+    return _client
+
+
+class RateLimiter:
+    """
+    Token bucket per destination: allows `burst` messages at once, refilled at `rate` messages per second.
+    """
+
+    def __init__(self, rate: float, burst: int) -> None:
+        self.rate = rate
+        self.burst = burst
+        self._buckets: dict[str, tuple[float, float]] = {}
+        self._lock = threading.Lock()
+
+    def _tokens(self, destination: str, now: float) -> float:
+        tokens, updated_at = self._buckets.get(destination, (float(self.burst), now))
+        return min(float(self.burst), tokens + (now - updated_at) * self.rate)
+
+    def reserve(self, destination: str) -> float:
+        """
+        Claim a token now, possibly going into debt, and return how long to wait until it would have been available.
+        """
+        if self.rate <= 0:
+            return 0.0
+
+        with self._lock:
+            now = time.monotonic()
+            tokens = self._tokens(destination, now) - 1
+            self._buckets[destination] = (tokens, now)
+            return -tokens / self.rate if tokens < 0 else 0.0
+
+    def delay(self, destination: str, count: int) -> float:
+        """
+        How long until `count` more messages to the destination are allowed, without claiming any tokens.
+        """
+        if self.rate <= 0 or count <= 0:
+            return 0.0
+
+        with self._lock:
+            tokens = self._tokens(destination, time.monotonic()) - count
+            return -tokens / self.rate if tokens < 0 else 0.0
+
+    def acquire(self, destination: str) -> None:
+        wait = self.reserve(destination)
+        if wait:
+            time.sleep(wait)
+
+
+class MattermostClient:
+    """
+    Client for the Mattermost incoming webhook that keeps connections alive between messages,
+    and fans batches out over a bounded thread pool while rate limiting every destination.
+    """
+
+    def __init__(
+        self,
+        webhook_url: str | None = None,
+        max_workers: int = MATTERMOST_MAX_WORKERS,
+        rate_per_destination: float = MATTERMOST_RATE_PER_DESTINATION,
+        burst_per_destination: int = MATTERMOST_BURST_PER_DESTINATION,
+        timeout: float = 10,
+    ) -> None:
+        self._webhook_url = webhook_url
+        self.max_workers = max_workers
+        self.timeout = timeout
+        self._rate_limiter = RateLimiter(rate_per_destination, burst_per_destination)
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_workers)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.session.headers.update({"Content-Type": "application/json"})
+
+    @property
+    def webhook_url(self) -> str | None:
+        return self._webhook_url or MATTERMOST_WEBHOOK_URL
+
+    def post(self, payload: dict[str, str]) -> WebhookDelivery:
+        """
+        Posts a single payload, waiting for a rate limit slot of its destination first.
+        """
+        destination = payload.get("channel", "")
+        webhook_url = self.webhook_url
+        if not webhook_url:
+            return WebhookDelivery(
+                success=False, destination=destination, error="Mattermost Webhook URL is not configured."
+            )
+
+        with span("mattermost.rate_limit"):
+            self._rate_limiter.acquire(destination)
+
+        try:
+            with span("mattermost.post"):
+                response = self.session.post(webhook_url, json=payload, timeout=self.timeout)
+        except requests.exceptions.RequestException as e:
+            return WebhookDelivery(success=False, destination=destination, error=str(e))
+
+        if response.status_code == 429:
+            return WebhookDelivery(
+                success=False,
+                destination=destination,
+                status_code=response.status_code,
+                retry_after=parse_retry_after(response.headers.get("Retry-After")),
+                error="Rate limited by Mattermost",
+            )
+
+        try:
+            response.raise_for_status()
+        except requests.exceptions.RequestException as e:
+            return WebhookDelivery(
+                success=False, destination=destination, status_code=response.status_code, error=str(e)
+            )
+
+        return WebhookDelivery(success=True, destination=destination, status_code=response.status_code)
+
+    def get_rate_limit_delay(self, payloads: list[dict[str, str]]) -> float:
+        """
+        How long the rate limits of their destinations hold up sending the payloads, given the messages sent so far.
+        """
+        destinations = Counter(payload.get("channel", "") for payload in payloads)
+        return max(
+            (self._rate_limiter.delay(destination, count) for destination, count in destinations.items()), default=0.0
+        )
+
+    def send_batch(self, payloads: list[dict[str, str]]) -> BatchDelivery:
+        """
+        Posts all payloads concurrently and aggregates the outcome. Deliveries are returned in the order
+        of the payloads.
+        """
+        start = time.perf_counter()
+
+        if len(payloads) <= 1:
+            deliveries = [self.post(payload) for payload in payloads]
+        else:
+            with ThreadPoolExecutor(max_workers=min(self.max_workers, len(payloads))) as executor:
+                deliveries = list(executor.map(self.post, payloads))
+
+        result = BatchDelivery(
+            sent=sum(delivery.success for delivery in deliveries),
+            failed=sum(not delivery.success for delivery in deliveries),
+            deliveries=deliveries,
+            duration=time.perf_counter() - start,
+        )
+        logger.info(f"Sent {result.sent} of {len(payloads)} Mattermost messages in {result.duration:.2f}s")
+        return result
+
+    def close(self) -> None:
+        self.session.close()
+
+
+def parse_retry_after(value: str | None) -> float | None:
+    if value is None:
+        return None
     try:
-        response = requests.post(MATTERMOST_WEBHOOK_URL, json=payload, headers=headers, timeout=10)
-        response.raise_for_status()
-        logger.info(f"Successfully sent webhook notification for user {username}.")
-        return True
-    except requests.exceptions.RequestException as e:
-        logger.error(f"Error sending Mattermost webhook: {e}")
-        return False
+        return max(float(value), 0.0)
+    except ValueError:
+        return None
@@ -0,0 +1,16 @@
+-- Index the per-duty cycle lookups and keep a pointer to the current cycle of every duty type,
+-- so neither has to scan the full assignment history.
+
+CREATE INDEX IF NOT EXISTS ix_duty_assignments_duty_cycle_member
+    ON duty_assignments (duty_type, cycle_id, member_id);
+
+CREATE TABLE IF NOT EXISTS duty_cycles (
+    duty_type VARCHAR(20) PRIMARY KEY,
+    cycle_id INTEGER NOT NULL
+);
+
+INSERT INTO duty_cycles (duty_type, cycle_id)
+SELECT duty_type, MAX(cycle_id)
+FROM duty_assignments
+GROUP BY duty_type
+ON CONFLICT (duty_type) DO NOTHING;
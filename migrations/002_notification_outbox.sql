@@ -0,0 +1,16 @@
+-- Notifications are written in the same transaction as the assignment they announce,
+-- and delivered (with retries) by the outbox drainer.
+
+CREATE TABLE IF NOT EXISTS notification_outbox (
+    id SERIAL PRIMARY KEY,
+    dedupe_key VARCHAR(100) UNIQUE NOT NULL,
+    payload JSON NOT NULL,
+    status VARCHAR(10) NOT NULL DEFAULT 'pending', -- 'pending', 'sent' or 'failed'
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at TIMESTAMP NOT NULL DEFAULT (NOW() AT TIME ZONE 'UTC'),
+    created_at TIMESTAMP DEFAULT NOW(),
+    sent_at TIMESTAMP,
+    last_error TEXT
+);
+
+CREATE INDEX IF NOT EXISTS ix_notification_outbox_pending ON notification_outbox (status, next_attempt_at);
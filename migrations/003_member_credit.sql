@@ -0,0 +1,10 @@
+-- Credit per member for the stride selection strategy: turns taken over all duty types relative to the weight.
+
+ALTER TABLE members ADD COLUMN IF NOT EXISTS duty_weight DOUBLE PRECISION NOT NULL DEFAULT 1;
+ALTER TABLE members ADD COLUMN IF NOT EXISTS duty_credit DOUBLE PRECISION;
+
+-- Start everyone at the turns they had so far
+UPDATE members
+SET duty_credit = turns.total
+FROM (SELECT member_id, COUNT(*) AS total FROM duty_assignments GROUP BY member_id) AS turns
+WHERE members.id = turns.member_id AND members.duty_credit IS NULL;
@@ -0,0 +1,20 @@
+-- Row version per member, so warm instances can check their cached roster with
+-- COUNT(*), MAX(id) and SUM(row_version) instead of reading all members.
+
+ALTER TABLE members ADD COLUMN IF NOT EXISTS row_version INTEGER NOT NULL DEFAULT 0;
+
+-- The functions increment row_version themselves when they update a member.
+-- This trigger covers every other update, e.g. members managed by hand.
+CREATE OR REPLACE FUNCTION members_bump_row_version() RETURNS trigger AS $$
+BEGIN
+    IF NEW.row_version IS NOT DISTINCT FROM OLD.row_version THEN
+        NEW.row_version := OLD.row_version + 1;
+    END IF;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS members_bump_row_version ON members;
+CREATE TRIGGER members_bump_row_version
+    BEFORE UPDATE ON members
+    FOR EACH ROW EXECUTE FUNCTION members_bump_row_version();
@@ -0,0 +1,27 @@
+-- Duty period of every assignment (ISO year-week for coffee, year-month for fridge), so a repeated trigger
+-- for the same period returns the assignment that was already made instead of assigning again.
+
+ALTER TABLE duty_assignments ADD COLUMN IF NOT EXISTS period_key VARCHAR(20);
+
+-- Only the first assignment of every period gets a key, earlier duplicates (e.g. test runs) keep NULL.
+-- Runs that were shifted past a holiday into the next period aren't detected here.
+UPDATE duty_assignments
+SET period_key = periods.period_key
+FROM (
+    SELECT id, period_key, ROW_NUMBER() OVER (PARTITION BY duty_type, period_key ORDER BY assigned_at, id) AS n
+    FROM (
+        SELECT
+            id,
+            duty_type,
+            assigned_at,
+            CASE duty_type
+                WHEN 'coffee' THEN to_char(assigned_at, 'IYYY-"W"IW')
+                WHEN 'fridge' THEN to_char(assigned_at, 'YYYY-MM')
+            END AS period_key
+        FROM duty_assignments
+        WHERE period_key IS NULL AND assigned_at IS NOT NULL
+    ) AS keyed
+) AS periods
+WHERE duty_assignments.id = periods.id AND periods.n = 1;
+
+CREATE UNIQUE INDEX IF NOT EXISTS uq_duty_assignments_duty_period ON duty_assignments (duty_type, period_key);
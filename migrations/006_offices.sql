@@ -0,0 +1,17 @@
+-- Office of every member and assignment, and a cycle pointer per office and duty type, so the duties of several
+-- offices are assigned independently. Existing rows belong to the default office.
+
+ALTER TABLE members ADD COLUMN IF NOT EXISTS office VARCHAR(50) NOT NULL DEFAULT 'default';
+ALTER TABLE duty_assignments ADD COLUMN IF NOT EXISTS office VARCHAR(50) NOT NULL DEFAULT 'default';
+ALTER TABLE duty_cycles ADD COLUMN IF NOT EXISTS office VARCHAR(50) NOT NULL DEFAULT 'default';
+
+ALTER TABLE duty_cycles DROP CONSTRAINT IF EXISTS duty_cycles_pkey;
+ALTER TABLE duty_cycles ADD PRIMARY KEY (office, duty_type);
+
+CREATE INDEX IF NOT EXISTS ix_duty_assignments_office_duty_cycle_member
+    ON duty_assignments (office, duty_type, cycle_id, member_id);
+DROP INDEX IF EXISTS ix_duty_assignments_duty_cycle_member;
+
+CREATE UNIQUE INDEX IF NOT EXISTS uq_duty_assignments_office_duty_period
+    ON duty_assignments (office, duty_type, period_key);
+DROP INDEX IF EXISTS uq_duty_assignments_duty_period;
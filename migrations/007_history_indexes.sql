@@ -0,0 +1,11 @@
+-- Indexes for keyset pagination of the assignment history, overall and per duty type or member, and for the
+-- latest completion time that versions it. Built concurrently, so assignments aren't blocked on a large table.
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_duty_assignments_assigned
+    ON duty_assignments (assigned_at, id);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_duty_assignments_duty_assigned
+    ON duty_assignments (duty_type, assigned_at, id);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_duty_assignments_member_assigned
+    ON duty_assignments (member_id, assigned_at, id);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_duty_assignments_completed_at
+    ON duty_assignments (completed_at);
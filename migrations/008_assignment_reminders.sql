@@ -0,0 +1,11 @@
+-- Time of the reminder about an uncompleted assignment, and a partial index on the assignments still waiting for
+-- one, which the reminder sweep reads. Built concurrently, so assignments aren't blocked on a large table.
+-- Existing assignments aren't changed: the sweep only looks at the last REMINDER_MAX_AGE_DAYS, and
+-- backfills/008_skip_old_reminders.sql optionally takes the older history out of the index.
+
+ALTER TABLE duty_assignments ADD COLUMN IF NOT EXISTS reminder_sent_at TIMESTAMP;
+ALTER TABLE duty_assignments ALTER COLUMN completed SET DEFAULT false;
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_duty_assignments_unreminded
+    ON duty_assignments (assigned_at, id)
+    WHERE completed = false AND reminder_sent_at IS NULL;
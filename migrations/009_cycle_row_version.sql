@@ -0,0 +1,4 @@
+-- Row version per cycle pointer, which the cycle backfill increments when it rewrites the cycles of existing
+-- assignments. The history endpoint includes it in its version, so cached responses don't keep the old cycles.
+
+ALTER TABLE duty_cycles ADD COLUMN IF NOT EXISTS row_version INTEGER NOT NULL DEFAULT 0;
@@ -0,0 +1,4 @@
+-- Claim of a reminder that is being sent. The sweep only records reminder_sent_at once the reminder was delivered,
+-- so a reminder whose sweep failed or died is sent by a later sweep once the claim has expired.
+
+ALTER TABLE duty_assignments ADD COLUMN IF NOT EXISTS reminder_claimed_until TIMESTAMP;
@@ -0,0 +1,10 @@
+-- Optional, after 008_assignment_reminders.sql: marks every uncompleted assignment older than 14 days as reminded,
+-- which takes the history from before the sweep out of the partial index of unreminded assignments.
+--
+-- This changes data, not only the schema. Nothing was marked as completed before the sweep existed, so these
+-- assignments look open, and afterwards they can't be told apart from ones that were actually reminded. The sweep
+-- never reminds them either way (it skips assignments older than REMINDER_MAX_AGE_DAYS), so only run this if the
+-- index is too large, and with the interval matching REMINDER_MAX_AGE_DAYS. Safe to run again.
+
+UPDATE duty_assignments SET reminder_sent_at = assigned_at
+WHERE reminder_sent_at IS NULL AND completed = false AND assigned_at < NOW() - INTERVAL '14 days';
@@ -1,43 +1,217 @@
 from dataclasses import dataclass
 from datetime import datetime
-from enum import StrEnum
+from typing import Any
 
 from pydantic import BaseModel
 
+# Duty types live in a module without heavy dependencies, so the entry points can import them cheaply
+from duties import DEFAULT_OFFICE
+from duties import DutyConfig as DutyConfig
+from duties import DutyType as DutyType
 
-class DutyType(StrEnum):
-    COFFEE = "coffee"
-    FRIDGE = "fridge"
 
+@dataclass(slots=True)
+class OfficeMember:
+    """
+    Member of the roster. Members are only built from database rows, which the schema already constrains, so they
+    aren't validated. This keeps reading (and caching) large rosters cheap.
+    """
 
-class OfficeMember(BaseModel):
     id: int
     username: str
     full_name: str | None = None
     coffee_drinker: bool = True
     active: bool = True
+    # Relative share of turns, e.g. 0.5 for part-time staff
+    duty_weight: float = 1.0
+    # Turns taken over all duty types relative to the weight, None until the first turn
+    duty_credit: float | None = None
+    office: str = DEFAULT_OFFICE
 
 
 class DutyAssignment(BaseModel):
     id: int
     member_id: int
-    duty_type: DutyType
+    duty_type: str
     assigned_at: datetime
     cycle_id: int
+    office: str = DEFAULT_OFFICE
+
+
+@dataclass(slots=True)
+class AssignmentRecord:
+    """
+    Row of the assignment history for bulk reads and exports. Unlike DutyAssignment it isn't validated,
+    which makes it several times faster to build and smaller in memory.
+    """
+
+    id: int
+    member_id: int
+    duty_type: str
+    assigned_at: datetime | None
+    cycle_id: int
+    office: str = DEFAULT_OFFICE
+
+    def to_model(self) -> DutyAssignment:
+        return DutyAssignment.model_validate(
+            {
+                "id": self.id,
+                "member_id": self.member_id,
+                "duty_type": self.duty_type,
+                "assigned_at": self.assigned_at,
+                "cycle_id": self.cycle_id,
+                "office": self.office,
+            }
+        )
+
+
+@dataclass(slots=True)
+class HistoryEntry:
+    """
+    Assignment as listed by the history endpoint of the dashboard, with its assignee and completion.
+    """
+
+    id: int
+    member_id: int
+    username: str
+    duty_type: str
+    office: str
+    assigned_at: datetime
+    cycle_id: int
+    period_key: str | None
+    completed: bool | None
+    completed_at: datetime | None
+
+    def to_dict(self) -> dict[str, Any]:
+        return {
+            "id": self.id,
+            "member_id": self.member_id,
+            "username": self.username,
+            "duty_type": self.duty_type,
+            "office": self.office,
+            "assigned_at": self.assigned_at.isoformat(),
+            "cycle_id": self.cycle_id,
+            "period_key": self.period_key,
+            "completed": bool(self.completed),
+            "completed_at": self.completed_at.isoformat() if self.completed_at is not None else None,
+        }
+
+
+@dataclass(slots=True)
+class MemberStats:
+    """
+    Turns of a member (of a duty type), as computed by analytics.get_member_stats. Gaps are in days.
+    """
+
+    member_id: int
+    username: str
+    office: str
+    turns: int
+    last_assigned_at: datetime | None
+    average_gap_days: float | None
+    longest_gap_days: float | None
+
+    def to_dict(self) -> dict[str, Any]:
+        return {
+            "member_id": self.member_id,
+            "username": self.username,
+            "office": self.office,
+            "turns": self.turns,
+            "last_assigned_at": self.last_assigned_at.isoformat() if self.last_assigned_at is not None else None,
+            "average_gap_days": round(self.average_gap_days, 2) if self.average_gap_days is not None else None,
+            "longest_gap_days": round(self.longest_gap_days, 2) if self.longest_gap_days is not None else None,
+        }
+
+
+@dataclass
+class HistoryPage:
+    entries: list[HistoryEntry]
+    # (assigned_at, id) of the last entry if there are more, to continue after it
+    next_position: tuple[datetime, int] | None = None
 
 
 class CycleInfo(BaseModel):
     cycle_id: int
-    duty_type: DutyType
+    duty_type: str
     assigned_member_ids: set[int]
+    office: str = DEFAULT_OFFICE
+
+
+@dataclass
+class WebhookDelivery:
+    success: bool
+    destination: str | None = None
+    status_code: int | None = None
+    retry_after: float | None = None
+    error: str | None = None
 
 
 class AssignmentResult(BaseModel):
     success: bool
     message: str
+    member: OfficeMember | None = None
+    cycle_id: int | None = None
+    period_key: str | None = None
+    # The duty had already been assigned for the period, nothing was recorded or sent
+    already_assigned: bool = False
+    # Outcome of delivering the notification right away, None if it was left to the outbox
+    delivery: WebhookDelivery | None = None
+
+
+class BatchAssignmentResult(BaseModel):
+    success: bool
+    message: str
+    # Result per office and duty type
+    assignments: dict[str, dict[str, AssignmentResult]] = {}
+
+
+@dataclass
+class DueDuty:
+    """
+    A duty to assign in every office by a batch run.
+    """
+
+    duty_type: str
+    coffee_drinkers_only: bool = False
+    period_key: str | None = None
+
+
+@dataclass
+class BatchDelivery:
+    sent: int
+    failed: int
+    deliveries: list[WebhookDelivery]
+    duration: float
+
+
+@dataclass
+class DrainResult:
+    sent: int = 0
+    retried: int = 0
+    failed: int = 0
+    pending: int = 0
+
+
+@dataclass
+class ReminderResult:
+    sent: int = 0
+    failed: int = 0
+
+
+@dataclass
+class CycleBackfillResult:
+    assignments: int = 0
+    changed: int = 0
+    # Cycles of all offices and duty types together, numbered from 0 in each
+    cycles: int = 0
+    dry_run: bool = False
 
 
 @dataclass
-class DutyConfig:
-    coffee_drinkers_only: bool
-    duty_name: str
+class RosterSyncResult:
+    rows: int = 0
+    inserted: int = 0
+    updated: int = 0
+    deactivated: int = 0
+    dry_run: bool = False
+    duration: float = 0.0
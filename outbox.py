@@ -0,0 +1,184 @@
+import datetime
+import logging
+import os
+import threading
+import time
+from typing import Any
+
+from sqlalchemy import Row, func, select, update
+
+from database import NotificationOutboxTable, get_db_session, utcnow
+from mattermost import get_mattermost_client
+from models import DrainResult, WebhookDelivery
+
+logger = logging.getLogger(__name__)
+
+OUTBOX_MAX_ATTEMPTS = int(os.environ.get("OUTBOX_MAX_ATTEMPTS", "8"))
+OUTBOX_BACKOFF_BASE_SECONDS = float(os.environ.get("OUTBOX_BACKOFF_BASE_SECONDS", "2"))
+OUTBOX_BACKOFF_MAX_SECONDS = float(os.environ.get("OUTBOX_BACKOFF_MAX_SECONDS", "600"))
+# How long a single drain keeps waiting for retries before leaving them to the next drain
+OUTBOX_DRAIN_BUDGET_SECONDS = float(os.environ.get("OUTBOX_DRAIN_BUDGET_SECONDS", "30"))
+# Number of due messages that are claimed and sent concurrently at a time
+OUTBOX_BATCH_SIZE = int(os.environ.get("OUTBOX_BATCH_SIZE", "50"))
+# Other drains leave claimed messages alone for this long, in case the drain delivering them dies first. Longer
+# than a delivery can take with the timeout and retries of the Mattermost client. The claim of a batch is extended
+# by how long the rate limits of its destinations hold it up.
+OUTBOX_CLAIM_SECONDS = float(os.environ.get("OUTBOX_CLAIM_SECONDS", "120"))
+
+
+def get_backoff_seconds(attempts: int) -> float:
+    """
+    Exponential backoff after the given number of failed attempts.
+    """
+    return float(min(OUTBOX_BACKOFF_BASE_SECONDS * 2 ** (attempts - 1), OUTBOX_BACKOFF_MAX_SECONDS))
+
+
+def _claim_batch(test_mode: bool) -> list[Row[Any]]:
+    """
+    Claim the oldest due messages, up to OUTBOX_BATCH_SIZE of them, by moving their next attempt past the claim
+    period. The claim is committed before they are delivered, so no row locks or pooled connection are held while
+    Mattermost responds. Only messages that are still due when the update runs are claimed, so concurrent drains
+    never claim the same message, also on databases that ignore SKIP LOCKED. The claim period includes the wait
+    for the rate limits of their destinations, so many messages to one channel aren't claimed by another drain
+    while they are still being sent.
+    """
+    now = utcnow()
+    due = (NotificationOutboxTable.status == "pending", NotificationOutboxTable.next_attempt_at <= now)
+    with get_db_session(test_mode) as session:
+        batch = session.execute(
+            select(NotificationOutboxTable.id, NotificationOutboxTable.payload)
+            .where(*due)
+            .order_by(NotificationOutboxTable.id)
+            .limit(OUTBOX_BATCH_SIZE)
+            .with_for_update(skip_locked=True)
+        ).all()
+        if not batch:
+            return []
+
+        claim_seconds = OUTBOX_CLAIM_SECONDS + get_mattermost_client().get_rate_limit_delay(
+            [message.payload for message in batch]
+        )
+        messages = session.execute(
+            update(NotificationOutboxTable)
+            .where(NotificationOutboxTable.id.in_([message.id for message in batch]), *due)
+            .values(next_attempt_at=now + datetime.timedelta(seconds=claim_seconds))
+            .returning(
+                NotificationOutboxTable.id,
+                NotificationOutboxTable.dedupe_key,
+                NotificationOutboxTable.payload,
+                NotificationOutboxTable.attempts,
+            )
+        ).all()
+        return sorted(messages, key=lambda message: message.id)
+
+
+def _deliver_batch(test_mode: bool, result: DrainResult) -> list[WebhookDelivery]:
+    """
+    Claim a batch of due messages, deliver them fanned out over the shared Mattermost client, and record the
+    outcomes in a second transaction.
+    """
+    messages = _claim_batch(test_mode)
+    if not messages:
+        return []
+
+    deliveries = get_mattermost_client().send_batch([message.payload for message in messages]).deliveries
+
+    with get_db_session(test_mode) as session:
+        for message, delivery in zip(messages, deliveries, strict=True):
+            values = get_delivery_update(message.dedupe_key, message.attempts + 1, delivery, result)
+            session.execute(
+                update(NotificationOutboxTable).where(NotificationOutboxTable.id == message.id).values(**values)
+            )
+
+    return deliveries
+
+
+def get_delivery_update(
+    dedupe_key: str, attempts: int, delivery: WebhookDelivery, result: DrainResult
+) -> dict[str, object]:
+    """
+    Column values of an outbox row after its given attempt: sent, failed for good, or due again after a backoff.
+    """
+    values: dict[str, object] = {"attempts": attempts, "last_error": delivery.error}
+
+    if delivery.success:
+        values.update(status="sent", sent_at=utcnow())
+        result.sent += 1
+        logger.info(f"Delivered notification {dedupe_key}")
+    elif attempts >= OUTBOX_MAX_ATTEMPTS:
+        values.update(status="failed")
+        result.failed += 1
+        logger.error(f"Giving up on notification {dedupe_key} after {attempts} attempts")
+    else:
+        delay = delivery.retry_after if delivery.retry_after is not None else get_backoff_seconds(attempts)
+        values.update(next_attempt_at=utcnow() + datetime.timedelta(seconds=delay))
+        result.retried += 1
+        logger.warning(f"Failed to deliver notification {dedupe_key}, retrying in {delay}s")
+
+    return values
+
+
+def _seconds_until_next_attempt(test_mode: bool) -> float | None:
+    with get_db_session(test_mode) as session:
+        next_attempt_at = session.execute(
+            select(func.min(NotificationOutboxTable.next_attempt_at)).where(NotificationOutboxTable.status == "pending")
+        ).scalar()
+
+    if next_attempt_at is None:
+        return None
+
+    return max((next_attempt_at - utcnow()).total_seconds(), 0.0)
+
+
+def _count_pending(test_mode: bool) -> int:
+    with get_db_session(test_mode) as session:
+        return int(
+            session.execute(select(func.count()).where(NotificationOutboxTable.status == "pending")).scalar_one()
+        )
+
+
+def drain_outbox(test_mode: bool = False, time_budget: float = OUTBOX_DRAIN_BUDGET_SECONDS) -> DrainResult:
+    """
+    Deliver pending notifications, waiting for retries as long as they fall within the time budget.
+    Messages that are still pending afterwards are picked up by the next drain.
+    """
+    deadline = time.monotonic() + time_budget
+    result = DrainResult()
+
+    while True:
+        deliveries = _deliver_batch(test_mode, result)
+        retry_after = max(
+            (delivery.retry_after for delivery in deliveries if delivery.retry_after is not None), default=None
+        )
+
+        if deliveries and retry_after is None:
+            continue
+
+        # Nothing due, or rate limited: wait for the next message that is due, if that's within the budget
+        wait = _seconds_until_next_attempt(test_mode)
+        if retry_after is not None:
+            wait = max(wait or 0.0, retry_after)
+        if wait is None or time.monotonic() + wait > deadline:
+            break
+
+        time.sleep(wait)
+
+    result.pending = _count_pending(test_mode)
+    logger.info(f"Drained notification outbox: {result}")
+    return result
+
+
+def _drain_in_background(test_mode: bool) -> None:
+    try:
+        drain_outbox(test_mode)
+    except Exception as e:
+        logger.error(f"Failed to drain notification outbox: {e}")
+
+
+def start_background_delivery(test_mode: bool = False) -> threading.Thread:
+    """
+    Drain the outbox in a background thread, so the caller can respond without waiting on Mattermost.
+    """
+    thread = threading.Thread(target=_drain_in_background, args=(test_mode,), name="outbox-drainer", daemon=True)
+    thread.start()
+    return thread
@@ -0,0 +1,133 @@
+import datetime
+import logging
+import os
+
+from sqlalchemy import false, or_, select, tuple_, update
+
+from database import DutyAssignmentTable, MemberTable, get_db_session, utcnow
+from mattermost import build_reminder_payload, get_mattermost_client
+from models import ReminderResult
+
+logger = logging.getLogger(__name__)
+
+# How long after the assignment its assignee is reminded, if they haven't completed it by then
+REMINDER_AFTER_HOURS = float(os.environ.get("REMINDER_AFTER_HOURS", "48"))
+# Assignments older than this aren't followed up anymore, e.g. the history from before there were reminders
+REMINDER_MAX_AGE_DAYS = float(os.environ.get("REMINDER_MAX_AGE_DAYS", "14"))
+# Number of reminders that are claimed and sent concurrently at a time
+REMINDER_BATCH_SIZE = int(os.environ.get("REMINDER_BATCH_SIZE", "50"))
+# Other sweeps leave claimed reminders alone for this long, in case the sweep sending them dies first. Longer than
+# sending a batch can take with the timeout and retries of the Mattermost client.
+REMINDER_CLAIM_SECONDS = float(os.environ.get("REMINDER_CLAIM_SECONDS", "120"))
+
+
+def _remind_batch(
+    test_mode: bool,
+    assigned_before: datetime.datetime,
+    after: tuple[datetime.datetime, int],
+    result: ReminderResult,
+) -> tuple[datetime.datetime, int] | None:
+    """
+    Remind the assignees of the oldest uncompleted assignments after the given (assigned_at, id), up to
+    REMINDER_BATCH_SIZE of them. The conditions are those of the partial index, so only assignments still waiting
+    for a reminder are read. The assignments are claimed for REMINDER_CLAIM_SECONDS, which is committed before the
+    reminders are sent, so no row locks or pooled connection are held while Mattermost responds. Only assignments
+    that aren't claimed when the update runs are claimed, so concurrent sweeps never remind twice. The reminders
+    that were delivered are recorded as sent in a second transaction, and the claims of the others are released.
+    If the sweep dies before that, a later sweep sends the reminders once their claim has expired. Returns the
+    position of the last assignment, or None when there are no more.
+    """
+    now = utcnow()
+    claimable = (
+        DutyAssignmentTable.completed == false(),
+        DutyAssignmentTable.reminder_sent_at.is_(None),
+        or_(DutyAssignmentTable.reminder_claimed_until.is_(None), DutyAssignmentTable.reminder_claimed_until <= now),
+    )
+    with get_db_session(test_mode) as session:
+        batch = session.execute(
+            select(DutyAssignmentTable.id, DutyAssignmentTable.assigned_at)
+            .where(
+                *claimable,
+                DutyAssignmentTable.assigned_at < assigned_before,
+                tuple_(DutyAssignmentTable.assigned_at, DutyAssignmentTable.id) > after,
+            )
+            .order_by(DutyAssignmentTable.assigned_at, DutyAssignmentTable.id)
+            .limit(REMINDER_BATCH_SIZE)
+            .with_for_update(skip_locked=True)
+        ).all()
+
+        if not batch:
+            return None
+
+        claimed = session.execute(
+            update(DutyAssignmentTable)
+            .where(DutyAssignmentTable.id.in_([assignment.id for assignment in batch]), *claimable)
+            .values(reminder_claimed_until=now + datetime.timedelta(seconds=REMINDER_CLAIM_SECONDS))
+            .returning(
+                DutyAssignmentTable.id,
+                DutyAssignmentTable.duty_type,
+                select(MemberTable.username)
+                .where(MemberTable.id == DutyAssignmentTable.member_id)
+                .scalar_subquery()
+                .label("username"),
+            )
+        ).all()
+
+    assignments = sorted(claimed, key=lambda assignment: assignment.id)
+    deliveries = (
+        get_mattermost_client()
+        .send_batch(
+            [build_reminder_payload(assignment.username, assignment.duty_type, test_mode) for assignment in assignments]
+        )
+        .deliveries
+    )
+
+    sent, failed = [], []
+    for assignment, delivery in zip(assignments, deliveries, strict=True):
+        if delivery.success:
+            sent.append(assignment.id)
+            result.sent += 1
+        else:
+            # Left for the next sweep
+            failed.append(assignment.id)
+            result.failed += 1
+            logger.warning(f"Failed to remind {assignment.username} of assignment {assignment.id}: {delivery.error}")
+
+    with get_db_session(test_mode) as session:
+        if sent:
+            session.execute(
+                update(DutyAssignmentTable)
+                .where(DutyAssignmentTable.id.in_(sent))
+                .values(reminder_sent_at=utcnow(), reminder_claimed_until=None)
+            )
+        if failed:
+            session.execute(
+                update(DutyAssignmentTable)
+                .where(DutyAssignmentTable.id.in_(failed))
+                .values(reminder_claimed_until=None)
+            )
+
+    last = batch[-1]
+    return last.assigned_at, last.id
+
+
+def send_reminders(
+    test_mode: bool = False,
+    after_hours: float = REMINDER_AFTER_HOURS,
+    max_age_days: float = REMINDER_MAX_AGE_DAYS,
+) -> ReminderResult:
+    """
+    Remind the assignees of every assignment that is older than `after_hours` and isn't completed yet, once.
+    Reminders that couldn't be delivered are tried again by the next sweep, and reminders of a sweep that died
+    while sending them by the first sweep after their claim expired.
+    """
+    now = utcnow()
+    assigned_before = now - datetime.timedelta(hours=after_hours)
+    position: tuple[datetime.datetime, int] | None = (now - datetime.timedelta(days=max_age_days), 0)
+    result = ReminderResult()
+
+    while position is not None:
+        position = _remind_batch(test_mode, assigned_before, position, result)
+
+    logger.info(f"Sent reminders: {result}")
+    return result
@@ -0,0 +1,85 @@
+import os
+import threading
+from typing import NamedTuple
+
+from models import OfficeMember
+
+# Warm instances keep the roster in memory while its version in the database doesn't change
+ROSTER_CACHE_ENABLED = os.environ.get("ROSTER_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+
+
+class RosterVersion(NamedTuple):
+    """
+    Version of the members table. Every update increments the row_version of the member (in the application or
+    by the trigger of migrations/004_member_row_version.sql), and inserts and deletes change the count or the
+    highest id, so any change to the roster results in a different version.
+    """
+
+    member_count: int
+    max_member_id: int
+    row_version_sum: int
+
+    def bumped(self, increments: int = 1) -> "RosterVersion":
+        """
+        The version after the given number of row_version increments.
+        """
+        return self._replace(row_version_sum=self.row_version_sum + increments)
+
+
+class RosterCache:
+    """
+    Active members of the latest roster version that was read, with the coffee drinker and all-member views
+    derived from them once per version.
+    """
+
+    def __init__(self, enabled: bool = ROSTER_CACHE_ENABLED) -> None:
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._version: RosterVersion | None = None
+        self._views: dict[bool, list[OfficeMember]] = {}
+
+    def get(self, version: RosterVersion, coffee_drinkers_only: bool = False) -> list[OfficeMember] | None:
+        """
+        The cached members of the given version, or None if the roster has to be read again.
+        """
+        with self._lock:
+            if not self.enabled or version != self._version:
+                return None
+            return list(self._views[coffee_drinkers_only])
+
+    def store(self, version: RosterVersion, members: list[OfficeMember]) -> None:
+        """
+        Replace the cache with the active members of the given version.
+        """
+        with self._lock:
+            self._version = version
+            self._views = {
+                False: list(members),
+                True: [member for member in members if member.coffee_drinker],
+            }
+
+    def update_member(self, version: RosterVersion, member: OfficeMember) -> None:
+        """
+        Apply a change this instance made itself, which moved the roster from `version` to `version.bumped()`.
+        If the cache holds another version, it is left alone and the next read fetches the roster.
+        """
+        self.update_members(version, [member])
+
+    def update_members(self, version: RosterVersion, members: list[OfficeMember]) -> None:
+        """
+        Apply changes this instance made itself, which incremented the row_version of every given member once.
+        """
+        updated = {member.id: member for member in members}
+        with self._lock:
+            if version != self._version:
+                return
+            self._version = version.bumped(len(updated))
+            self._views = {
+                coffee_drinkers_only: [updated.get(cached.id, cached) for cached in cached_members]
+                for coffee_drinkers_only, cached_members in self._views.items()
+            }
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._version = None
+            self._views = {}
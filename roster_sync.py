@@ -0,0 +1,325 @@
+"""
+Sync the members table with an HR export, streamed from a CSV or JSON lines file.
+
+Usage:
+    python -m roster_sync export.csv [--format csv|jsonl] [--test-mode] [--dry-run] [--keep-missing]
+
+Every row has a `username` and optionally `full_name`, `coffee_drinker`, `active`, `office` and `duty_weight`.
+Columns that are missing or empty keep the current value of the member (or the default of a new member). Members
+that aren't in the export are deactivated, unless --keep-missing is given. The export is copied into a temporary
+staging table (with COPY on Postgres) without holding it in memory, and merged into the members table in the same
+transaction with a handful of set-based statements, which bump the row version of every changed member.
+"""
+
+import argparse
+import csv
+import io
+import itertools
+import json
+import logging
+import math
+import time
+from collections.abc import Iterable, Iterator
+from pathlib import Path
+from typing import Any, NamedTuple
+
+from sqlalchemy import (
+    Boolean,
+    Column,
+    Float,
+    MetaData,
+    String,
+    Table,
+    and_,
+    exists,
+    false,
+    func,
+    insert,
+    or_,
+    select,
+    true,
+    update,
+)
+from sqlalchemy.orm import Session
+
+from database import MemberTable, get_db_session
+from duties import DEFAULT_OFFICE
+from models import RosterSyncResult
+
+logger = logging.getLogger(__name__)
+
+# Values of the boolean columns in CSV files, empty values keep the current one
+TRUE_VALUES = {"1", "true", "t", "yes", "y"}
+FALSE_VALUES = {"0", "false", "f", "no", "n"}
+
+
+class RosterRow(NamedTuple):
+    """
+    A member as listed by the export. None keeps the current value.
+    """
+
+    username: str
+    full_name: str | None = None
+    coffee_drinker: bool | None = None
+    active: bool | None = None
+    office: str | None = None
+    duty_weight: float | None = None
+
+
+staging = Table(
+    "members_staging",
+    MetaData(),
+    # Duplicate usernames in the export are rejected by the primary key
+    Column("username", String(50), primary_key=True),
+    Column("full_name", String(100)),
+    Column("coffee_drinker", Boolean),
+    Column("active", Boolean),
+    Column("office", String(50)),
+    Column("duty_weight", Float),
+    prefixes=["TEMPORARY"],
+)
+SYNCED_COLUMNS = ("full_name", "coffee_drinker", "active", "office", "duty_weight")
+
+
+def _parse_bool(value: Any, field: str, line: int) -> bool | None:
+    if value is None or isinstance(value, bool):
+        return value
+    text = str(value).strip().lower()
+    if not text:
+        return None
+    if text in TRUE_VALUES:
+        return True
+    if text in FALSE_VALUES:
+        return False
+    raise ValueError(f"Line {line}: invalid {field} {value!r}")
+
+
+def _parse_row(record: dict[str, Any], line: int) -> RosterRow:
+    """
+    Parse a record of the export, raising ValueError with its line number if it is invalid.
+    """
+    username = str(record.get("username") or "").strip()
+    if not username or len(username) > 50:
+        raise ValueError(f"Line {line}: username must have 1 to 50 characters")
+
+    full_name = str(record.get("full_name") or "").strip() or None
+    office = str(record.get("office") or "").strip() or None
+    if office is not None and len(office) > 50:
+        raise ValueError(f"Line {line}: office must have at most 50 characters")
+
+    duty_weight = record.get("duty_weight")
+    if duty_weight is not None and str(duty_weight).strip():
+        try:
+            duty_weight = float(duty_weight)
+        except ValueError as e:
+            raise ValueError(f"Line {line}: invalid duty_weight {duty_weight!r}") from e
+        # The credit of a turn is divided by the weight, so it has to be a finite positive number
+        if not math.isfinite(duty_weight) or duty_weight <= 0:
+            raise ValueError(f"Line {line}: duty_weight must be a positive number")
+    else:
+        duty_weight = None
+
+    return RosterRow(
+        username=username,
+        full_name=full_name[:100] if full_name is not None else None,
+        coffee_drinker=_parse_bool(record.get("coffee_drinker"), "coffee_drinker", line),
+        active=_parse_bool(record.get("active"), "active", line),
+        office=office,
+        duty_weight=duty_weight,
+    )
+
+
+def read_export(lines: Iterable[str], export_format: str = "csv") -> Iterator[RosterRow]:
+    """
+    Parse the rows of a CSV (with a header) or JSON lines export one at a time.
+    """
+    if export_format == "csv":
+        reader = csv.DictReader(lines)
+        if reader.fieldnames is None or "username" not in reader.fieldnames:
+            raise ValueError("The export has no username column")
+        for record in reader:
+            yield _parse_row(record, reader.line_num)
+    elif export_format == "jsonl":
+        for line, text in enumerate(lines, start=1):
+            if not text.strip():
+                continue
+            try:
+                record = json.loads(text)
+            except json.JSONDecodeError as e:
+                raise ValueError(f"Line {line}: invalid JSON") from e
+            if not isinstance(record, dict):
+                raise ValueError(f"Line {line}: expected an object")
+            yield _parse_row(record, line)
+    else:
+        raise ValueError(f"Unknown export format {export_format}")
+
+
+class _CsvStream:
+    """
+    File-like CSV rendering of rows for COPY, produced as the driver reads it.
+    """
+
+    def __init__(self, rows: Iterator[RosterRow]) -> None:
+        self._rows = rows
+        self._buffer = io.StringIO()
+        self._writer = csv.writer(self._buffer, lineterminator="\n")
+        self.count = 0
+        # The driver only reports that read() failed, so an invalid row is raised again after the COPY
+        self.error: Exception | None = None
+
+    def read(self, size: int = -1) -> str:
+        try:
+            # NULL is an unquoted empty field, so empty strings can't occur in the staged columns
+            for row in itertools.islice(self._rows, max(size // 64, 1) if size > 0 else None):
+                self._writer.writerow(["" if value is None else value for value in row])
+                self.count += 1
+        except Exception as e:
+            self.error = e
+            raise
+        data = self._buffer.getvalue()
+        self._buffer.seek(0)
+        self._buffer.truncate()
+        return data
+
+    def readline(self) -> str:
+        return self.read(1)
+
+
+def _count(rows: Iterator[RosterRow], counter: list[int]) -> Iterator[RosterRow]:
+    for row in rows:
+        counter[0] += 1
+        yield row
+
+
+def _load_staging(session: Session, rows: Iterator[RosterRow]) -> int:
+    """
+    Stream the rows into the staging table, returning how many there were. Postgres reads them with COPY, other
+    databases with a single executemany of the driver, which consumes them one at a time.
+    """
+    dialect = session.get_bind().dialect
+    cursor = session.connection().connection.cursor()
+    try:
+        if dialect.name == "postgresql":
+            stream = _CsvStream(rows)
+            try:
+                cursor.copy_expert(
+                    f"COPY {staging.name} ({', '.join(RosterRow._fields)}) FROM STDIN WITH (FORMAT csv)", stream
+                )
+            except dialect.loaded_dbapi.DatabaseError:
+                if stream.error is not None:
+                    raise stream.error from None
+                raise
+            return stream.count
+
+        counter = [0]
+        cursor.executemany(str(insert(staging).compile(dialect=dialect)), _count(rows, counter))  # type: ignore[arg-type]
+        return counter[0]
+    except dialect.loaded_dbapi.IntegrityError as e:
+        raise ValueError("The export lists a username more than once") from e
+    finally:
+        cursor.close()
+
+
+def _merge(session: Session, deactivate_missing: bool, result: RosterSyncResult) -> None:
+    """
+    Apply the staged export to the members table: update the members whose values differ, insert the new ones and
+    deactivate the ones that are missing. Every changed member gets a new row version, so cached rosters are read
+    again.
+    """
+    listed = exists().where(staging.c.username == MemberTable.username)
+    changed = or_(
+        *(
+            func.coalesce(staging.c[name], getattr(MemberTable, name)).is_distinct_from(getattr(MemberTable, name))
+            for name in SYNCED_COLUMNS
+        )
+    )
+    result.updated = session.execute(
+        update(MemberTable)
+        .where(staging.c.username == MemberTable.username, changed)
+        .values(
+            **{name: func.coalesce(staging.c[name], getattr(MemberTable, name)) for name in SYNCED_COLUMNS},
+            row_version=MemberTable.row_version + 1,
+        )
+        .execution_options(synchronize_session=False)
+    ).rowcount
+
+    result.inserted = session.execute(
+        insert(MemberTable).from_select(
+            ["username", *SYNCED_COLUMNS],
+            select(
+                staging.c.username,
+                staging.c.full_name,
+                func.coalesce(staging.c.coffee_drinker, true()),
+                func.coalesce(staging.c.active, true()),
+                func.coalesce(staging.c.office, DEFAULT_OFFICE),
+                func.coalesce(staging.c.duty_weight, 1.0),
+            ).where(~exists().where(MemberTable.username == staging.c.username)),
+        )
+    ).rowcount
+
+    if deactivate_missing:
+        result.deactivated = session.execute(
+            update(MemberTable)
+            .where(and_(MemberTable.active == true(), ~listed))
+            .values(active=false(), row_version=MemberTable.row_version + 1)
+            .execution_options(synchronize_session=False)
+        ).rowcount
+
+
+def sync_roster(
+    rows: Iterable[RosterRow], test_mode: bool = False, deactivate_missing: bool = True, dry_run: bool = False
+) -> RosterSyncResult:
+    """
+    Sync the members with the rows of an export in one transaction. A dry run reports the changes and rolls them
+    back. Raises ValueError if the export is empty or lists a username twice.
+    """
+    start = time.perf_counter()
+    result = RosterSyncResult(dry_run=dry_run)
+
+    with get_db_session(test_mode) as session:
+        connection = session.connection()
+        # A failed sync rolls the staging table back on Postgres, but SQLite creates it outside of the transaction
+        staging.drop(connection, checkfirst=True)
+        staging.create(connection)
+        result.rows = _load_staging(session, iter(rows))
+        # Deactivating everyone is more likely a broken export than a company closing down
+        if result.rows == 0:
+            raise ValueError("The export has no members")
+        _merge(session, deactivate_missing, result)
+        staging.drop(connection)
+        if dry_run:
+            session.rollback()
+
+    result.duration = time.perf_counter() - start
+    logger.info(f"Synced the roster: {result}")
+    return result
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("export", type=Path, help="CSV or JSON lines file of the HR export")
+    parser.add_argument("--format", choices=["csv", "jsonl"], help="format of the export (default by its extension)")
+    parser.add_argument("--test-mode", action="store_true", help="sync the dev database")
+    parser.add_argument("--dry-run", action="store_true", help="report the changes without applying them")
+    parser.add_argument("--keep-missing", action="store_true", help="don't deactivate members missing from the export")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    export_format = args.format or ("jsonl" if args.export.suffix in (".jsonl", ".ndjson", ".json") else "csv")
+    with args.export.open(newline="", encoding="utf-8-sig") as lines:
+        result = sync_roster(
+            read_export(lines, export_format),
+            test_mode=args.test_mode,
+            deactivate_missing=not args.keep_missing,
+            dry_run=args.dry_run,
+        )
+
+    prefix = "Would have synced" if result.dry_run else "Synced"
+    print(
+        f"{prefix} {result.rows} members in {result.duration:.2f} s: {result.inserted} inserted, "
+        f"{result.updated} updated, {result.deactivated} deactivated"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,50 @@
+import os
+import random
+from enum import StrEnum
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from models import OfficeMember
+
+
+class SelectionStrategy(StrEnum):
+    # Uniformly random among the members who have not had a turn in the current cycle
+    RANDOM = "random"
+    # Stride scheduling on the credit members build up over all duty types
+    STRIDE = "stride"
+
+
+DUTY_SELECTION_STRATEGY = SelectionStrategy(os.environ.get("DUTY_SELECTION_STRATEGY", SelectionStrategy.RANDOM))
+
+
+def select_by_credit(members: list["OfficeMember"]) -> "OfficeMember | None":
+    """
+    Select the member who used the least credit relative to their weight, regardless of the current cycle.
+    Members without credit yet (new joiners) start at the lowest credit of the others, and go first among the members
+    at that credit. Otherwise their start would keep moving up with the lowest credit while they lose the ties.
+    """
+    if not members:
+        return None
+
+    # Every trigger loads the roster and picks once, so a heap would cost as much to build as this scan
+    lowest = min((member.duty_credit for member in members if member.duty_credit is not None), default=0.0)
+    return min(
+        members,
+        key=lambda member: (
+            member.duty_credit if member.duty_credit is not None else lowest,
+            member.duty_credit is not None,
+            random.random(),
+        ),
+    )
+
+
+def charged_credit(member: "OfficeMember", members: list["OfficeMember"]) -> float:
+    """
+    The credit of `member` after one more turn. A member without credit starts at the lowest credit of the others.
+    """
+    if member.duty_credit is not None:
+        base = member.duty_credit
+    else:
+        base = min((other.duty_credit for other in members if other.duty_credit is not None), default=0.0)
+
+    return base + 1 / member.duty_weight
@@ -0,0 +1,64 @@
+from collections.abc import Generator
+from pathlib import Path
+from typing import Any
+
+import pytest
+from pytest_mock import MockerFixture
+from sqlalchemy import event
+
+import database
+
+
+@pytest.fixture
+def members() -> list[database.MemberTable]:
+    """
+    The members seeded by seeded_db, override it in a test module for another roster.
+    """
+    return [database.MemberTable(id=1, username="lotte"), database.MemberTable(id=2, username="abel")]
+
+
+@pytest.fixture
+def assignments() -> list[database.DutyAssignmentTable]:
+    """
+    The assignments seeded by seeded_db, none unless a test module overrides it.
+    """
+    return []
+
+
+@pytest.fixture
+def seeded_db(
+    tmp_path: Path,
+    mocker: MockerFixture,
+    members: list[database.MemberTable],
+    assignments: list[database.DutyAssignmentTable],
+) -> Generator[None, None, None]:
+    """
+    A SQLite database for the dev and prod connection strings, with the members and assignments of the test module.
+    """
+    mocker.patch("database.get_database_url", return_value=f"sqlite:///{tmp_path / 'duties.db'}")
+    database.dispose_engines()
+    database.Base.metadata.create_all(database.get_engine(test_mode=True))
+    with database.get_db_session(test_mode=True) as session:
+        session.add_all(members)
+        session.flush()
+        session.add_all(assignments)
+    yield
+    database.dispose_engines()
+
+
+@pytest.fixture
+def statements(seeded_db: None) -> Generator[list[tuple[str, Any]], None, None]:
+    """
+    The statements and parameters that the engine of seeded_db executes during the test.
+    """
+    engine = database.get_engine(test_mode=True)
+    executed: list[tuple[str, Any]] = []
+
+    def before_cursor_execute(
+        connection: object, cursor: object, statement: str, parameters: Any, context: object, executemany: bool
+    ) -> None:
+        executed.append((statement, parameters))
+
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    yield executed
+    event.remove(engine, "before_cursor_execute", before_cursor_execute)
@@ -0,0 +1,100 @@
+import json
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import TracebackType
+from typing import Any
+
+
+class StubMattermostServer:
+    """
+    Local stand-in for a Mattermost incoming webhook. Responses can be scripted to inject failures and
+    rate limits, and every request can be delayed to simulate latency.
+    """
+
+    def __init__(self, latency: float = 0.0) -> None:
+        self.latency = latency
+        self.received: list[dict[str, Any]] = []
+        # Client addresses of the connections that were opened, to check connection reuse
+        self.connections: set[tuple[str, int]] = set()
+        self.responses: deque[tuple[int, dict[str, str]]] = deque()
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, args=(0.05,), daemon=True)
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host!s}:{port}/hooks/stub"
+
+    def fail_next(self, status: int, headers: dict[str, str] | None = None, times: int = 1) -> None:
+        for _ in range(times):
+            self.responses.append((status, headers or {}))
+
+    def _handler(self) -> type[BaseHTTPRequestHandler]:
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            disable_nagle_algorithm = True
+
+            def do_POST(self) -> None:
+                body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                if stub.latency:
+                    time.sleep(stub.latency)
+
+                with stub._lock:
+                    stub.connections.add(self.client_address[:2])
+                    status, headers = stub.responses.popleft() if stub.responses else (200, {})
+                    if status == 200:
+                        stub.received.append(json.loads(body))
+
+                self.send_response(status)
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.send_header("Content-Length", "2")
+                self.end_headers()
+                self.wfile.write(b"ok")
+
+            def log_message(self, format: str, *args: Any) -> None:
+                pass
+
+        return Handler
+
+    def __enter__(self) -> "StubMattermostServer":
+        self._thread.start()
+        return self
+
+    def __exit__(
+        self, exc_type: type[BaseException] | None, exc: BaseException | None, traceback: TracebackType | None
+    ) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+
+@dataclass
+class FakePayload:
+    data: bytes
+
+
+@dataclass
+class FakeResponse:
+    payload: FakePayload
+
+
+@dataclass
+class FakeSecretManagerClient:
+    """
+    Stand-in for the Secret Manager client, serving secrets from a dict and recording every access.
+    """
+
+    secrets: dict[str, str]
+    calls: list[str] = field(default_factory=list)
+
+    def access_secret_version(self, name: str) -> FakeResponse:
+        self.calls.append(name)
+        token_name = name.split("/")[3]
+        return FakeResponse(payload=FakePayload(data=self.secrets[token_name].encode("UTF-8")))
@@ -0,0 +1,192 @@
+import datetime
+import sys
+from pathlib import Path
+
+import pytest
+from functions_framework import create_app
+from hypothesis import HealthCheck, given, settings
+from hypothesis import strategies as st
+from pytest_mock import MockerFixture
+from sqlalchemy import delete, select
+
+import analytics
+import database
+from models import OfficeMember
+
+START = datetime.datetime(2025, 1, 6, 9, 0)
+
+
+@pytest.fixture
+def members() -> list[database.MemberTable]:
+    """
+    Four active members, of whom jdoe works in Amsterdam and never had a turn, and an inactive one.
+    """
+    return [
+        database.MemberTable(id=1, username="lotte"),
+        database.MemberTable(id=2, username="abel"),
+        database.MemberTable(id=3, username="sam"),
+        database.MemberTable(id=4, username="jdoe", office="amsterdam"),
+        database.MemberTable(id=5, username="former", active=False),
+    ]
+
+
+def record(turns: list[tuple[int, str, int]], cycle_id: int = 0) -> None:
+    """
+    Record (member, duty type, days after START) turns, in this order.
+    """
+    with database.get_db_session(test_mode=True) as session:
+        session.execute(delete(database.DutyAssignmentTable))
+        session.add_all(
+            [
+                database.DutyAssignmentTable(
+                    member_id=member_id,
+                    duty_type=duty_type,
+                    assigned_at=START + datetime.timedelta(days=days),
+                    cycle_id=cycle_id,
+                )
+                for member_id, duty_type, days in turns
+            ]
+        )
+
+
+def recorded_cycles() -> list[int]:
+    with database.get_db_session(test_mode=True) as session:
+        return list(
+            session.scalars(select(database.DutyAssignmentTable.cycle_id).order_by(database.DutyAssignmentTable.id))
+        )
+
+
+def reference_cycles(member_ids: list[int]) -> list[int]:
+    """
+    The cycles the functions would have assigned: a new one starts when a member gets a second turn.
+    """
+    cycles, cycle, seen = [], 0, set[int]()
+    for member_id in member_ids:
+        if member_id in seen:
+            cycle, seen = cycle + 1, set()
+        seen.add(member_id)
+        cycles.append(cycle)
+    return cycles
+
+
+@pytest.mark.unit
+def test_member_stats(seeded_db: None) -> None:
+    """
+    Test that the turns, last turn and gaps of every active member are computed, longest idle first
+    """
+    record([(1, "coffee", 0), (2, "coffee", 14), (1, "fridge", 20), (1, "coffee", 28), (5, "coffee", 30)])
+
+    stats = {row.username: row for row in analytics.get_member_stats(test_mode=True)}
+
+    assert list(stats) == ["sam", "jdoe", "abel", "lotte"]
+    assert (stats["sam"].turns, stats["sam"].last_assigned_at, stats["sam"].average_gap_days) == (0, None, None)
+    assert stats["abel"].turns == 1 and stats["abel"].average_gap_days is None
+    lotte = stats["lotte"]
+    assert (lotte.turns, lotte.last_assigned_at) == (3, START + datetime.timedelta(days=28))
+    assert lotte.average_gap_days == pytest.approx(14)
+    assert lotte.longest_gap_days == pytest.approx(20)
+
+
+@pytest.mark.unit
+def test_member_stats_filters(seeded_db: None, mocker: MockerFixture) -> None:
+    """
+    Test that the stats can be limited to a duty type, an office and members idle for a number of days
+    """
+    record([(1, "coffee", 0), (2, "coffee", 14), (1, "fridge", 20), (1, "coffee", 28)])
+    mocker.patch("analytics.utcnow", return_value=START + datetime.timedelta(days=30))
+
+    coffee = {row.username: row for row in analytics.get_member_stats("coffee", test_mode=True)}
+    idle = [row.username for row in analytics.get_member_stats(idle_days=10, test_mode=True)]
+    amsterdam = [row.username for row in analytics.get_member_stats(office="amsterdam", test_mode=True)]
+
+    assert coffee["lotte"].turns == 2 and coffee["lotte"].average_gap_days == pytest.approx(28)
+    assert idle == ["sam", "jdoe", "abel"]
+    assert amsterdam == ["jdoe"]
+
+
+@pytest.mark.unit
+@settings(max_examples=50, deadline=None, suppress_health_check=[HealthCheck.function_scoped_fixture])
+@given(member_ids=st.lists(st.integers(min_value=1, max_value=4), max_size=40))
+def test_backfill_matches_the_assignment_rule(seeded_db: None, member_ids: list[int]) -> None:
+    """
+    Test that the backfill recomputes the cycles the functions assign, in any order of turns
+    """
+    record([(member_id, "coffee", days) for days, member_id in enumerate(member_ids)], cycle_id=99)
+
+    result = analytics.backfill_cycles(test_mode=True)
+
+    assert recorded_cycles() == reference_cycles(member_ids)
+    assert result.changed == len(member_ids)
+
+
+@pytest.mark.unit
+def test_backfill_repairs_cycles_per_duty_and_the_current_cycle(seeded_db: None) -> None:
+    """
+    Test that the cycles of every duty type are recomputed separately, and the current cycle points at the last one
+    """
+    record([(1, "coffee", 0), (2, "fridge", 1), (2, "coffee", 2), (1, "coffee", 3), (1, "fridge", 4)])
+    with database.get_db_session(test_mode=True) as session:
+        session.add(database.DutyCycleTable(duty_type="coffee", cycle_id=7))
+
+    dry_run = analytics.backfill_cycles(test_mode=True, dry_run=True)
+    assert recorded_cycles() == [0, 0, 0, 0, 0]
+
+    result = analytics.backfill_cycles(test_mode=True)
+
+    assert (dry_run.changed, result.changed, result.assignments, result.cycles) == (1, 1, 5, 3)
+    assert recorded_cycles() == [0, 0, 0, 1, 0]
+    with database.get_db_session(test_mode=True) as session:
+        pointers = {
+            duty_type: cycle_id
+            for duty_type, cycle_id in session.execute(
+                select(database.DutyCycleTable.duty_type, database.DutyCycleTable.cycle_id)
+            )
+        }
+    assert pointers == {"coffee": 1, "fridge": 0}
+
+
+@pytest.mark.unit
+def test_backfill_keeps_the_cycles_of_assignments(seeded_db: None) -> None:
+    """
+    Test that a history recorded by assign_next_member is left as it is
+    """
+
+    def first_unassigned(members: list[OfficeMember], assigned: set[int]) -> OfficeMember | None:
+        return next((member for member in members if member.id not in assigned), None)
+
+    for period in range(7):
+        result = database.assign_next_member("coffee", first_unassigned, period_key=f"p{period}", test_mode=True)
+        assert result.success, result.message
+    before = recorded_cycles()
+
+    backfill = analytics.backfill_cycles(test_mode=True)
+
+    assert before == [0, 0, 0, 1, 1, 1, 2]
+    assert (backfill.changed, backfill.assignments, backfill.cycles) == (0, 7, 3)
+    assert recorded_cycles() == before
+
+
+@pytest.mark.unit
+def test_analytics_endpoint(seeded_db: None, mocker: MockerFixture) -> None:
+    """
+    Test that the endpoint lists the stats of the members and rejects invalid filters
+    """
+    record([(1, "coffee", 0), (1, "coffee", 7)])
+    # The app loads main.py as a new main module, which later tests that patch main must not see
+    mocker.patch.dict(sys.modules)
+    client = create_app(target="duty_analytics", source=str(Path(__file__).parent.parent / "main.py")).test_client()
+
+    response = client.get("/?test_mode=true&duty=coffee")
+
+    assert response.status_code == 200
+    assert response.headers["Access-Control-Allow-Origin"] == "https://clean-office-command-center.vercel.app"
+    assert response.headers["Cache-Control"] == "private, max-age=300"
+    members = response.json["members"]  # type: ignore[index]
+    assert [member["username"] for member in members] == ["abel", "sam", "jdoe", "lotte"]
+    assert members[-1]["average_gap_days"] == 7
+    assert client.get("/?test_mode=true&duty=dishes").status_code == 400
+    for idle_days in ["-1", "inf", "nan", "1e300", "3651"]:
+        response = client.get(f"/?test_mode=true&idle_days={idle_days}")
+        assert response.status_code == 400
+        assert response.json["message"] == "idle_days must be between 0 and 3650"  # type: ignore[index]
+    assert client.get("/?test_mode=true&idle_days=3650").status_code == 200
@@ -0,0 +1,113 @@
+from collections.abc import Generator
+
+import pytest
+from pytest_mock import MockerFixture
+
+import async_pipeline
+import database
+import main
+from duties import DutyType
+from models import AssignmentResult
+from tests.stubs import StubMattermostServer
+
+
+@pytest.fixture
+def seeded_db(seeded_db: None) -> Generator[None, None, None]:
+    yield
+    async_pipeline.dispose()
+
+
+@pytest.fixture
+def stub(mocker: MockerFixture) -> Generator[StubMattermostServer, None, None]:
+    with StubMattermostServer() as server:
+        mocker.patch("async_pipeline._client", async_pipeline.AsyncMattermostClient(webhook_url=server.url))
+        yield server
+
+
+def assign(period_key: str = "2024-W01") -> AssignmentResult:
+    return async_pipeline.assign_next_member(
+        DutyType.COFFEE,
+        lambda members, assigned: members[0],
+        notification=lambda member: {"text": f"Hi {member.username}", "channel": "@lotte_lutkenhaus"},
+        period_key=period_key,
+        test_mode=True,
+    )
+
+
+def outbox_rows() -> list[tuple[str, int]]:
+    with database.get_db_session(test_mode=True) as session:
+        rows = session.query(database.NotificationOutboxTable.status, database.NotificationOutboxTable.attempts)
+        return [(status, attempts) for status, attempts in rows.order_by(database.NotificationOutboxTable.id)]
+
+
+@pytest.mark.unit
+def test_assignment_is_recorded_and_delivered(seeded_db: None, stub: StubMattermostServer) -> None:
+    """
+    Test that the pipeline records the assignment, delivers its notification once and marks it as sent
+    """
+    result = assign()
+    repeat = assign()
+    async_pipeline.dispose()
+
+    assert result.success and result.member is not None and result.member.username == "lotte"
+    assert result.delivery is not None and result.delivery.success
+    assert repeat.already_assigned and repeat.delivery is None
+    assert stub.received == [{"text": "Hi lotte", "channel": "@lotte_lutkenhaus"}]
+    assert outbox_rows() == [("sent", 1)]
+    assert [record.member_id for record in database.get_assignment_history(test_mode=True)] == [1]
+
+
+@pytest.mark.unit
+def test_delivered_payload_is_the_stored_one(seeded_db: None, stub: StubMattermostServer) -> None:
+    """
+    Test that the notification is built once, and the message posted is the one stored in the outbox
+    """
+    greetings = iter(["Hi", "Hello"])
+
+    async_pipeline.assign_next_member(
+        DutyType.COFFEE,
+        lambda members, assigned: members[0],
+        notification=lambda member: {"text": f"{next(greetings)} {member.username}"},
+        period_key="2024-W01",
+        test_mode=True,
+    )
+    async_pipeline.dispose()
+
+    with database.get_db_session(test_mode=True) as session:
+        stored = session.query(database.NotificationOutboxTable.payload).scalar()
+    assert stub.received == [stored] == [{"text": "Hi lotte"}]
+
+
+@pytest.mark.unit
+def test_failed_delivery_is_left_to_the_outbox(
+    seeded_db: None, stub: StubMattermostServer, mocker: MockerFixture
+) -> None:
+    """
+    Test that a notification that couldn't be delivered stays pending and is handed to the outbox drain
+    """
+    stub.fail_next(500)
+    start_background_delivery = mocker.patch("async_pipeline.start_background_delivery")
+
+    result = assign()
+    async_pipeline.dispose()
+
+    assert result.success
+    assert result.delivery is not None and result.delivery.status_code == 500
+    assert outbox_rows() == [("pending", 1)]
+    start_background_delivery.assert_called_once_with(True)
+
+
+@pytest.mark.unit
+def test_handler_can_use_the_async_pipeline(seeded_db: None, stub: StubMattermostServer, mocker: MockerFixture) -> None:
+    """
+    Test that the synchronous handlers respond with the assignment of the pipeline, without a background drain
+    """
+    mocker.patch("main.ASYNC_PIPELINE_ENABLED", True)
+    start_background_delivery = mocker.patch("outbox.start_background_delivery")
+
+    response, status = main._assign_duty(DutyType.FRIDGE, test_mode=True)
+
+    assert status == 200
+    assert response["message"].startswith("Assigned fridge cleaning to ")
+    assert len(stub.received) == 1
+    start_background_delivery.assert_not_called()
@@ -0,0 +1,24 @@
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+from benchmarks.import_time import HEAVY_MODULES
+
+
+@pytest.mark.unit
+def test_importing_main_does_not_load_heavy_dependencies() -> None:
+    """
+    Test that a cold start only imports the dependencies needed to answer a health check
+    """
+    script = f"import sys, main; print([module for module in {HEAVY_MODULES} if module in sys.modules])"
+    process = subprocess.run(
+        [sys.executable, "-c", script],
+        cwd=Path(__file__).resolve().parent.parent,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+
+    assert process.stdout.strip() == "[]"
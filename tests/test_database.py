@@ -0,0 +1,360 @@
+import functools
+from collections import Counter
+from collections.abc import Generator
+from pathlib import Path
+from typing import Any
+
+import pytest
+from pytest_mock import MockerFixture
+from sqlalchemy import text, update
+from sqlalchemy.exc import OperationalError
+
+import database
+from duties import DEFAULT_OFFICE
+from main import select_next_member
+from models import DueDuty, DutyType, OfficeMember
+from scheduling import SelectionStrategy
+
+
+@pytest.fixture
+def members() -> list[database.MemberTable]:
+    """
+    Two coffee drinkers, one member who doesn't drink coffee and one who left.
+    """
+    return [
+        database.MemberTable(id=1, username="lotte", coffee_drinker=True, active=True),
+        database.MemberTable(id=2, username="abel", coffee_drinker=True, active=True),
+        database.MemberTable(id=3, username="ellie", coffee_drinker=False, active=True),
+        database.MemberTable(id=4, username="gone", coffee_drinker=True, active=False),
+    ]
+
+
+@pytest.mark.unit
+def test_engine_is_reused_across_sessions(seeded_db: None) -> None:
+    """
+    Test that consecutive sessions share one engine and one pooled connection
+    """
+    for _ in range(3):
+        with database.get_db_session(test_mode=True) as session:
+            session.execute(text("SELECT 1"))
+
+    assert database.get_engine(test_mode=True) is database.get_engine(test_mode=True)
+    assert database.get_database_url.call_count == 1  # type: ignore[attr-defined]
+
+    stats = database.get_pool_stats()
+    assert stats["dev"]["connections_opened"] == 1
+    assert stats["dev"]["checked_out"] == 0
+    assert "prod" not in stats
+
+
+@pytest.mark.unit
+def test_auth_error_refreshes_credentials(seeded_db: None, mocker: MockerFixture) -> None:
+    """
+    Test that a rejected password drops the cached connection string and engine
+    """
+    invalidate_secret = mocker.patch("database.invalidate_secret")
+    auth_error = OperationalError("SELECT 1", {}, Exception('password authentication failed for user "janitor"'))
+
+    with pytest.raises(OperationalError):
+        with database.get_db_session(test_mode=True):
+            raise auth_error
+
+    invalidate_secret.assert_called_once_with("neon-database-connection-string-dev")
+    assert database.get_pool_stats() == {}
+
+
+@pytest.mark.unit
+def test_assign_next_member_rotates_and_starts_new_cycle(seeded_db: None) -> None:
+    """
+    Test that every eligible member gets a turn before a new cycle starts
+    """
+    results = [
+        database.assign_next_member(DutyType.COFFEE, select_next_member, coffee_drinkers_only=True, test_mode=True)
+        for _ in range(4)
+    ]
+
+    assert all(result.success for result in results)
+    assert [result.cycle_id for result in results] == [0, 0, 1, 1]
+    assert {result.member.id for result in results[:2] if result.member} == {1, 2}
+    assert {result.member.id for result in results[2:] if result.member} == {1, 2}
+
+    with database.get_db_session(test_mode=True) as session:
+        assert session.query(database.DutyAssignmentTable).count() == 4
+        assert session.get(database.DutyCycleTable, (DEFAULT_OFFICE, "coffee")).cycle_id == 1  # type: ignore[union-attr]
+
+    cycle_info = database.get_current_cycle_info(DutyType.COFFEE, test_mode=True)
+    assert cycle_info.cycle_id == 1
+    assert cycle_info.assigned_member_ids == {1, 2}
+
+
+@pytest.mark.unit
+@pytest.mark.parametrize("members", [[]], ids=["no members"])
+def test_assign_next_member_without_eligible_members(seeded_db: None) -> None:
+    """
+    Test that an empty roster results in a failed assignment
+    """
+    result = database.assign_next_member(DutyType.FRIDGE, select_next_member, test_mode=True)
+
+    assert not result.success
+    assert result.member is None
+
+
+@pytest.mark.unit
+def test_assign_next_member_with_stride_strategy(seeded_db: None) -> None:
+    """
+    Test that the stride strategy spreads turns over both duty types by weight
+    """
+    with database.get_db_session(test_mode=True) as session:
+        session.query(database.MemberTable).update({"duty_credit": 0.0})
+        session.query(database.MemberTable).filter(database.MemberTable.id == 3).update({"duty_weight": 0.5})
+
+    select_member = functools.partial(select_next_member, strategy=SelectionStrategy.STRIDE)
+    counts: Counter[int] = Counter()
+    for _ in range(10):
+        for duty_type in DutyType:
+            result = database.assign_next_member(
+                duty_type,
+                select_member,
+                coffee_drinkers_only=duty_type == DutyType.COFFEE,
+                test_mode=True,
+            )
+            assert result.success and result.member is not None
+            counts[result.member.id] += 1
+
+    # Ellie doesn't drink coffee, so she does more fridge duty, but at half weight
+    assert counts == {1: 8, 2: 8, 3: 4}
+
+
+@pytest.mark.unit
+def test_stride_turns_stay_in_the_cycle_until_everyone_had_one(seeded_db: None) -> None:
+    """
+    Test that a second turn of a member with little credit doesn't start a new cycle while others are still waiting
+    """
+    with database.get_db_session(test_mode=True) as session:
+        session.query(database.MemberTable).filter(database.MemberTable.id == 1).update({"duty_credit": 0.0})
+        session.query(database.MemberTable).filter(database.MemberTable.id == 2).update({"duty_credit": 1.5})
+
+    select_member = functools.partial(select_next_member, strategy=SelectionStrategy.STRIDE)
+    results = [
+        database.assign_next_member(DutyType.COFFEE, select_member, coffee_drinkers_only=True, test_mode=True)
+        for _ in range(4)
+    ]
+
+    # Lotte's credit runs ahead of abel's only after her second turn
+    assert [result.member.id for result in results if result.member] == [1, 1, 2, 1]
+    assert [result.cycle_id for result in results] == [0, 0, 0, 1]
+
+
+@pytest.fixture
+def memory_backend(mocker: MockerFixture) -> Generator[None, None, None]:
+    mocker.patch("database.TEST_MODE_STORAGE_BACKEND", database.StorageBackend.MEMORY)
+    database.dispose_engines()
+    yield
+    database.dispose_engines()
+
+
+@pytest.mark.unit
+def test_memory_backend_runs_without_secret_manager(memory_backend: None, mocker: MockerFixture) -> None:
+    """
+    Test that test mode can run on an in-memory database, without fetching a connection string
+    """
+    get_secret = mocker.patch("database.get_secret")
+    with database.get_db_session(test_mode=True) as session:
+        session.add_all([database.MemberTable(id=1, username="lotte"), database.MemberTable(id=2, username="abel")])
+
+    results = [database.assign_next_member(DutyType.FRIDGE, select_next_member, test_mode=True) for _ in range(3)]
+
+    assert [result.cycle_id for result in results] == [0, 0, 1]
+    assert isinstance(database.get_repository(test_mode=True), database.SqliteRepository)
+    assert database.get_storage_backend(test_mode=False) == database.StorageBackend.POSTGRES
+    get_secret.assert_not_called()
+
+
+@pytest.mark.unit
+def test_sqlite_backend_keeps_data_in_directory(tmp_path: Path, mocker: MockerFixture) -> None:
+    """
+    Test that the SQLite backend creates its schema in a file that outlives the instance
+    """
+    mocker.patch("database.STORAGE_BACKEND", database.StorageBackend.SQLITE)
+    mocker.patch("database.SQLITE_DIRECTORY", str(tmp_path))
+    database.dispose_engines()
+
+    with database.get_db_session(test_mode=True) as session:
+        session.add(database.MemberTable(id=1, username="lotte"))
+    database.dispose_engines()
+
+    assert (tmp_path / "java_janitor_dev.db").exists()
+    assert [member.username for member in database.get_office_members(test_mode=True)] == ["lotte"]
+    database.dispose_engines()
+
+
+def roster_queries(statements: list[tuple[str, Any]]) -> int:
+    return sum("members.username" in statement for statement, _ in statements)
+
+
+@pytest.mark.unit
+def test_roster_is_cached_until_members_change(statements: list[tuple[str, Any]]) -> None:
+    """
+    Test that repeat invocations serve both roster views from memory, until another instance changes a member
+    """
+
+    database.assign_next_member(DutyType.COFFEE, select_next_member, coffee_drinkers_only=True, test_mode=True)
+    assert roster_queries(statements) == 1
+
+    for _ in range(3):
+        assert database.assign_next_member(DutyType.FRIDGE, select_next_member, test_mode=True).success
+    assert {member.username for member in database.get_office_members(test_mode=True)} == {"lotte", "abel", "ellie"}
+    coffee_drinkers = database.get_office_members(coffee_drinkers_only=True, test_mode=True)
+    assert {member.username for member in coffee_drinkers} == {"lotte", "abel"}
+    assert roster_queries(statements) == 1
+
+    # Like an update by another instance, or by hand with the trigger of the migration
+    with database.get_engine(test_mode=True).begin() as connection:
+        connection.execute(
+            update(database.MemberTable)
+            .where(database.MemberTable.id == 2)
+            .values(active=False, row_version=database.MemberTable.row_version + 1)
+        )
+
+    assert {member.username for member in database.get_office_members(test_mode=True)} == {"lotte", "ellie"}
+    assert roster_queries(statements) == 2
+
+
+@pytest.mark.unit
+def test_cached_roster_follows_own_credit_updates(statements: list[tuple[str, Any]]) -> None:
+    """
+    Test that the credit this instance charges is applied to its cached roster, without reading it again
+    """
+    select_member = functools.partial(select_next_member, strategy=SelectionStrategy.STRIDE)
+
+    for _ in range(4):
+        assert database.assign_next_member(DutyType.FRIDGE, select_member, test_mode=True).success
+
+    cached = {member.id: member.duty_credit for member in database.get_office_members(test_mode=True)}
+    database.get_repository(test_mode=True).roster_cache.invalidate()  # type: ignore[attr-defined]
+    stored = {member.id: member.duty_credit for member in database.get_office_members(test_mode=True)}
+
+    assert cached == stored
+    assert roster_queries(statements) == 2
+
+
+@pytest.mark.unit
+def test_assignment_history_is_read_as_records(seeded_db: None) -> None:
+    """
+    Test that the history is returned as lightweight records, in order, which still validate as DutyAssignment
+    """
+    for duty_type in [DutyType.COFFEE, DutyType.FRIDGE, DutyType.COFFEE]:
+        database.assign_next_member(duty_type, select_next_member, test_mode=True)
+
+    history = database.get_assignment_history(test_mode=True)
+    coffee_history = database.get_assignment_history(DutyType.COFFEE, test_mode=True)
+
+    assert [record.duty_type for record in history] == ["coffee", "fridge", "coffee"]
+    assert [record.id for record in coffee_history] == [history[0].id, history[2].id]
+    assert coffee_history[0].to_model().duty_type == DutyType.COFFEE
+
+
+@pytest.mark.unit
+def test_repeat_trigger_for_a_period_returns_stored_assignment(seeded_db: None) -> None:
+    """
+    Test that a repeat trigger for the same duty period returns the stored assignment, without a new notification
+    """
+
+    def notification(member: OfficeMember) -> dict[str, str]:
+        return {"text": member.username}
+
+    first = database.assign_next_member(
+        DutyType.FRIDGE, select_next_member, notification=notification, period_key="2024-01", test_mode=True
+    )
+    repeat = database.assign_next_member(
+        DutyType.FRIDGE, select_next_member, notification=notification, period_key="2024-01", test_mode=True
+    )
+    next_period = database.assign_next_member(
+        DutyType.FRIDGE, select_next_member, notification=notification, period_key="2024-02", test_mode=True
+    )
+
+    assert first.success and not first.already_assigned
+    assert repeat.success and repeat.already_assigned
+    assert repeat.member is not None and first.member is not None
+    assert repeat.member.id == first.member.id
+    assert repeat.cycle_id == first.cycle_id
+    assert next_period.success and not next_period.already_assigned
+    assert next_period.member is not None and next_period.member.id != first.member.id
+    assert len(database.get_assignment_history(DutyType.FRIDGE, test_mode=True)) == 2
+    with database.get_db_session(test_mode=True) as session:
+        assert session.query(database.NotificationOutboxTable).count() == 2
+    assert database.get_repository(test_mode=True).get_period_assignment(DutyType.FRIDGE, "2024-01") == repeat
+
+
+def seed_offices(count: int, members_per_office: int = 2, start: int = 0) -> list[str]:
+    offices = [f"office_{i}" for i in range(start, start + count)]
+    with database.get_db_session(test_mode=True) as session:
+        session.add_all(
+            database.MemberTable(username=f"{office}_member_{i}", office=office, coffee_drinker=i > 0)
+            for office in offices
+            for i in range(members_per_office)
+        )
+    return offices
+
+
+DUE_DUTIES = [
+    DueDuty(DutyType.COFFEE, coffee_drinkers_only=True, period_key="2024-W01"),
+    DueDuty(DutyType.FRIDGE, period_key="2024-01"),
+]
+
+
+@pytest.mark.unit
+@pytest.mark.parametrize("members", [[]], ids=["no members"])
+def test_batch_assigns_every_office_in_one_transaction(seeded_db: None) -> None:
+    """
+    Test that a batch run assigns every duty in every office, and answers a repeat run from the stored assignments
+    """
+    offices = seed_offices(3)
+    select_member = functools.partial(select_next_member, strategy=SelectionStrategy.STRIDE)
+
+    batch = database.assign_batch(
+        DUE_DUTIES, select_member, notification=lambda duty_type, member: {"text": duty_type}, test_mode=True
+    )
+    repeat = database.assign_batch(DUE_DUTIES, select_member, test_mode=True)
+
+    assert batch.success
+    assert sorted(batch.assignments) == offices
+    for office, results in batch.assignments.items():
+        assert all(result.success and result.member and result.member.office == office for result in results.values())
+        assert results[DutyType.COFFEE].member.coffee_drinker  # type: ignore[union-attr]
+        # The credit of the coffee turn counts for the fridge duty of the same run
+        assert results[DutyType.FRIDGE].member != results[DutyType.COFFEE].member
+        assert repeat.assignments[office][DutyType.FRIDGE].already_assigned
+        assert repeat.assignments[office][DutyType.FRIDGE].member.id == results[DutyType.FRIDGE].member.id  # type: ignore[union-attr]
+    assert len(database.get_assignment_history(test_mode=True)) == 6
+    assert len(database.get_assignment_history(DutyType.COFFEE, office="office_1", test_mode=True)) == 1
+    assert database.get_current_cycle_info(DutyType.FRIDGE, office="office_2", test_mode=True).assigned_member_ids
+    with database.get_db_session(test_mode=True) as session:
+        assert session.query(database.NotificationOutboxTable).count() == 6
+
+    # Every office has one coffee drinker, who starts a new cycle in the next period
+    next_period = database.assign_batch(
+        [DueDuty(DutyType.COFFEE, coffee_drinkers_only=True, period_key="2024-W03")], select_member, test_mode=True
+    )
+    assert [results[DutyType.COFFEE].cycle_id for results in next_period.assignments.values()] == [1, 1, 1]
+    assert database.get_current_cycle_info(DutyType.COFFEE, office="office_0", test_mode=True).cycle_id == 1
+
+
+@pytest.mark.unit
+@pytest.mark.parametrize("members", [[]], ids=["no members"])
+def test_batch_round_trips_do_not_grow_with_offices(statements: list[tuple[str, Any]]) -> None:
+    """
+    Test that a batch run for many offices executes as many statements as one for a few offices
+    """
+    few, many = seed_offices(2), seed_offices(20, members_per_office=3, start=2)
+    statements.clear()
+
+    database.assign_batch(DUE_DUTIES, select_next_member, lambda duty_type, member: {}, offices=few, test_mode=True)
+    few_statements = len(statements)
+    statements.clear()
+    batch = database.assign_batch(
+        DUE_DUTIES, select_next_member, lambda duty_type, member: {}, offices=many, test_mode=True
+    )
+
+    assert sum(len(results) for results in batch.assignments.values()) == 2 * len(many)
+    assert len(statements) <= few_statements
@@ -0,0 +1,121 @@
+import datetime
+import json
+from pathlib import Path
+from typing import Any
+
+import pytest
+from functions_framework import create_app
+from pytest_mock import MockerFixture
+
+import database
+from duties import DUTIES_CONFIG, DutyType, Eligibility, load_duty_registry
+from duty_calendar import DutyCalendar, get_duty_calendar
+from mattermost import build_mattermost_payload
+
+PLANTS = {
+    "duty_type": "plants",
+    "duty_name": "watering the plants",
+    "schedule": {"rule": "odd_iso_week", "weekday": "Monday"},
+    "message": "🪴 {greeting}\nIt's {mention}'s turn to water the plants!",
+    "greetings": ["Hi!"],
+    "channel": "plants",
+    "test_channel": "@plant_tester",
+    "office_channels": {"amsterdam": "plants-ams"},
+}
+
+
+def write_config(path: Path, *duties: dict[str, Any]) -> str:
+    path.write_text(json.dumps({"duties": list(duties)}))
+    return str(path)
+
+
+@pytest.fixture
+def registry_with_plants(tmp_path: Path, mocker: MockerFixture) -> None:
+    """
+    The default duties and a plant watering duty on Mondays of odd weeks.
+    """
+    default = json.loads(Path(DUTIES_CONFIG).read_text(encoding="utf-8"))["duties"]
+    mocker.patch("duties._registry", load_duty_registry(write_config(tmp_path / "duties.json", *default, PLANTS)))
+    mocker.patch.dict("duty_calendar._calendars", clear=True)
+
+
+@pytest.fixture
+def members() -> list[database.MemberTable]:
+    return [
+        database.MemberTable(id=1, username="lotte"),
+        database.MemberTable(id=2, username="abel", coffee_drinker=False),
+    ]
+
+
+@pytest.mark.unit
+def test_default_registry_defines_the_builtin_duties() -> None:
+    """
+    Test that the shipped config defines the duties that have their own functions
+    """
+    registry = load_duty_registry()
+
+    assert set(registry) == set(DutyType)
+    assert registry[DutyType.COFFEE].eligibility == Eligibility.COFFEE_DRINKERS
+    assert not registry[DutyType.FRIDGE].coffee_drinkers_only
+
+
+@pytest.mark.unit
+@pytest.mark.parametrize(
+    "change",
+    [{"schedule": {"rule": "every_day", "weekday": "monday"}}, {"eligibility": "tea_drinkers"}, {"channel": None}],
+)
+def test_invalid_definitions_are_rejected(tmp_path: Path, change: dict[str, Any]) -> None:
+    """
+    Test that unknown rules or filters and missing fields are reported when the registry is loaded
+    """
+    definition = {key: value for key, value in {**PLANTS, **change}.items() if value is not None}
+
+    with pytest.raises(ValueError):
+        load_duty_registry(write_config(tmp_path / "duties.json", definition))
+
+
+@pytest.mark.unit
+def test_new_duty_only_needs_a_definition(registry_with_plants: None) -> None:
+    """
+    Test that a duty added to the config gets its schedule and messages from its definition
+    """
+    test_payload = build_mattermost_payload("abel", "plants", test_mode=True)
+    payload = build_mattermost_payload("abel", "plants", test_mode=False)
+
+    assert test_payload["channel"] == "@plant_tester"
+    assert test_payload["text"] == "🪴 Hi!\nIt's abel's turn to water the plants!"
+    assert payload["channel"] == "plants"
+    assert build_mattermost_payload("abel", "plants", test_mode=False, office="amsterdam")["channel"] == "plants-ams"
+    assert "@abel" in payload["text"]
+    assert get_duty_calendar("plants").next_run_days(datetime.date(2025, 1, 1), 3) == [
+        datetime.date(2025, 1, 13),
+        datetime.date(2025, 1, 27),
+        datetime.date(2025, 2, 10),
+    ]
+
+
+@pytest.mark.unit
+def test_dispatcher_assigns_every_due_duty(registry_with_plants: None, seeded_db: None, mocker: MockerFixture) -> None:
+    """
+    Test that a single invocation assigns all duties due today and delivers their notifications together
+    """
+    mocker.patch.object(
+        DutyCalendar, "is_run_day", autospec=True, side_effect=lambda calendar, date: calendar.rule.weekday == 0
+    )
+    start_background_delivery = mocker.patch("outbox.start_background_delivery")
+    client = create_app(target="assign_due_duties", source=str(Path(__file__).parent.parent / "main.py")).test_client()
+
+    response = client.post("/", json={"test_mode": False})
+
+    assert response.status_code == 200
+    assert list(response.json["duties"]) == ["plants"]  # type: ignore[index]
+    start_background_delivery.assert_called_once_with(False)
+    with database.get_db_session(test_mode=False) as session:
+        assert session.query(database.DutyAssignmentTable.duty_type).all() == [("plants",)]
+        assert [row.payload["channel"] for row in session.query(database.NotificationOutboxTable)] == ["plants"]
+
+    not_due = client.post("/", json={"test_mode": False, "duties": ["coffee", "fridge"]})
+    unknown = client.post("/", json={"test_mode": False, "duties": ["coffee", "windows"]})
+
+    assert not_due.json == {"status": "success", "message": "No duties due today.", "duties": {}}
+    assert unknown.status_code == 400
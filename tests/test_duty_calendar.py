@@ -0,0 +1,175 @@
+import datetime
+from pathlib import Path
+
+import pytest
+from functions_framework import create_app
+from pytest_mock import MockerFixture
+
+from duty_calendar import (
+    SATURDAY,
+    THURSDAY,
+    TUESDAY,
+    WEDNESDAY,
+    DutyCalendar,
+    LastWeekdayOfMonthRule,
+    OddIsoWeekRule,
+    get_office_holidays,
+)
+from main import is_coffee_execution_week, is_fridge_execution_week
+
+
+@pytest.mark.unit
+def test_odd_iso_week_rule_matches_coffee_weeks() -> None:
+    """
+    Test that the coffee calendar runs on the Tuesday of every odd week
+    """
+    calendar = DutyCalendar(rule=OddIsoWeekRule(weekday=TUESDAY))
+    date = datetime.date(2024, 1, 1)
+
+    for _ in range(400):
+        expected = date.weekday() == TUESDAY and is_coffee_execution_week(date)
+        assert calendar.is_run_day(date) == expected
+        date += datetime.timedelta(days=1)
+
+
+@pytest.mark.unit
+def test_last_weekday_rule_matches_fridge_days() -> None:
+    """
+    Test that the fridge calendar runs on the last Wednesday of every month
+    """
+    calendar = DutyCalendar(rule=LastWeekdayOfMonthRule(weekday=WEDNESDAY))
+    date = datetime.date(2024, 1, 1)
+
+    for _ in range(400):
+        expected = date.weekday() == WEDNESDAY and is_fridge_execution_week(date)
+        assert calendar.is_run_day(date) == expected
+        date += datetime.timedelta(days=1)
+
+
+@pytest.mark.unit
+@pytest.mark.parametrize(
+    "shift,expected",
+    [
+        (True, [datetime.date(2024, 12, 26), datetime.date(2025, 1, 29)]),  # Christmas moves to the next day
+        (False, [datetime.date(2025, 1, 29), datetime.date(2025, 2, 26)]),  # Christmas is skipped
+    ],
+)
+def test_holidays_are_shifted_or_skipped(shift: bool, expected: list[datetime.date]) -> None:
+    calendar = DutyCalendar(
+        rule=LastWeekdayOfMonthRule(weekday=WEDNESDAY),
+        holidays=frozenset({datetime.date(2024, 12, 25)}),
+        shift_to_next_business_day=shift,
+    )
+
+    assert not calendar.is_run_day(datetime.date(2024, 12, 25))
+    assert calendar.next_run_days(datetime.date(2024, 12, 1), 2) == expected
+
+
+@pytest.mark.unit
+def test_shift_skips_weekends_and_consecutive_holidays() -> None:
+    """
+    Test that a run on a holiday before a long weekend moves to the next business day
+    """
+    holidays = frozenset({datetime.date(2025, 1, 30), datetime.date(2025, 1, 31), datetime.date(2025, 2, 3)})
+    calendar = DutyCalendar(rule=OddIsoWeekRule(weekday=THURSDAY), holidays=holidays)
+
+    assert calendar.next_run_days(datetime.date(2025, 1, 27), 1) == [datetime.date(2025, 2, 4)]
+
+
+@pytest.mark.unit
+def test_shifted_runs_keep_their_period_key() -> None:
+    """
+    Test that a run shifted into the next week or month keeps the period key of its scheduled date
+    """
+    holidays = frozenset({datetime.date(2025, 1, 29), datetime.date(2025, 1, 30), datetime.date(2025, 1, 31)})
+    coffee = DutyCalendar(rule=OddIsoWeekRule(weekday=THURSDAY), holidays=holidays)
+    fridge = DutyCalendar(rule=LastWeekdayOfMonthRule(weekday=WEDNESDAY), holidays=holidays)
+
+    assert coffee.is_run_day(datetime.date(2025, 2, 3))
+    assert coffee.period_key(datetime.date(2025, 2, 3)) == "2025-W05"
+    assert coffee.period_key(datetime.date(2025, 2, 13)) == "2025-W07"
+    assert fridge.is_run_day(datetime.date(2025, 2, 3))
+    assert fridge.period_key(datetime.date(2025, 2, 3)) == "2025-01"
+    assert fridge.period_key(datetime.date(2025, 2, 26)) == "2025-02"
+
+
+@pytest.mark.unit
+def test_next_run_days_beyond_horizon() -> None:
+    """
+    Test that asking for more dates than the precomputed window holds extends the window
+    """
+    calendar = DutyCalendar(rule=LastWeekdayOfMonthRule(weekday=WEDNESDAY), horizon_days=40)
+
+    run_days = calendar.next_run_days(datetime.date(2024, 1, 1), 6)
+
+    assert [day.month for day in run_days] == [1, 2, 3, 4, 5, 6]
+
+
+@pytest.mark.unit
+def test_next_run_days_over_several_years() -> None:
+    """
+    Test that the search only gives up after a year without a run date, not after a year in total
+    """
+    calendar = DutyCalendar(rule=LastWeekdayOfMonthRule(weekday=WEDNESDAY), horizon_days=40)
+
+    run_days = calendar.next_run_days(datetime.date(2024, 1, 1), 52)
+
+    assert (run_days[0], run_days[-1]) == (datetime.date(2024, 1, 31), datetime.date(2028, 4, 26))
+
+
+@pytest.mark.unit
+@pytest.mark.parametrize("horizon_days", [40, 366])
+def test_next_run_days_without_run_dates(horizon_days: int) -> None:
+    """
+    Test that the search stops with an error when the duty never runs, instead of looking ahead forever
+    """
+    # Weekend dates are skipped when they can't be shifted to a business day
+    calendar = DutyCalendar(
+        rule=OddIsoWeekRule(weekday=SATURDAY), shift_to_next_business_day=False, horizon_days=horizon_days
+    )
+
+    with pytest.raises(ValueError, match="No run date within 366 days after 2023-12-31"):
+        calendar.next_run_days(datetime.date(2024, 1, 1), 1)
+
+
+@pytest.mark.unit
+def test_office_holidays_from_environment(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setenv("OFFICE_HOLIDAYS", "2024-12-25, 2025-01-01")
+
+    assert get_office_holidays() == frozenset({datetime.date(2024, 12, 25), datetime.date(2025, 1, 1)})
+
+
+@pytest.mark.unit
+def test_duty_schedule_endpoint() -> None:
+    """
+    Test that the schedule endpoint lists the requested number of upcoming dates
+    """
+    client = create_app(target="duty_schedule", source=str(Path(__file__).parent.parent / "main.py")).test_client()
+
+    response = client.get("/?duty=fridge&count=3")
+
+    assert response.status_code == 200
+    assert response.headers["Access-Control-Allow-Origin"] == "https://clean-office-command-center.vercel.app"
+    assert list(response.json) == ["fridge"]  # type: ignore[arg-type]
+    dates = [datetime.date.fromisoformat(date) for date in response.json["fridge"]]  # type: ignore[index]
+    assert len(dates) == 3
+    assert all(date.weekday() == WEDNESDAY for date in dates)
+
+    assert client.get("/?duty=windows").status_code == 400
+    assert client.get("/?count=0").status_code == 400
+    assert client.post("/").status_code == 405
+
+
+@pytest.mark.unit
+def test_duty_schedule_endpoint_without_run_dates(mocker: MockerFixture) -> None:
+    """
+    Test that the schedule endpoint reports an error for a duty that never runs
+    """
+    never = DutyCalendar(rule=OddIsoWeekRule(weekday=SATURDAY), shift_to_next_business_day=False)
+    mocker.patch.dict("duty_calendar._calendars", {"fridge": never})
+    client = create_app(target="duty_schedule", source=str(Path(__file__).parent.parent / "main.py")).test_client()
+
+    response = client.get("/?duty=fridge")
+
+    assert response.status_code == 500
+    assert response.json["message"].startswith("No run date within 366 days")  # type: ignore[index]
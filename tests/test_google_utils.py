@@ -0,0 +1,65 @@
+from collections.abc import Generator
+
+import pytest
+from pytest_mock import MockerFixture
+
+import google_utils
+from tests.stubs import FakeSecretManagerClient
+
+
+@pytest.fixture
+def fake_client(mocker: MockerFixture) -> Generator[FakeSecretManagerClient, None, None]:
+    client = FakeSecretManagerClient(secrets={"db": "postgresql://old", "webhook": "https://hook"})
+    mocker.patch("google_utils._client", client)
+    google_utils.invalidate_secret()
+    yield client
+    google_utils.invalidate_secret()
+
+
+@pytest.mark.unit
+def test_secret_is_cached(fake_client: FakeSecretManagerClient) -> None:
+    """
+    Test that repeated reads of a secret only hit Secret Manager once
+    """
+    for _ in range(5):
+        assert google_utils.get_secret("db") == "postgresql://old"
+
+    assert google_utils.get_secret("webhook") == "https://hook"
+    assert fake_client.calls == [
+        "projects/java-janitor/secrets/db/versions/latest",
+        "projects/java-janitor/secrets/webhook/versions/latest",
+    ]
+
+
+@pytest.mark.unit
+def test_secret_expires_after_ttl(fake_client: FakeSecretManagerClient, mocker: MockerFixture) -> None:
+    """
+    Test that a secret is fetched again once its TTL has passed
+    """
+    monotonic = mocker.patch("google_utils.time.monotonic", return_value=1000.0)
+    google_utils.get_secret("db")
+
+    monotonic.return_value = 1000.0 + google_utils.SECRET_CACHE_TTL_SECONDS - 1
+    google_utils.get_secret("db")
+    assert len(fake_client.calls) == 1
+
+    monotonic.return_value = 1000.0 + google_utils.SECRET_CACHE_TTL_SECONDS + 1
+    google_utils.get_secret("db")
+    assert len(fake_client.calls) == 2
+
+
+@pytest.mark.unit
+def test_forced_refresh_picks_up_rotated_secret(fake_client: FakeSecretManagerClient) -> None:
+    """
+    Test that a forced refresh and an invalidation both bypass the cache
+    """
+    assert google_utils.get_secret("db") == "postgresql://old"
+
+    fake_client.secrets["db"] = "postgresql://new"
+    assert google_utils.get_secret("db") == "postgresql://old"
+    assert google_utils.get_secret("db", force_refresh=True) == "postgresql://new"
+
+    fake_client.secrets["db"] = "postgresql://newer"
+    google_utils.invalidate_secret("db")
+    assert google_utils.get_secret("db") == "postgresql://newer"
+    assert len(fake_client.calls) == 3
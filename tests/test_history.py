@@ -0,0 +1,209 @@
+import datetime
+from pathlib import Path
+from typing import Any
+
+import pytest
+from flask.testing import FlaskClient
+from functions_framework import create_app
+from pytest_mock import MockerFixture
+from sqlalchemy import update
+from werkzeug.test import TestResponse
+
+import analytics
+import database
+import history
+
+SOURCE = str(Path(__file__).parent.parent / "main.py")
+START = datetime.datetime(2025, 1, 6, 9, 0)
+
+
+@pytest.fixture
+def assignments() -> list[database.DutyAssignmentTable]:
+    """
+    Seven assignments of lotte and abel, alternating coffee and fridge duty, one per day and the last two at the
+    same time.
+    """
+    return [
+        database.DutyAssignmentTable(
+            id=i + 1,
+            member_id=i % 2 + 1,
+            duty_type="coffee" if i % 2 == 0 else "fridge",
+            assigned_at=START + datetime.timedelta(days=min(i, 5)),
+            cycle_id=1,
+            period_key=f"period-{i}",
+        )
+        for i in range(7)
+    ]
+
+
+@pytest.fixture
+def seeded_db(seeded_db: None, mocker: MockerFixture) -> None:
+    mocker.patch.dict(history._caches, clear=True)
+
+
+@pytest.fixture
+def history_client() -> FlaskClient:
+    client: FlaskClient = create_app(target="assignment_history", source=SOURCE).test_client()
+    return client
+
+
+@pytest.fixture
+def completion_client() -> FlaskClient:
+    client: FlaskClient = create_app(target="complete_assignment", source=SOURCE).test_client()
+    return client
+
+
+def body(response: TestResponse) -> dict[str, Any]:
+    assert isinstance(response.json, dict)
+    return response.json
+
+
+def read_all(client: FlaskClient, query: str) -> list[list[int]]:
+    pages = []
+    cursor = None
+    while True:
+        response = client.get(f"/?test_mode=true&{query}" + (f"&cursor={cursor}" if cursor else ""))
+        assert response.status_code == 200
+        pages.append([assignment["id"] for assignment in body(response)["assignments"]])
+        cursor = body(response)["next_cursor"]
+        if cursor is None:
+            return pages
+
+
+@pytest.mark.unit
+def test_history_is_paginated_newest_first(seeded_db: None, history_client: FlaskClient) -> None:
+    """
+    Test that the history is listed newest first in pages, also among assignments made at the same time
+    """
+    assert read_all(history_client, "limit=3") == [[7, 6, 5], [4, 3, 2], [1]]
+    assert read_all(history_client, "limit=7") == [[7, 6, 5, 4, 3, 2, 1]]
+
+
+@pytest.mark.unit
+def test_history_filters(seeded_db: None, history_client: FlaskClient) -> None:
+    """
+    Test that the history can be filtered by duty type and member
+    """
+    assert read_all(history_client, "duty=fridge&limit=2") == [[6, 4], [2]]
+    assert read_all(history_client, "member_id=1&duty=coffee&limit=2") == [[7, 5], [3, 1]]
+    assert read_all(history_client, "member_id=3") == [[]]
+
+
+@pytest.mark.unit
+@pytest.mark.parametrize("query", ["duty=dishes", "member_id=abc", "limit=0", "limit=201", "cursor=nonsense"])
+def test_history_rejects_invalid_queries(seeded_db: None, history_client: FlaskClient, query: str) -> None:
+    """
+    Test that unknown duties, invalid numbers and cursors are rejected
+    """
+    response = history_client.get(f"/?test_mode=true&{query}")
+
+    assert response.status_code == 400
+    assert body(response)["status"] == "error"
+
+
+@pytest.mark.unit
+def test_unchanged_history_is_not_modified(
+    seeded_db: None, history_client: FlaskClient, completion_client: FlaskClient, mocker: MockerFixture
+) -> None:
+    """
+    Test that a cached response is revalidated by its ETag, and that completing an assignment changes it
+    """
+    get_history_page = mocker.spy(database, "get_history_page")
+    first = history_client.get("/?test_mode=true&limit=2")
+    etag = first.headers["ETag"]
+
+    again = history_client.get("/?test_mode=true&limit=2")
+    not_modified = history_client.get("/?test_mode=true&limit=2", headers={"If-None-Match": etag})
+
+    assert body(again) == body(first) and again.headers["ETag"] == etag
+    assert not_modified.status_code == 304
+    assert get_history_page.call_count == 1
+
+    completion_client.post("/", json={"assignment_id": 7})
+    changed = history_client.get("/?test_mode=true&limit=2", headers={"If-None-Match": etag})
+
+    assert changed.status_code == 200
+    assert changed.headers["ETag"] != etag
+    assert body(changed)["assignments"][0]["completed"] is True
+    assert get_history_page.call_count == 2
+
+
+@pytest.mark.unit
+def test_new_assignments_change_the_version(seeded_db: None) -> None:
+    """
+    Test that assignments written by another instance result in a new history version
+    """
+    version = database.get_history_version(test_mode=True)
+    with database.get_db_session(test_mode=True) as session:
+        session.add(database.DutyAssignmentTable(member_id=1, duty_type="coffee", assigned_at=START, cycle_id=2))
+
+    assert version == history.HistoryVersion(7, None, 0, 0)
+    assert database.get_history_version(test_mode=True).max_assignment_id == 8
+
+
+@pytest.mark.unit
+def test_renames_and_cycle_backfills_change_the_version(seeded_db: None, history_client: FlaskClient) -> None:
+    """
+    Test that a member renamed by another instance, and a backfill of the cycles, result in a new history version
+    """
+    etag = history_client.get("/?test_mode=true&limit=1").headers["ETag"]
+    # Like the roster sync, or an update by hand with the trigger of the migration
+    with database.get_db_session(test_mode=True) as session:
+        session.execute(
+            update(database.MemberTable)
+            .where(database.MemberTable.id == 1)
+            .values(username="lotte_l", row_version=database.MemberTable.row_version + 1)
+        )
+
+    renamed = history_client.get("/?test_mode=true&limit=1", headers={"If-None-Match": etag})
+
+    assert renamed.status_code == 200
+    assert body(renamed)["assignments"][0]["username"] == "lotte_l"
+
+    analytics.backfill_cycles(test_mode=True)
+    backfilled = history_client.get("/?test_mode=true&limit=1", headers={"If-None-Match": renamed.headers["ETag"]})
+
+    assert backfilled.status_code == 200
+    # Lotte has every coffee turn, so each one is a cycle of its own
+    assert body(backfilled)["assignments"][0]["cycle_id"] == 3
+    assert database.get_history_version(test_mode=True) == history.HistoryVersion(7, None, 1, 2)
+
+
+@pytest.mark.unit
+def test_complete_assignment(seeded_db: None, completion_client: FlaskClient) -> None:
+    """
+    Test that an assignment is marked as completed once, keeping its first completion time
+    """
+    first = completion_client.post("/", json={"assignment_id": 3})
+    second = completion_client.post("/", json={"assignment_id": 3})
+
+    assert first.status_code == 200
+    assignment = body(first)["assignment"]
+    assert assignment["id"] == 3 and assignment["username"] == "lotte" and assignment["completed"] is True
+    assert body(second)["assignment"]["completed_at"] == assignment["completed_at"]
+
+
+@pytest.mark.unit
+@pytest.mark.parametrize(("assignment_id", "status"), [(99, 404), ("3", 400), (None, 400), (True, 400)])
+def test_complete_assignment_errors(
+    seeded_db: None, completion_client: FlaskClient, assignment_id: object, status: int
+) -> None:
+    """
+    Test that unknown assignments and invalid ids are rejected
+    """
+    response = completion_client.post("/", json={"assignment_id": assignment_id})
+
+    assert response.status_code == status
+    assert body(response)["status"] == "error"
+
+
+@pytest.mark.unit
+def test_cursor_round_trip() -> None:
+    """
+    Test that a cursor decodes to the position it was made from
+    """
+    position = (START, 42)
+
+    assert history.decode_cursor(history.encode_cursor(position)) == position
+    with pytest.raises(ValueError):
+        history.decode_cursor("bm90IGEgY3Vyc29y")
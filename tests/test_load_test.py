@@ -0,0 +1,28 @@
+import sys
+from pathlib import Path
+
+import pytest
+from pytest_mock import MockerFixture
+
+from benchmarks import load_test
+
+
+@pytest.mark.unit
+def test_overlapping_triggers_assign_once_per_period(tmp_path: Path, mocker: MockerFixture) -> None:
+    """
+    Test that the load test fires every request, and that overlapping triggers of a period assign the duty once
+    """
+    # The harness wires the Secret Manager and Mattermost clients and loads main.py as a new main module
+    mocker.patch("google_utils._client")
+    mocker.patch("mattermost._client")
+    mocker.patch.dict(sys.modules)
+
+    report = load_test.run(
+        f"sqlite:///{tmp_path / 'load_test.db'}", load_test.HANDLERS, 12, concurrency=4, retries=3, history=10
+    )
+
+    assert [outcome.handler for outcome in report.outcomes] == load_test.HANDLERS * 6
+    assert all(outcome.status == 200 for outcome in report.outcomes)
+    assert sum(outcome.already_assigned for outcome in report.outcomes) == 8
+    assert (report.periods, report.assignments, report.duplicate_assignments) == (4, 4, 0)
+    assert report.notifications >= 4
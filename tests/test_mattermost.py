@@ -0,0 +1,107 @@
+import time
+from collections.abc import Generator
+
+import pytest
+
+from mattermost import MattermostClient, build_mattermost_payload
+from models import DutyType
+from tests.stubs import StubMattermostServer
+
+
+@pytest.fixture
+def stub() -> Generator[StubMattermostServer, None, None]:
+    with StubMattermostServer() as server:
+        yield server
+
+
+@pytest.mark.unit
+@pytest.mark.parametrize("duty_type", DutyType)
+def test_build_mattermost_payload(duty_type: DutyType) -> None:
+    """
+    Test that test mode messages go to a DM without mentioning the assignee
+    """
+    test_payload = build_mattermost_payload("abel", duty_type, test_mode=True)
+    payload = build_mattermost_payload("abel", duty_type, test_mode=False)
+
+    assert test_payload["channel"] == "@lotte_lutkenhaus"
+    assert "@abel" not in test_payload["text"]
+    assert payload["channel"] == "nycoffice"
+    assert "@abel" in payload["text"]
+
+
+@pytest.mark.unit
+def test_client_reuses_connection(stub: StubMattermostServer) -> None:
+    """
+    Test that consecutive messages are sent over a single kept-alive connection
+    """
+    client = MattermostClient(webhook_url=stub.url, rate_per_destination=0)
+
+    for i in range(10):
+        assert client.post({"text": f"message {i}", "channel": "nycoffice"}).success
+
+    assert len(stub.received) == 10
+    assert len(stub.connections) == 1
+
+
+@pytest.mark.unit
+def test_send_batch_aggregates_results(stub: StubMattermostServer) -> None:
+    """
+    Test that a batch reports every delivery in order, including failures
+    """
+    client = MattermostClient(webhook_url=stub.url, max_workers=4, rate_per_destination=0)
+    stub.fail_next(500)
+    payloads = [{"text": f"message {i}", "channel": f"@member_{i}"} for i in range(20)]
+
+    result = client.send_batch(payloads)
+
+    assert (result.sent, result.failed) == (19, 1)
+    assert [delivery.destination for delivery in result.deliveries] == [payload["channel"] for payload in payloads]
+    assert len(stub.received) == 19
+    assert len(stub.connections) <= 4
+
+
+@pytest.mark.unit
+def test_send_batch_rate_limits_per_destination(stub: StubMattermostServer) -> None:
+    """
+    Test that messages to the same destination are spread out, while other destinations are not held up
+    """
+    client = MattermostClient(webhook_url=stub.url, max_workers=8, rate_per_destination=10, burst_per_destination=1)
+    payloads = [{"text": "hi", "channel": "nycoffice"} for _ in range(4)]
+    payloads += [{"text": "hi", "channel": f"@member_{i}"} for i in range(4)]
+
+    start = time.monotonic()
+    result = client.send_batch(payloads)
+
+    assert result.sent == 8
+    assert time.monotonic() - start >= 0.3
+
+
+@pytest.mark.unit
+def test_rate_limit_delay_of_the_busiest_destination(stub: StubMattermostServer) -> None:
+    """
+    Test that the rate limit delay of a batch is that of its busiest destination, after its burst and what was sent
+    to it before
+    """
+    client = MattermostClient(webhook_url=stub.url, rate_per_destination=1, burst_per_destination=5)
+    client.send_batch([{"text": "hi", "channel": "@lotte"} for _ in range(5)])
+
+    assert client.get_rate_limit_delay([{"text": "hi", "channel": "town-square"} for _ in range(5)]) == 0
+    assert client.get_rate_limit_delay(
+        [{"text": "hi", "channel": "town-square"} for _ in range(130)] + [{"text": "hi", "channel": "@lotte"}]
+    ) == pytest.approx(125, abs=0.1)
+    assert client.get_rate_limit_delay([{"text": "hi", "channel": "@lotte"} for _ in range(3)]) == pytest.approx(
+        3, abs=0.1
+    )
+
+
+@pytest.mark.unit
+def test_missing_webhook_url_fails_without_request(stub: StubMattermostServer, monkeypatch: pytest.MonkeyPatch) -> None:
+    """
+    Test that nothing is sent when no webhook URL is configured
+    """
+    monkeypatch.setattr("mattermost.MATTERMOST_WEBHOOK_URL", None)
+
+    delivery = MattermostClient().post({"text": "hi", "channel": "nycoffice"})
+
+    assert not delivery.success
+    assert stub.received == []
@@ -0,0 +1,173 @@
+import datetime
+import time
+from collections.abc import Generator
+
+import pytest
+from pytest_mock import MockerFixture
+
+import database
+import main
+import mattermost
+import outbox
+from models import BatchDelivery, DutyType, WebhookDelivery
+from tests.stubs import StubMattermostServer
+
+
+@pytest.fixture
+def stub(mocker: MockerFixture) -> Generator[StubMattermostServer, None, None]:
+    with StubMattermostServer() as server:
+        mocker.patch("mattermost._client", mattermost.MattermostClient(webhook_url=server.url))
+        mocker.patch("outbox.OUTBOX_BACKOFF_BASE_SECONDS", 0.01)
+        yield server
+
+
+def enqueue_assignment() -> None:
+    result = database.assign_next_member(
+        DutyType.COFFEE,
+        lambda members, assigned: members[0],
+        notification=lambda member: {"text": f"Hi {member.username}", "channel": "@lotte_lutkenhaus"},
+        test_mode=True,
+    )
+    assert result.success
+
+
+@pytest.mark.unit
+def test_pending_notification_is_delivered_once(seeded_db: None, stub: StubMattermostServer) -> None:
+    """
+    Test that a notification is sent once, even if the outbox is drained again
+    """
+    enqueue_assignment()
+
+    first = outbox.drain_outbox(test_mode=True, time_budget=1)
+    second = outbox.drain_outbox(test_mode=True, time_budget=1)
+
+    assert (first.sent, first.pending) == (1, 0)
+    assert second.sent == 0
+    assert stub.received == [{"text": "Hi lotte", "channel": "@lotte_lutkenhaus"}]
+
+
+@pytest.mark.unit
+def test_notifications_are_delivered_outside_of_the_claim(
+    seeded_db: None, stub: StubMattermostServer, mocker: MockerFixture
+) -> None:
+    """
+    Test that no connection is held while the notifications are delivered, and a concurrent drain skips them
+    """
+    client = mattermost.get_mattermost_client()
+    send_batch = client.send_batch
+    during_delivery: list[tuple[int | str, int]] = []
+
+    def send_and_drain_again(payloads: list[dict[str, str]]) -> BatchDelivery:
+        during_delivery.append(
+            (database.get_pool_stats()["dev"]["checked_out"], outbox.drain_outbox(True, time_budget=0).sent)
+        )
+        return send_batch(payloads)
+
+    mocker.patch.object(client, "send_batch", side_effect=send_and_drain_again)
+    enqueue_assignment()
+
+    result = outbox.drain_outbox(test_mode=True, time_budget=0)
+
+    assert (result.sent, result.pending) == (1, 0)
+    assert during_delivery == [(0, 0)]
+    assert len(stub.received) == 1
+
+
+@pytest.mark.unit
+def test_rate_limited_batch_stays_claimed_while_it_is_sent(
+    seeded_db: None, stub: StubMattermostServer, mocker: MockerFixture
+) -> None:
+    """
+    Test that the claim of a batch to one channel lasts until the rate limit lets all of it through, so a drain
+    after the usual claim period doesn't send it again
+    """
+    client = mattermost.MattermostClient(webhook_url=stub.url, rate_per_destination=1, burst_per_destination=5)
+    mocker.patch("mattermost._client", client)
+    payload = {"text": "Hi lotte", "channel": "town-square"}
+    with database.get_db_session(test_mode=True) as session:
+        session.add_all(
+            database.NotificationOutboxTable(dedupe_key=f"announcement-{i}", payload=payload) for i in range(20)
+        )
+    during_delivery = []
+
+    def drain_after_the_claim_period(payloads: list[dict[str, str]]) -> BatchDelivery:
+        later = database.utcnow() + datetime.timedelta(seconds=outbox.OUTBOX_CLAIM_SECONDS + 1)
+        mocker.patch("outbox.utcnow", return_value=later)
+        during_delivery.append(outbox.drain_outbox(True, time_budget=0).sent)
+        deliveries = [WebhookDelivery(success=True, destination=payload["channel"]) for payload in payloads]
+        return BatchDelivery(sent=len(deliveries), failed=0, deliveries=deliveries, duration=15)
+
+    mocker.patch.object(client, "send_batch", side_effect=drain_after_the_claim_period)
+
+    result = outbox.drain_outbox(test_mode=True, time_budget=0)
+
+    assert (result.sent, result.pending) == (20, 0)
+    assert during_delivery == [0]
+
+
+@pytest.mark.unit
+def test_failed_delivery_is_retried_with_backoff(seeded_db: None, stub: StubMattermostServer) -> None:
+    """
+    Test that server errors and rate limits are retried within the drain budget
+    """
+    stub.fail_next(500, times=2)
+    stub.fail_next(429, headers={"Retry-After": "0.2"})
+    enqueue_assignment()
+
+    start = time.monotonic()
+    result = outbox.drain_outbox(test_mode=True, time_budget=5)
+
+    assert time.monotonic() - start >= 0.2
+    assert (result.sent, result.retried, result.failed, result.pending) == (1, 3, 0, 0)
+    assert len(stub.received) == 1
+
+
+@pytest.mark.unit
+def test_delivery_gives_up_after_max_attempts(
+    seeded_db: None, stub: StubMattermostServer, mocker: MockerFixture
+) -> None:
+    """
+    Test that a message that keeps failing is marked as failed
+    """
+    mocker.patch("outbox.OUTBOX_MAX_ATTEMPTS", 3)
+    stub.fail_next(503, times=3)
+    enqueue_assignment()
+
+    result = outbox.drain_outbox(test_mode=True, time_budget=5)
+
+    assert (result.sent, result.failed, result.pending) == (0, 1, 0)
+    assert stub.received == []
+
+
+@pytest.mark.unit
+def test_retries_beyond_budget_are_left_pending(seeded_db: None, stub: StubMattermostServer) -> None:
+    """
+    Test that a long rate limit leaves the message for the next drain
+    """
+    stub.fail_next(429, headers={"Retry-After": "60"})
+    enqueue_assignment()
+
+    result = outbox.drain_outbox(test_mode=True, time_budget=1)
+
+    assert (result.sent, result.retried, result.pending) == (0, 1, 1)
+
+
+@pytest.mark.unit
+def test_assignment_responds_without_waiting_for_mattermost(
+    seeded_db: None, stub: StubMattermostServer, mocker: MockerFixture
+) -> None:
+    """
+    Test that a slow webhook doesn't delay the response of the assignment
+    """
+    stub.latency = 1.0
+    delivery = mocker.spy(outbox, "start_background_delivery")
+
+    start = time.monotonic()
+    response, status = main._assign_duty(DutyType.COFFEE, test_mode=True)
+
+    assert status == 200
+    assert time.monotonic() - start < stub.latency
+    assert stub.received == []
+
+    delivery.spy_return.join(timeout=5)
+    assert len(stub.received) == 1
@@ -0,0 +1,198 @@
+import datetime
+from collections.abc import Generator
+from pathlib import Path
+from typing import Any
+
+import pytest
+from functions_framework import create_app
+from pytest_mock import MockerFixture
+from sqlalchemy import select
+
+import database
+import mattermost
+import reminders
+from models import BatchDelivery
+from tests.stubs import StubMattermostServer
+
+NOW = database.utcnow()
+
+
+@pytest.fixture
+def assignments() -> list[database.DutyAssignmentTable]:
+    """
+    Assignments of lotte: open for three days, completed, open for an hour and open for a month. And one of abel,
+    open for four days.
+    """
+    return [
+        database.DutyAssignmentTable(
+            id=1, member_id=1, duty_type="coffee", cycle_id=1, assigned_at=NOW - datetime.timedelta(days=3)
+        ),
+        database.DutyAssignmentTable(
+            id=2,
+            member_id=1,
+            duty_type="fridge",
+            cycle_id=1,
+            assigned_at=NOW - datetime.timedelta(days=3),
+            completed=True,
+            completed_at=NOW,
+        ),
+        database.DutyAssignmentTable(
+            id=3, member_id=1, duty_type="coffee", cycle_id=2, assigned_at=NOW - datetime.timedelta(hours=1)
+        ),
+        database.DutyAssignmentTable(
+            id=4, member_id=1, duty_type="coffee", cycle_id=0, assigned_at=NOW - datetime.timedelta(days=30)
+        ),
+        database.DutyAssignmentTable(
+            id=5, member_id=2, duty_type="fridge", cycle_id=1, assigned_at=NOW - datetime.timedelta(days=4)
+        ),
+    ]
+
+
+@pytest.fixture
+def stub(mocker: MockerFixture) -> Generator[StubMattermostServer, None, None]:
+    with StubMattermostServer() as server:
+        # Test mode sends every reminder to the same DM
+        mocker.patch("mattermost._client", mattermost.MattermostClient(webhook_url=server.url, rate_per_destination=0))
+        yield server
+
+
+def reminded() -> list[int]:
+    with database.get_db_session(test_mode=True) as session:
+        return list(
+            session.scalars(
+                select(database.DutyAssignmentTable.id)
+                .where(database.DutyAssignmentTable.reminder_sent_at.is_not(None))
+                .order_by(database.DutyAssignmentTable.id)
+            )
+        )
+
+
+@pytest.mark.unit
+def test_overdue_assignments_are_reminded_once(seeded_db: None, stub: StubMattermostServer) -> None:
+    """
+    Test that the assignees of open assignments past the threshold are reminded, and not reminded again
+    """
+    first = reminders.send_reminders(test_mode=True, after_hours=48)
+    second = reminders.send_reminders(test_mode=True, after_hours=48)
+
+    assert (first.sent, first.failed) == (2, 0)
+    assert (second.sent, second.failed) == (0, 0)
+    assert reminded() == [1, 5]
+    assert sorted(message["text"].split(",")[0] for message in stub.received) == ["👋 Hi abel", "👋 Hi lotte"]
+    assert all(message["channel"] == "@lotte_lutkenhaus" for message in stub.received)
+
+
+@pytest.mark.unit
+def test_reminders_are_sent_outside_of_the_claim(
+    seeded_db: None, stub: StubMattermostServer, mocker: MockerFixture
+) -> None:
+    """
+    Test that no connection is held while the reminders are sent, and a concurrent sweep skips the claimed ones
+    """
+    client = mattermost.get_mattermost_client()
+    send_batch = client.send_batch
+    during_delivery: list[tuple[int | str, int]] = []
+
+    def send_and_sweep_again(payloads: list[dict[str, str]]) -> BatchDelivery:
+        during_delivery.append(
+            (database.get_pool_stats()["dev"]["checked_out"], reminders.send_reminders(True, after_hours=48).sent)
+        )
+        return send_batch(payloads)
+
+    mocker.patch.object(client, "send_batch", side_effect=send_and_sweep_again)
+
+    result = reminders.send_reminders(test_mode=True, after_hours=48)
+
+    assert result.sent == 2
+    assert during_delivery == [(0, 0)]
+    assert reminded() == [1, 5]
+
+
+@pytest.mark.unit
+def test_sweep_pages_through_batches(seeded_db: None, stub: StubMattermostServer, mocker: MockerFixture) -> None:
+    """
+    Test that a sweep continues with the next batch until all overdue assignments are reminded
+    """
+    mocker.patch("reminders.REMINDER_BATCH_SIZE", 1)
+
+    result = reminders.send_reminders(test_mode=True, after_hours=0)
+
+    assert result.sent == 3
+    assert reminded() == [1, 3, 5]
+
+
+@pytest.mark.unit
+def test_failed_reminder_is_sent_by_the_next_sweep(seeded_db: None, stub: StubMattermostServer) -> None:
+    """
+    Test that a reminder that couldn't be delivered isn't recorded, and is sent by the next sweep
+    """
+    stub.fail_next(500)
+
+    first = reminders.send_reminders(test_mode=True, after_hours=48)
+    assert (first.sent, first.failed) == (1, 1)
+    # The reminders are sent concurrently, so either of them may have failed
+    assert len(reminded()) == 1
+
+    second = reminders.send_reminders(test_mode=True, after_hours=48)
+    assert (second.sent, second.failed) == (1, 0)
+    assert reminded() == [1, 5]
+
+
+@pytest.mark.unit
+def test_reminders_of_a_sweep_that_died_are_sent_after_the_claim(
+    seeded_db: None, stub: StubMattermostServer, mocker: MockerFixture
+) -> None:
+    """
+    Test that reminders aren't recorded before they are delivered, so when a sweep dies while sending them they are
+    left alone while claimed, and sent by the first sweep after the claim expired
+    """
+    client = mattermost.get_mattermost_client()
+    send_batch = mocker.patch.object(
+        client, "send_batch", side_effect=RuntimeError("instance shut down"), wraps=client.send_batch
+    )
+    with pytest.raises(RuntimeError):
+        reminders.send_reminders(test_mode=True, after_hours=48)
+    assert reminded() == []
+    send_batch.side_effect = None
+
+    assert reminders.send_reminders(test_mode=True, after_hours=48).sent == 0
+
+    later = database.utcnow() + datetime.timedelta(seconds=reminders.REMINDER_CLAIM_SECONDS + 1)
+    mocker.patch("reminders.utcnow", return_value=later)
+    result = reminders.send_reminders(test_mode=True, after_hours=48)
+
+    assert (result.sent, result.failed) == (2, 0)
+    assert reminded() == [1, 5]
+    with database.get_db_session(test_mode=True) as session:
+        assert session.scalars(select(database.DutyAssignmentTable.reminder_claimed_until)).all() == [None] * 5
+
+
+@pytest.mark.unit
+def test_sweep_reads_the_partial_index(statements: list[tuple[str, Any]], stub: StubMattermostServer) -> None:
+    """
+    Test that the query of the sweep is answered from the partial index of open, unreminded assignments
+    """
+    reminders.send_reminders(test_mode=True)
+
+    statement, parameters = next(
+        (statement, parameters)
+        for statement, parameters in statements
+        if statement.startswith("SELECT") and "reminder_sent_at IS NULL" in statement
+    )
+    with database.get_engine(test_mode=True).connect() as connection:
+        plan = connection.exec_driver_sql(f"EXPLAIN QUERY PLAN {statement}", parameters).all()
+    assert any("ix_duty_assignments_unreminded" in str(row) for row in plan)
+
+
+@pytest.mark.unit
+@pytest.mark.parametrize("after_hours", [-1, "48", True, float("nan"), float("inf"), 1e300, 8761])
+def test_handler_rejects_invalid_thresholds(after_hours: object) -> None:
+    """
+    Test that the sweeper rejects thresholds that aren't a number between 0 and a year in hours
+    """
+    client = create_app(target="send_reminders", source=str(Path(__file__).parent.parent / "main.py")).test_client()
+
+    response = client.post("/", json={"test_mode": True, "after_hours": after_hours})
+
+    assert response.status_code == 400
+    assert response.json == {"status": "error", "message": "after_hours must be between 0 and 8760"}
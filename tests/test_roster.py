@@ -0,0 +1,38 @@
+import pytest
+
+from models import OfficeMember
+from roster import RosterCache, RosterVersion
+
+
+@pytest.mark.unit
+def test_cache_serves_views_of_stored_version() -> None:
+    """
+    Test that both views are served for the stored version only
+    """
+    cache = RosterCache(enabled=True)
+    version = RosterVersion(member_count=2, max_member_id=2, row_version_sum=5)
+    cache.store(
+        version, [OfficeMember(id=1, username="lotte"), OfficeMember(id=2, username="ellie", coffee_drinker=False)]
+    )
+
+    assert [member.id for member in cache.get(version) or []] == [1, 2]
+    assert [member.id for member in cache.get(version, coffee_drinkers_only=True) or []] == [1]
+    assert cache.get(version.bumped()) is None
+    assert RosterCache(enabled=False).get(version) is None
+
+
+@pytest.mark.unit
+def test_update_member_only_applies_to_current_version() -> None:
+    """
+    Test that an own update moves the cache to the next version, but is ignored if the cache is outdated
+    """
+    cache = RosterCache(enabled=True)
+    version = RosterVersion(member_count=1, max_member_id=1, row_version_sum=0)
+    cache.store(version, [OfficeMember(id=1, username="lotte")])
+
+    cache.update_member(version, OfficeMember(id=1, username="lotte", duty_credit=1.0))
+    assert cache.get(version) is None
+    assert [member.duty_credit for member in cache.get(version.bumped()) or []] == [1.0]
+
+    cache.update_member(version, OfficeMember(id=1, username="lotte", duty_credit=2.0))
+    assert [member.duty_credit for member in cache.get(version.bumped()) or []] == [1.0]
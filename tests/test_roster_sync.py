@@ -0,0 +1,156 @@
+import io
+
+import pytest
+from sqlalchemy import select
+
+import database
+import roster_sync
+from roster_sync import RosterRow
+
+
+@pytest.fixture
+def members() -> list[database.MemberTable]:
+    """
+    Three active members, of whom abel doesn't drink coffee, and an inactive one.
+    """
+    return [
+        database.MemberTable(id=1, username="lotte", full_name="Lotte"),
+        database.MemberTable(id=2, username="abel", full_name="Abel", coffee_drinker=False),
+        database.MemberTable(id=3, username="jdoe", full_name="John Doe"),
+        database.MemberTable(id=4, username="former", active=False),
+    ]
+
+
+def synced_members() -> dict[str, tuple[str | None, bool, bool, str, int]]:
+    with database.get_db_session(test_mode=True) as session:
+        rows = session.execute(
+            select(
+                database.MemberTable.username,
+                database.MemberTable.full_name,
+                database.MemberTable.coffee_drinker,
+                database.MemberTable.active,
+                database.MemberTable.office,
+                database.MemberTable.row_version,
+            )
+        )
+        return {
+            username: (full_name, coffee, active, office, version)
+            for username, full_name, coffee, active, office, version in rows
+        }
+
+
+EXPORT = """username,full_name,coffee_drinker,active
+lotte,Lotte,yes,
+abel,Abel,true,
+newbie,New Person,,
+"""
+
+
+@pytest.mark.unit
+def test_sync_inserts_updates_and_deactivates(seeded_db: None) -> None:
+    """
+    Test that new members are inserted, changed ones updated and missing ones deactivated, bumping their row version
+    """
+    result = roster_sync.sync_roster(roster_sync.read_export(io.StringIO(EXPORT)), test_mode=True)
+
+    assert (result.rows, result.inserted, result.updated, result.deactivated) == (3, 1, 1, 1)
+    assert synced_members() == {
+        "lotte": ("Lotte", True, True, "default", 0),
+        "abel": ("Abel", True, True, "default", 1),
+        "jdoe": ("John Doe", True, False, "default", 1),
+        "former": (None, True, False, "default", 0),
+        "newbie": ("New Person", True, True, "default", 0),
+    }
+
+    again = roster_sync.sync_roster(roster_sync.read_export(io.StringIO(EXPORT)), test_mode=True)
+    assert (again.inserted, again.updated, again.deactivated) == (0, 0, 0)
+
+
+@pytest.mark.unit
+def test_sync_from_json_lines(seeded_db: None) -> None:
+    """
+    Test that JSON lines exports are synced, and that missing members can be kept
+    """
+    export = io.StringIO(
+        '{"username": "lotte", "coffee_drinker": false, "office": "amsterdam"}\n'
+        "\n"
+        '{"username": "former", "active": true, "duty_weight": 0.5}\n'
+    )
+
+    result = roster_sync.sync_roster(roster_sync.read_export(export, "jsonl"), test_mode=True, deactivate_missing=False)
+
+    assert (result.rows, result.inserted, result.updated, result.deactivated) == (2, 0, 2, 0)
+    current = synced_members()
+    assert current["lotte"] == ("Lotte", False, True, "amsterdam", 1)
+    assert current["former"][2] is True
+    assert current["jdoe"][2] is True
+
+
+@pytest.mark.unit
+def test_dry_run_changes_nothing(seeded_db: None) -> None:
+    """
+    Test that a dry run reports the changes without applying them
+    """
+    before = synced_members()
+
+    result = roster_sync.sync_roster(roster_sync.read_export(io.StringIO(EXPORT)), test_mode=True, dry_run=True)
+
+    assert (result.inserted, result.updated, result.deactivated) == (1, 1, 1)
+    assert synced_members() == before
+
+
+@pytest.mark.unit
+@pytest.mark.parametrize(
+    ("export", "error"),
+    [
+        ("username,active\nlotte,maybe\n", "Line 2: invalid active 'maybe'"),
+        ("username,duty_weight\nlotte,-1\n", "Line 2: duty_weight must be a positive number"),
+        ("username,duty_weight\nlotte,0\n", "Line 2: duty_weight must be a positive number"),
+        ("username,duty_weight\nlotte,nan\n", "Line 2: duty_weight must be a positive number"),
+        ("username,duty_weight\nlotte,inf\n", "Line 2: duty_weight must be a positive number"),
+        ("name\nlotte\n", "no username column"),
+        ("username\nlotte\nlotte\n", "more than once"),
+        ("username\n", "no members"),
+    ],
+)
+def test_invalid_exports_are_rejected(seeded_db: None, export: str, error: str) -> None:
+    """
+    Test that invalid, duplicate or empty exports are rejected without changing the members
+    """
+    before = synced_members()
+
+    with pytest.raises(ValueError, match=error):
+        roster_sync.sync_roster(roster_sync.read_export(io.StringIO(export)), test_mode=True)
+
+    assert synced_members() == before
+
+
+@pytest.mark.unit
+def test_synced_members_are_picked_up_by_the_roster_cache(seeded_db: None) -> None:
+    """
+    Test that a warm instance reads the roster again after a sync
+    """
+    assert [member.username for member in database.get_office_members(True, test_mode=True)] == ["lotte", "jdoe"]
+
+    roster_sync.sync_roster(roster_sync.read_export(io.StringIO(EXPORT)), test_mode=True)
+
+    assert [member.username for member in database.get_office_members(True, test_mode=True)] == [
+        "lotte",
+        "abel",
+        "newbie",
+    ]
+
+
+@pytest.mark.unit
+def test_copy_stream_renders_nulls_as_empty_fields() -> None:
+    """
+    Test that the rows for COPY are rendered as CSV in chunks, with None as an unquoted empty field
+    """
+    stream = roster_sync._CsvStream(
+        iter([RosterRow("lotte", "Lotte, L.", True), RosterRow("abel", None, None, False, "ams", 0.5)])
+    )
+
+    assert stream.read(64) == 'lotte,"Lotte, L.",True,,,\n'
+    assert stream.read(8192) == "abel,,,False,ams,0.5\n"
+    assert stream.read(8192) == ""
+    assert stream.count == 2
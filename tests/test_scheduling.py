@@ -0,0 +1,121 @@
+import dataclasses
+from collections import Counter
+
+import pytest
+from hypothesis import given
+from hypothesis import strategies as st
+
+from main import select_next_member
+from models import OfficeMember
+from scheduling import SelectionStrategy, charged_credit, select_by_credit
+
+weights = st.lists(st.sampled_from([0.25, 0.5, 1.0, 2.0]), min_size=1, max_size=30)
+
+
+def pick(members: list[OfficeMember]) -> OfficeMember:
+    """
+    Select a member by credit and charge them for the turn, like an assignment with the stride strategy.
+    """
+    selected = select_by_credit(members)
+    assert selected is not None
+    index = members.index(selected)
+    members[index] = dataclasses.replace(selected, duty_credit=charged_credit(selected, members))
+    return members[index]
+
+
+def roster(weights: list[float], credit: float | None = 0.0) -> list[OfficeMember]:
+    return [
+        OfficeMember(id=member_id, username=f"member_{member_id}", duty_weight=weight, duty_credit=credit)
+        for member_id, weight in enumerate(weights)
+    ]
+
+
+@pytest.mark.unit
+@given(weights=weights, picks=st.integers(min_value=0, max_value=300))
+def test_credits_stay_within_one_stride(weights: list[float], picks: int) -> None:
+    """
+    Test that no member's credit runs ahead of the lowest credit by more than the largest stride
+    """
+    members = roster(weights)
+
+    for _ in range(picks):
+        lowest = min(member.duty_credit or 0.0 for member in members)
+        picked = pick(members)
+        assert picked.duty_credit is not None
+        assert picked.duty_credit - 1 / picked.duty_weight == lowest
+
+    credits = [member.duty_credit or 0.0 for member in members]
+    assert max(credits) - min(credits) <= max(1 / weight for weight in weights)
+
+
+@pytest.mark.unit
+@given(size=st.integers(min_value=1, max_value=50), picks=st.integers(min_value=0, max_value=500))
+def test_equal_weights_rotate_evenly(size: int, picks: int) -> None:
+    """
+    Test that with equal weights turn counts never differ by more than one
+    """
+    members = roster([1.0] * size)
+
+    counts = Counter(pick(members).id for _ in range(picks))
+
+    turns = [counts[member_id] for member_id in range(size)]
+    assert max(turns) - min(turns) <= 1
+
+
+@pytest.mark.unit
+@given(size=st.integers(min_value=2, max_value=30), picks_before=st.integers(min_value=0, max_value=200))
+def test_joiner_gets_no_back_credit(size: int, picks_before: int) -> None:
+    """
+    Test that a member who joins late gets their fair share of turns, instead of catching up on missed turns
+    """
+    members = roster([1.0] * size)
+    for _ in range(picks_before):
+        pick(members)
+
+    members.append(OfficeMember(id=size, username="joiner"))
+    counts = Counter(pick(members).id for _ in range(5 * (size + 1)))
+
+    assert 4 <= counts[size] <= 6
+
+
+@pytest.mark.unit
+def test_weights_set_share_of_turns() -> None:
+    """
+    Test that a part-timer with weight 0.5 gets half the turns of full-timers
+    """
+    members = roster([1.0, 1.0, 0.5])
+
+    counts = Counter(pick(members).id for _ in range(100))
+
+    assert counts == {0: 40, 1: 40, 2: 20}
+
+
+@pytest.mark.unit
+def test_stride_selection_uses_credit_across_cycles() -> None:
+    """
+    Test that the stride strategy picks the member with the least credit, also if they had a turn this cycle
+    """
+    members = [
+        OfficeMember(id=1, username="lotte", duty_credit=3.0),
+        OfficeMember(id=2, username="abel", duty_credit=5.0),
+        OfficeMember(id=3, username="ellie", duty_credit=4.0),
+    ]
+
+    selected = select_next_member(members, {1}, strategy=SelectionStrategy.STRIDE)
+
+    assert selected is not None and selected.id == 1
+
+
+@pytest.mark.unit
+def test_charged_credit_for_new_member() -> None:
+    """
+    Test that a member without credit starts at the lowest credit of the others
+    """
+    members = [
+        OfficeMember(id=1, username="lotte", duty_credit=3.0),
+        OfficeMember(id=2, username="abel", duty_credit=5.0),
+        OfficeMember(id=3, username="new", duty_weight=0.5),
+    ]
+
+    assert charged_credit(members[2], members) == 5.0
+    assert charged_credit(members[0], members) == 4.0
@@ -0,0 +1,98 @@
+import random
+
+import numpy as np
+import numpy.typing as npt
+import pytest
+
+from benchmarks.simulation import DUTY_TYPES, Roster, SimulationConfig, duty_events, simulate, simulate_run
+
+
+def fixed_roster(runs: int, coffee_drinker: list[bool]) -> Roster:
+    shape = (runs, len(coffee_drinker))
+    return Roster(
+        join_day=np.zeros(shape, dtype=np.int64),
+        leave_day=np.full(shape, 10_000, dtype=np.int64),
+        coffee_drinker=np.tile(np.array(coffee_drinker), (runs, 1)),
+    )
+
+
+@pytest.mark.unit
+def test_rotation_without_churn_is_even() -> None:
+    """
+    Test that without churn every eligible member's count differs by at most one
+    """
+    config = SimulationConfig(runs=200, years=3, seed=7)
+    roster = fixed_roster(config.runs, [True, True, True, False, True])
+
+    result = simulate(config, roster)
+
+    coffee, fridge = result.counts[..., 0], result.counts[..., 1]
+    assert (coffee[:, 3] == 0).all()
+    drinkers = coffee[:, [0, 1, 2, 4]]
+    assert (drinkers.max(axis=1) - drinkers.min(axis=1) <= 1).all()
+    assert (fridge.max(axis=1) - fridge.min(axis=1) <= 1).all()
+
+    events = duty_events(config.start_date, config.years)
+    for index, duty_type in enumerate(DUTY_TYPES):
+        assert (result.counts[..., index].sum(axis=1) == sum(event[1] == duty_type for event in events)).all()
+
+
+def replay(config: SimulationConfig, roster: Roster) -> npt.NDArray[np.int64]:
+    """
+    The counts of every run replayed with select_next_member, seeded like the vectorised simulation.
+    """
+    random.seed(config.seed)
+    return np.stack([simulate_run(config, roster, run) for run in range(config.runs)])
+
+
+@pytest.mark.unit
+def test_vectorised_simulation_matches_select_next_member() -> None:
+    """
+    Test that without churn the batched simulation and a replay with select_next_member give every member the same
+    turns, up to the last unfinished cycle
+    """
+    config = SimulationConfig(runs=50, years=3, seed=3)
+    roster = fixed_roster(config.runs, [True, False, True, True, False, True, True])
+
+    counts = simulate(config, roster).counts
+    reference = replay(config, roster)
+
+    assert (np.abs(reference - counts) <= 1).all()
+    assert (np.sort(reference, axis=1) == np.sort(counts, axis=1)).all()
+
+
+@pytest.mark.unit
+def test_vectorised_simulation_matches_select_next_member_with_churn() -> None:
+    """
+    Test that with churn the batched simulation and a replay with select_next_member assign the same number of turns
+    per run, and the turns per member have the same distribution
+    """
+    config = SimulationConfig(runs=100, years=4, members=6, seed=3)
+    result = simulate(config)
+    reference = replay(config, result.roster)
+
+    assert (reference.sum(axis=1) == result.counts.sum(axis=1)).all()
+    # Members that joined or left get a different share of the cycles they were part of, but only by a turn or so
+    assert (np.abs(reference - result.counts) <= 1).mean() >= 0.95
+
+    members = result.active_years() >= 1
+    for index in range(len(DUTY_TYPES)):
+        expected, actual = reference[..., index][members], result.counts[..., index][members]
+        assert actual.mean() == pytest.approx(expected.mean(), rel=0.02)
+        assert actual.std() == pytest.approx(expected.std(), rel=0.05)
+        assert np.percentile(actual, [5, 50, 95]) == pytest.approx(np.percentile(expected, [5, 50, 95]), abs=1)
+
+
+@pytest.mark.unit
+def test_summary_with_churn() -> None:
+    """
+    Test that the summary reports sensible per-year rates with members joining and leaving
+    """
+    result = simulate(SimulationConfig(runs=500, years=5, seed=11))
+    summary = result.summary()
+
+    assert set(summary) == {"coffee", "fridge"}
+    assert summary["fridge"]["members"] > 0
+    assert 0 < summary["fridge"]["per_year_p5"] <= summary["fridge"]["per_year_mean"]
+    assert summary["fridge"]["per_year_mean"] <= summary["fridge"]["per_year_p95"]
+    assert summary["coffee"]["mean_gap_days"] > 0
@@ -0,0 +1,100 @@
+import json
+from pathlib import Path
+
+import pytest
+from functions_framework import create_app
+from pytest_mock import MockerFixture
+
+import database
+from timing import span, trace
+
+
+@pytest.fixture
+def members() -> list[database.MemberTable]:
+    return [database.MemberTable(id=1, username="lotte")]
+
+
+@pytest.fixture
+def seeded_db(seeded_db: None, mocker: MockerFixture) -> None:
+    mocker.patch("outbox.start_background_delivery")
+
+
+def timing_records(output: str) -> list[dict[str, object]]:
+    return [json.loads(line) for line in output.splitlines() if line.startswith("{")]
+
+
+@pytest.mark.unit
+def test_spans_are_noops_without_trace(capsys: pytest.CaptureFixture[str]) -> None:
+    """
+    Test that spans outside of a trace share a single no-op object and log nothing
+    """
+    with trace("disabled", enabled=False) as current:
+        assert current is None
+        assert span("first") is span("second")
+        with span("first"):
+            pass
+
+    assert timing_records(capsys.readouterr().out) == []
+
+
+@pytest.mark.unit
+def test_trace_logs_spans_as_json(capsys: pytest.CaptureFixture[str]) -> None:
+    """
+    Test that a trace logs one structured record with every span, and sums repeated spans in its summary
+    """
+    with trace("handler", enabled=True) as current:
+        with span("database.roster_query"):
+            pass
+        for _ in range(2):
+            with span("mattermost.post"):
+                pass
+
+    [record] = timing_records(capsys.readouterr().out)
+    assert record["severity"] == "INFO"
+    assert record["trace_name"] == "handler"
+    assert [entry["name"] for entry in record["spans"]] == [  # type: ignore[attr-defined]
+        "database.roster_query",
+        "mattermost.post",
+        "mattermost.post",
+    ]
+
+    assert current is not None
+    assert set(current.as_dict()["spans"]) == {"database.roster_query", "mattermost.post"}
+
+
+@pytest.mark.unit
+def test_assignment_returns_timings_when_requested(seeded_db: None, mocker: MockerFixture) -> None:
+    """
+    Test that the timings of the assignment phases are only part of the response if the request asks for them
+    """
+    mocker.patch("timing.TIMINGS_ENABLED", False)
+    # Two periods, so the second request assigns again instead of returning the first assignment
+    mocker.patch("duty_calendar.DutyCalendar.period_key", side_effect=["2024-W01", "2024-W03"])
+    client = create_app(target="assign_coffee_duty", source=str(Path(__file__).parent.parent / "main.py")).test_client()
+
+    without_timings = client.post("/", json={"test_mode": True})
+    with_timings = client.post("/", json={"test_mode": True, "timings": True})
+
+    assert without_timings.status_code == 200
+    assert "timings" not in without_timings.json  # type: ignore[operator]
+
+    assert with_timings.status_code == 200
+    timings = with_timings.json["timings"]  # type: ignore[index]
+    assert {"database.lock", "database.cycle_query", "database.insert", "database.commit"} <= set(timings["spans"])
+    # The phases run one after the other, so together they can't take longer than the request (up to rounding)
+    assert sum(timings["spans"].values()) <= timings["total_ms"] + 0.1
+
+
+@pytest.mark.unit
+def test_traced_keeps_non_json_responses() -> None:
+    """
+    Test that health check responses are returned unchanged when timings are requested
+    """
+    client = create_app(
+        target="drain_notifications", source=str(Path(__file__).parent.parent / "main.py")
+    ).test_client()
+
+    response = client.get("/?timings=1")
+
+    assert response.status_code == 200
+    assert response.text == "Notification drainer is alive! Use POST to trigger."
@@ -0,0 +1,157 @@
+import functools
+import json
+import os
+import time
+from collections.abc import Callable, Iterator
+from contextlib import contextmanager
+from contextvars import ContextVar
+from types import TracebackType
+from typing import TYPE_CHECKING, Any
+
+if TYPE_CHECKING:
+    from flask import Request
+
+# Timings of every request are logged when enabled, a request can also ask for them with {"timings": true}
+TIMINGS_ENABLED = os.environ.get("TIMINGS_ENABLED", "false").lower() in ("1", "true", "yes")
+
+
+class Trace:
+    """
+    Spans recorded while handling a single request, in the order in which they ended.
+    """
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self.start = time.perf_counter()
+        self.end: float | None = None
+        self.spans: list[tuple[str, float, float]] = []
+
+    def record(self, name: str, start: float, end: float) -> None:
+        self.spans.append((name, start, end))
+
+    @property
+    def total_ms(self) -> float:
+        end = self.end if self.end is not None else time.perf_counter()
+        return (end - self.start) * 1000
+
+    def as_dict(self) -> dict[str, Any]:
+        """
+        Total duration and the duration per span name in milliseconds, as included in the response.
+        Spans with the same name (e.g. a webhook per message) are summed.
+        """
+        spans: dict[str, float] = {}
+        for name, start, end in self.spans:
+            spans[name] = spans.get(name, 0.0) + (end - start) * 1000
+        return {"total_ms": round(self.total_ms, 2), "spans": {name: round(ms, 2) for name, ms in spans.items()}}
+
+    def log_record(self) -> dict[str, Any]:
+        """
+        Structured log entry with every span and its offset from the start of the trace.
+        """
+        return {
+            "severity": "INFO",
+            "message": f"{self.name} took {self.total_ms:.1f} ms",
+            "trace_name": self.name,
+            "total_ms": round(self.total_ms, 2),
+            "spans": [
+                {
+                    "name": name,
+                    "start_ms": round((start - self.start) * 1000, 2),
+                    "duration_ms": round((end - start) * 1000, 2),
+                }
+                for name, start, end in self.spans
+            ],
+        }
+
+
+_current_trace: ContextVar[Trace | None] = ContextVar("current_trace", default=None)
+
+
+class _Span:
+    __slots__ = ("_trace", "_name", "_start")
+
+    def __init__(self, trace: Trace, name: str) -> None:
+        self._trace = trace
+        self._name = name
+        self._start = 0.0
+
+    def __enter__(self) -> None:
+        self._start = time.perf_counter()
+
+    def __exit__(
+        self, exc_type: type[BaseException] | None, exc: BaseException | None, traceback: TracebackType | None
+    ) -> None:
+        self._trace.record(self._name, self._start, time.perf_counter())
+
+
+class _NoopSpan:
+    __slots__ = ()
+
+    def __enter__(self) -> None:
+        return None
+
+    def __exit__(
+        self, exc_type: type[BaseException] | None, exc: BaseException | None, traceback: TracebackType | None
+    ) -> None:
+        return None
+
+
+_NOOP_SPAN = _NoopSpan()
+
+
+def span(name: str) -> _Span | _NoopSpan:
+    """
+    Time a block of code as part of the current trace: `with span("database.roster_query"): ...`
+    Outside of a trace (timings disabled, or a background thread) this returns a shared no-op span.
+    """
+    trace = _current_trace.get()
+    if trace is None:
+        return _NOOP_SPAN
+    return _Span(trace, name)
+
+
+@contextmanager
+def trace(name: str, enabled: bool | None = None) -> Iterator[Trace | None]:
+    """
+    Collect the spans of the enclosed code and log them as a single JSON record at the end.
+    Yields None without collecting anything if timings are disabled.
+    """
+    if not (TIMINGS_ENABLED if enabled is None else enabled):
+        yield None
+        return
+
+    current = Trace(name)
+    token = _current_trace.set(current)
+    try:
+        yield current
+    finally:
+        _current_trace.reset(token)
+        current.end = time.perf_counter()
+        # Cloud Logging parses every JSON line written to stdout into a structured entry
+        print(json.dumps(current.log_record()), flush=True)
+
+
+def _timings_requested(request: "Request") -> bool:
+    if request.args.get("timings", "").lower() in ("1", "true", "yes"):
+        return True
+    request_json = request.get_json(silent=True)
+    return isinstance(request_json, dict) and request_json.get("timings") is True
+
+
+def traced(handler: Callable[["Request"], Any]) -> Callable[["Request"], Any]:
+    """
+    Trace an HTTP handler. If the request asked for timings, they are added to a JSON response as `timings`.
+    """
+
+    @functools.wraps(handler)
+    def wrapper(request: "Request") -> Any:
+        include_timings = _timings_requested(request)
+
+        with trace(handler.__name__, enabled=TIMINGS_ENABLED or include_timings) as current:
+            response = handler(request)
+
+        if include_timings and current is not None and isinstance(response, tuple) and isinstance(response[0], dict):
+            response[0]["timings"] = current.as_dict()
+        return response
+
+    return wrapper